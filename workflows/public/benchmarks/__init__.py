@@ -0,0 +1,9 @@
+'''
+Benchmarks for the serialization and fetch paths of the public workflows.
+Run from workflows/public, eg python -m benchmarks.fix_col_types
+python -m benchmarks.throughput runs every fetch/parse/serialize path offline, against replayed source
+responses (benchmarks.fixtures) and an in memory bucket (benchmarks.fake_s3).
+python -m benchmarks.translation times the translation executor against a local OpenAI compatible
+stub (benchmarks.openai_stub).
+The parity checks against the replaced implementations are asserted by the tests in sheild_tests.
+'''
@@ -0,0 +1,77 @@
+'''
+In memory stand in for the bucket, so the serialize and upload paths can be timed without MinIO.
+fake_s3_resource() is a real S3Resource (digests, skip unchanged, upload stats, multipart part size) whose
+Minio client keeps the objects in a dict. latency adds a fixed delay to every request, to model the round trip
+to the bucket.
+'''
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+
+from public.resources.minio import S3Resource
+
+
+class MemoryObject:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self, *args):
+        return self._data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class MemoryMinio:
+    ''' the part of the Minio client S3Resource uses '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.objects = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def put_object(self, bucket_name, object_name, data, length, content_type="application/octet-stream",
+                   metadata=None, part_size=0, **kwargs):
+        self._request()
+        body = data.read() if length < 0 else data.read(length)
+        etag = hashlib.md5(body).hexdigest()
+        stored = {f'x-amz-meta-{k}': v for k, v in (metadata or {}).items()}
+        with self._lock:
+            self.objects[(bucket_name, object_name)] = (body, etag, stored, content_type)
+        return SimpleNamespace(object_name=object_name, bucket_name=bucket_name, etag=etag, version_id=None)
+
+    def get_object(self, bucket_name, object_name, **kwargs):
+        self._request()
+        return MemoryObject(self.objects[(bucket_name, object_name)][0])
+
+    def stat_object(self, bucket_name, object_name, **kwargs):
+        self._request()
+        body, etag, metadata, content_type = self.objects[(bucket_name, object_name)]
+        return SimpleNamespace(object_name=object_name, etag=etag, metadata=metadata, size=len(body),
+                               content_type=content_type)
+
+    def list_objects(self, bucket_name, prefix=None, recursive=True, **kwargs):
+        self._request()
+        return [SimpleNamespace(object_name=name) for bucket, name in self.objects
+                if bucket == bucket_name and (prefix is None or name.startswith(prefix))]
+
+    def bytes_stored(self):
+        return sum(len(body) for body, _, _, _ in self.objects.values())
+
+
+def fake_s3_resource(latency=0.0, skip_unchanged=True) -> S3Resource:
+    resource = S3Resource(S3_BUCKET='benchmark', S3_ADDRESS='localhost', S3_PORT='9000',
+                          S3_ACCESS_KEY='benchmark', S3_SECRET_KEY='benchmark', S3_SKIP_UNCHANGED=skip_unchanged)
+    resource._client = MemoryMinio(latency=latency)
+    return resource
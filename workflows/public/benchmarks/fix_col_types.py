@@ -0,0 +1,86 @@
+'''
+fix_col_types: vectorized datetime formatting against the per element apply it replaced.
+Checks the output is identical for naive, tz aware (across DST changes) and utc columns, with microseconds,
+nanoseconds, NaT and a date_format, then times both.
+
+python -m benchmarks.fix_col_types [rows]
+'''
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from public.utils.store_assets import fix_col_types
+
+
+def fix_col_types_apply(df, date_format=None):
+    ''' the previous implementation, on a copy '''
+    df = df.copy()
+    columns = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+    for col in columns:
+        df[col] = df[col].apply(lambda x: x.strftime(date_format) if pd.notnull(x) and date_format else x.isoformat() if pd.notnull(x) else None)
+    return df
+
+
+def sample_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2024-01-01')
+    seconds = rng.integers(0, 2 * 365 * 24 * 3600, rows)
+    naive = start + pd.to_timedelta(seconds, unit='s')
+    micro = naive + pd.to_timedelta(rng.integers(0, 1_000_000, rows) * (rng.random(rows) < 0.3), unit='us')
+    df = pd.DataFrame({
+        'naive': naive,
+        'micro': micro,
+        'pacific': naive.tz_localize('America/Los_Angeles', ambiguous='NaT', nonexistent='NaT'),
+        'utc': micro.tz_localize('UTC'),
+        'date_received': pd.to_datetime(seconds * 1000 + 1_700_000_000_000, unit='ms'),
+        'value': rng.random(rows),
+        'name': rng.choice(['Odor', 'Smoke', 'Dust'], rows),
+    })
+    missing = rng.random(rows) < 0.05
+    df.loc[missing, 'naive'] = pd.NaT
+    df.loc[missing, 'utc'] = pd.NaT
+    return df
+
+
+def check_parity(rows=20000):
+    cases = {
+        'iso': (sample_frame(rows), None),
+        'date_format': (sample_frame(rows, seed=1), '%Y-%m-%dT%H:%M:%SZ'),
+        'nanoseconds': (pd.DataFrame({'t': pd.to_datetime(['2024-03-10 01:59:59.000000001', None, '2024-11-03 01:30:00.000000000'], format='ISO8601')
+                                           .tz_localize('America/Los_Angeles', ambiguous=[True, True, False])}), None),
+        'all_missing': (pd.DataFrame({'t': pd.Series([pd.NaT, pd.NaT], dtype='datetime64[ns, UTC]')}), None),
+    }
+    for name, (df, date_format) in cases.items():
+        before = df.copy()
+        expected = fix_col_types_apply(df, date_format)
+        result = fix_col_types(df, date_format)
+        pd.testing.assert_frame_equal(result, expected)
+        pd.testing.assert_frame_equal(df, before)  # the caller's frame is not changed
+        print(f'parity {name}: ok')
+
+
+def timeit(function, df, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(df)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(rows=200000):
+    check_parity()
+    df = sample_frame(rows)
+    datetime_cells = rows * 5
+    apply_time = timeit(fix_col_types_apply, df)
+    vector_time = timeit(fix_col_types, df)
+    print(f'{rows} rows, {datetime_cells} datetime values')
+    print(f'apply      {apply_time:8.3f}s {datetime_cells / apply_time:12.0f} values/s')
+    print(f'vectorized {vector_time:8.3f}s {datetime_cells / vector_time:12.0f} values/s  {apply_time / vector_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,201 @@
+'''
+Source responses for the offline benchmarks.
+Each source has a builder that writes a response in the format the source publishes, scaled to a number of rows:
+APCD wide hourly CSV, BeachWatch tab separated export, sdbeachinfo json, IBWC spills html table,
+CDC SODA geojson and csv pages and the ArcGIS complaints geojson.
+A response recorded from the live source is replayed instead of the generated one, record them (needs network) with
+
+python -m benchmarks.fixtures record [name ...]
+
+Recorded responses are kept in BENCHMARK_FIXTURES (default benchmarks/fixtures), they are not committed.
+'''
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import requests
+
+FIXTURES_DIR = os.environ.get('BENCHMARK_FIXTURES', os.path.join(os.path.dirname(__file__), 'fixtures'))
+
+# live requests for recording: name -> (method, url, request arguments, file name)
+SOURCES = {
+    'apcd_csv': ('GET', 'http://jtimmer.digitalspacemail17.net/data/current.CSV', {}, 'apcd.csv'),
+    'beachwatch_tsv': ('BEACHWATCH', 'https://beachwatch.waterboards.ca.gov/public/', {}, 'beachwatch.tsv'),
+    'sdbeachinfo_json': ('POST', 'https://www.sdbeachinfo.com/Home/GetTargetByID', {}, 'sdbeachinfo.json'),
+    'ibwc_html': ('GET', 'https://www.waterboards.ca.gov/sandiego/water_issues/programs/tijuana_river_valley_strategy/sewage_issue.html',
+                  {}, 'ibwc_spills.html'),
+    'soda_geojson': ('GET', 'https://data.cdc.gov/resource/x9gk-5huc.geojson',
+                     {'params': {'$select': '*', 'label': 'Mpox', '$limit': 1000}}, 'soda_page.geojson'),
+    'soda_csv': ('GET', 'https://data.cdc.gov/resource/x9gk-5huc.csv',
+                 {'params': {'label': 'Mpox', '$order': ':id', '$limit': 50000}}, 'soda_page.csv'),
+    'arcgis_geojson': ('GET', 'https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/query',
+                       {'params': {'where': '1=1', 'outFields': '*', 'outSR': 4326, 'f': 'geojson'}}, 'arcgis_complaints.geojson'),
+}
+
+APCD_PARAMETERS = ['07 H2S PPB', '28 SO2 Tr PPB', '11 PM2.5 �g/M3', 'PM10 STD', '01 OZONE PPM']
+
+
+def recorded(name):
+    ''' the recorded response for name, None when it has not been recorded '''
+    path = os.path.join(FIXTURES_DIR, SOURCES[name][3])
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    return None
+
+
+def load(name, rows, seed=0) -> bytes:
+    ''' the recorded response, or one generated with rows rows '''
+    data = recorded(name)
+    if data is not None:
+        return data
+    return BUILDERS[name](rows, seed).encode('utf-8')
+
+
+def apcd_csv(rows, seed=0, day=datetime(2024, 7, 4)):
+    ''' rows is the number of site rows, each with 24 hourly readings '''
+    rng = np.random.default_rng(seed)
+    lines = ['San Diego Air Pollution Control District', 'Hourly Data',
+             f"Hourly Averages (PST),{day.strftime('%m/%d/%Y')}",
+             ',,' + ','.join(str(h) for h in range(24)),
+             '']
+    sites_per_parameter = max(1, rows // len(APCD_PARAMETERS))
+    for parameter in APCD_PARAMETERS:
+        lines.append('Parameter,Site,' + ','.join(str(h) for h in range(24)))
+        for s in range(sites_per_parameter):
+            values = rng.lognormal(1.5, 1.2, 24).round(1).astype(str).astype(object)
+            values[rng.random(24) < 0.05] = ''
+            values[rng.random(24) < 0.02] = 'C'
+            values[rng.random(24) < 0.02] = '<0.5'
+            lines.append(f"{parameter if s == 0 else ''},Site {s},{','.join(values)}")
+    return '\n'.join(lines) + '\n'
+
+
+def beachwatch_tsv(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    header = ['id', 'Station_ID', 'StationName', 'SampleDate', 'SampleTime', 'Parameter', 'Result', 'Unit',
+              'Method', 'Qualifier', 'Latitude', 'Longitude']
+    lines = ['\t'.join(header)]
+    stations = rng.integers(0, 120, rows)
+    days = rng.integers(0, 365, rows)
+    seconds = rng.integers(6 * 3600, 14 * 3600, rows)
+    results = rng.lognormal(3, 2, rows).round(0)
+    methods = rng.choice(['ddPCR', 'MF', 'MTF', 'Enterolert'], rows)
+    parameters = rng.choice(['Enterococcus', 'Coliform, Fecal', 'Coliform, Total'], rows)
+    for i in range(rows):
+        date = start + timedelta(days=int(days[i]))
+        time = str(timedelta(seconds=int(seconds[i]))).zfill(8)
+        lines.append('\t'.join([str(i), f'EH-{stations[i]:03d}', f'Station {stations[i]}', date.strftime('%Y-%m-%d'), time,
+                                parameters[i], str(results[i]), 'MPN/100 mL', methods[i], '=' if results[i] > 10 else '<',
+                                f'{32.5 + stations[i] / 400:.5f}', f'{-117.3 + stations[i] / 800:.5f}']))
+    return '\n'.join(lines) + '\n'
+
+
+def sdbeachinfo_json(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    legend = '<a href="http://www.sandiegocounty.gov/content/dam/sdc/deh/lwqd/Beach&amp;Bay/bb_maplegend.pdf">Map Legend</a>'
+    colors = {1: 'Red.png', 2: 'Green.png', 3: 'Yellow.png', 4: 'Outfall.png'}
+    sites = []
+    for i in range(rows):
+        indicator = int(rng.choice([1, 2, 3, 4], p=[0.2, 0.5, 0.2, 0.1]))
+        message = (f'<strong>Status Since: </strong>&nbsp;June {1 + i % 28}, 2024<br/>'
+                   f'<strong>Sewage contaminated runoff from the Tijuana River</strong> {legend}')
+        sites.append({'SiteID': i, 'DehID': f'EH-{i:03d}', 'Name': f'Beach {i}',
+                      'Latitude': 32.5 + i / 4000, 'Longitude': -117.3 + i / 8000,
+                      'IndicatorID': indicator, 'TypeID': 2 if indicator == 4 else 1, 'Active': True,
+                      'RBGColor': colors[indicator], 'Description': f'<p>Beach {i}</p>{legend}',
+                      'Closure': message if indicator == 1 else '', 'Advisory': message if indicator == 3 else ''})
+    return json.dumps(sites)
+
+
+def ibwc_html(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    locations = ["Stewart's Drain", 'Canyon del Sol', 'Goat Canyon Pump Station', 'Silva Drain', 'Tijuana River']
+    cells = ['<tr><td>Total</td><td></td><td></td><td>1.2 billion gallons</td></tr>']
+    start = datetime(2024, 1, 1)
+    for i in range(rows):
+        begin = start + timedelta(hours=int(rng.integers(0, 365 * 24)))
+        end = 'Ongoing' if rng.random() < 0.1 else (begin + timedelta(hours=int(rng.integers(1, 72)))).strftime('%m/%d/%Y %H:%M')
+        volume = rng.choice(['TBD', f'{rng.integers(1, 900):,} gallons', f'{rng.random() * 10:.1f} million gallons'])
+        cells.append(f"<tr><td>{rng.choice(locations)}</td><td>{begin.strftime('%m/%d/%Y %H:%M')}</td>"
+                     f"<td>{end}</td><td>{volume}</td></tr>")
+    return ('<html><body><table><thead><tr><th>Discharge Location</th><th>Start Date</th><th>End Date</th>'
+            '<th>Approximate Discharge Volume</th></tr></thead><tbody>' + ''.join(cells) + '</tbody></table></body></html>')
+
+
+def soda_geojson(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    features = []
+    for i in range(rows):
+        state = f'State {i % 50}'
+        located = i % 50 < 45
+        properties = {'states': state, 'year': str(2023 + i // 2600), 'week': str(1 + (i // 50) % 52), 'label': 'Mpox',
+                      'location1': state, 'location2': None, 'sort_order': str(i), 'geocode': None}
+        for m in range(1, 5):
+            properties[f'm{m}'] = None if rng.random() < 0.3 else str(int(rng.integers(0, 40)))
+            properties[f'm{m}_flag'] = '-' if properties[f'm{m}'] is None else None
+        geometry = {'type': 'Point', 'coordinates': [-120 + i % 50, 35 + (i % 50) / 5]} if located else None
+        features.append({'type': 'Feature', 'geometry': geometry, 'properties': properties})
+    return json.dumps({'type': 'FeatureCollection', 'features': features})
+
+
+def soda_csv(rows, seed=0):
+    ''' the rows of soda_geojson as the csv endpoint writes them, geocode is WKT '''
+    frame = pd.DataFrame([{**f['properties'], 'geocode': 'POINT ({} {})'.format(*f['geometry']['coordinates'])
+                           if f['geometry'] else None}
+                          for f in json.loads(soda_geojson(rows, seed))['features']])
+    return frame.to_csv(index=False)
+
+
+def arcgis_geojson(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start_ms = int(datetime(2023, 1, 1).timestamp() * 1000)
+    features = []
+    for i in range(rows):
+        x, y = -117.2 + rng.random() * 0.3, 32.55 + rng.random() * 0.4
+        features.append({'type': 'Feature', 'id': i + 1, 'geometry': {'type': 'Point', 'coordinates': [x, y]},
+                         'properties': {'objectid': i + 1, 'record_number': f'C{i:07d}',
+                                        'date_received': start_ms + int(rng.integers(0, 600 * 86400)) * 1000,
+                                        'nature_of_complaint': str(rng.choice(['Odor', 'Dust', 'Smoke', 'Other'])),
+                                        'x_coordinate': x, 'y_coordinate': y}})
+    return json.dumps({'type': 'FeatureCollection', 'features': features})
+
+
+BUILDERS = {
+    'apcd_csv': apcd_csv,
+    'beachwatch_tsv': beachwatch_tsv,
+    'sdbeachinfo_json': sdbeachinfo_json,
+    'ibwc_html': ibwc_html,
+    'soda_geojson': soda_geojson,
+    'soda_csv': soda_csv,
+    'arcgis_geojson': arcgis_geojson,
+}
+
+
+def record(names=None):
+    ''' fetches the live responses into FIXTURES_DIR '''
+    from public.assets import beach_monitoring
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name in names or SOURCES:
+        method, url, kwargs, filename = SOURCES[name]
+        if method == 'BEACHWATCH':
+            # the export needs the cookie of the search
+            response = requests.post(beach_monitoring.reports_page, data=beach_monitoring.formdata, timeout=120)
+            response = requests.get(beach_monitoring.exports_page, cookies=response.cookies, timeout=120)
+        else:
+            response = requests.request(method, url, timeout=120, **kwargs)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, filename), 'wb') as f:
+            f.write(response.content)
+        print(f'recorded {name} {len(response.content)} bytes')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'record':
+        record(sys.argv[2:])
+    else:
+        print(__doc__)
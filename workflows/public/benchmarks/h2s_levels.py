@@ -0,0 +1,77 @@
+'''
+classify_levels: vectorized H2S guidance labels against the per reading apply of h2s_guidance it replaced.
+Checks the labels are identical for numbers, numeric strings, blanks, NaN, negative readings and the level
+boundaries, then times both over a column the size of the all_sd_airquality history.
+
+python -m benchmarks.h2s_levels [rows]
+'''
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from public.utils.thresholds import classify_levels, H2S_LEVELS
+
+
+def h2s_guidance_loop(result):
+    ''' the previous implementation '''
+    levels = [{'min': 0, 'max': 5, 'level': "green"},
+              {'min': 5, 'max': 30, 'level': "yellow"},
+              {'min': 30, 'max': 27000, 'level': "orange"},
+              {'min': 27000, 'max': None, 'level': "purple"}]
+    if pd.isna(result) or result == '':
+        return 'white'
+    else:
+        result = float(result)
+    for level in levels:
+        if level['max'] is None:
+            if result >= level['min']:
+                return level['level']
+        elif result >= level['min'] and result < level['max']:
+            return level['level']
+
+
+def sample_readings(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    readings = rng.lognormal(1.5, 2.0, rows).round(1)
+    readings[rng.random(rows) < 0.05] = np.nan
+    return pd.Series(readings, name='Result')
+
+
+def check_parity():
+    edges = [0, 4.99, 5, 29.9, 30, 26999, 27000, 1e6, -1, None, np.nan, '', '12', '0']
+    cases = {
+        'edges': pd.Series(edges, dtype=object, index=range(100, 100 + len(edges))),
+        'floats': sample_readings(20000),
+        'empty': pd.Series([], dtype=float),
+    }
+    for name, readings in cases.items():
+        expected = readings.apply(lambda r: h2s_guidance_loop(r)).astype(object)
+        result = classify_levels(readings, H2S_LEVELS)
+        pd.testing.assert_series_equal(result, expected, check_dtype=False)
+        print(f'parity {name}: ok')
+
+
+def timeit(function, readings, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(readings)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(rows=1000000):
+    check_parity()
+    readings = sample_readings(rows)
+    apply_time = timeit(lambda r: r.apply(lambda v: h2s_guidance_loop(v)), readings)
+    vector_time = timeit(lambda r: classify_levels(r, H2S_LEVELS), readings)
+    print(f'{rows} readings')
+    print(f'apply      {apply_time:8.3f}s {rows / apply_time:12.0f} readings/s')
+    print(f'vectorized {vector_time:8.3f}s {rows / vector_time:12.0f} readings/s  {apply_time / vector_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,107 @@
+'''
+Local OpenAI compatible chat completions server, to exercise the translation executor without a model.
+Every request waits latency seconds, a share of them (rate_limited) answer 429 with a Retry-After header.
+The translation of a text is 'es: ' + the text. A request with response_format json_object translates the
+JSON array at the end of the prompt and answers {"translations": [...]}.
+
+    with serve(latency=0.2) as stub:
+        client = openai.OpenAI(base_url=stub.base_url, api_key='stub')
+        ...
+        stub.requests, stub.max_in_flight
+
+python -m benchmarks.openai_stub [port] [latency] serves until interrupted, eg for OPENAI_BASE_URL=http://localhost:8011/v1
+'''
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'es: '
+
+
+def completion(model, content):
+    return {'id': f'chatcmpl-stub-{random.getrandbits(32):08x}', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}}
+
+
+def answer(request):
+    prompt = request['messages'][-1]['content']
+    if (request.get('response_format') or {}).get('type') == 'json_object':
+        texts = json.loads(prompt[prompt.rfind('\n[') + 1:])
+        return json.dumps({'translations': [PREFIX + text for text in texts]}, ensure_ascii=False)
+    return PREFIX + prompt
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, rate_limited=0.0):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency)
+            if not self.path.endswith('/chat/completions'):
+                self.reply(404, {'error': {'message': f'no route {self.path}'}})
+            elif random.random() < server.rate_limited:
+                self.reply(429, {'error': {'message': 'rate limited', 'type': 'rate_limit_exceeded'}},
+                           {'Retry-After': '0.1'})
+            else:
+                self.reply(200, completion(request.get('model'), answer(request)))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+@contextmanager
+def serve(latency=0.0, rate_limited=0.0, port=0):
+    ''' runs the stub on a thread, yields the server, its base_url is the OpenAI base url '''
+    server = StubServer(('127.0.0.1', port), latency, rate_limited)
+    server.base_url = f'http://127.0.0.1:{server.server_address[1]}/v1'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8011
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    server = StubServer(('127.0.0.1', port), latency)
+    print(f'OpenAI stub on http://127.0.0.1:{port}/v1, latency {latency}s')
+    server.serve_forever()
@@ -0,0 +1,33 @@
+'''
+Replays responses for requests made with the requests library (requests.get/post, sessions, http_fetch),
+so the fetch paths run against fixtures with no network.
+
+    with replay(lambda request: (200, body)):
+        process_csv_files(urls)
+'''
+from contextlib import contextmanager
+from unittest import mock
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+def response(request, status, body, content_type='text/plain; charset=utf-8'):
+    r = requests.Response()
+    r.status_code = status
+    r._content = body if isinstance(body, bytes) else body.encode('utf-8')
+    r.headers = CaseInsensitiveDict({'Content-Type': content_type, 'Content-Length': str(len(r._content))})
+    r.encoding = 'utf-8'
+    r.url = request.url
+    r.request = request
+    return r
+
+
+@contextmanager
+def replay(handler):
+    ''' handler(prepared request) returns (status, body) or (status, body, content type) '''
+    def send(adapter, request, **kwargs):
+        return response(request, *handler(request))
+    with mock.patch.object(HTTPAdapter, 'send', send):
+        yield
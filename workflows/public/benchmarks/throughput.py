@@ -0,0 +1,220 @@
+'''
+Throughput of the fetch, parse, clean and serialize paths, offline.
+Fetches are replayed from benchmarks.fixtures (recorded responses when they exist, generated ones otherwise)
+and the bucket is the in memory benchmarks.fake_s3, so the numbers only measure this code.
+For each case prints the rows, input size, best time of repeat runs, rows/s and MB/s, and the stage
+breakdown recorded by public.utils.instrumentation.
+
+python -m benchmarks.throughput [scale] [case ...]
+'''
+import json
+import sys
+import time
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs, urlparse
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from public.assets import sd_apcd, beach_monitoring, ibwc_spills
+from public.resources import arcgis
+from public.utils import store_assets, instrumentation, soda, periods
+from benchmarks import fixtures
+from benchmarks.fake_s3 import fake_s3_resource
+from benchmarks.replay import replay
+
+MB = 1024 * 1024
+
+
+def apcd(scale):
+    ''' process_csv_files over 30 daily files, fetched concurrently and parsed '''
+    body = fixtures.load('apcd_csv', 40 * scale)
+    urls = [f'http://apcd.test/data/yesterday_{day:02d}.CSV' for day in range(30)]
+    def run():
+        with replay(lambda request: (200, body)):
+            return sd_apcd.process_csv_files(urls)
+    return run, len(body) * len(urls)
+
+
+def beachwatch(scale):
+    ''' get_beachwatch_data (search, then cookie export) and beachwatch_clean_data '''
+    body = fixtures.load('beachwatch_tsv', 20000 * scale)
+    def handler(request):
+        return (200, body) if request.method == 'GET' else (200, b'<html></html>')
+    def run():
+        with replay(handler):
+            beach_df = beach_monitoring.get_beachwatch_data(beach_monitoring.reports_page, beach_monitoring.exports_page,
+                                                            beach_monitoring.formdata)
+        with instrumentation.stage('clean'):
+            return beach_monitoring.beachwatch_clean_data(beach_df)
+    return run, len(body)
+
+
+def sdbeachinfo(scale):
+    ''' sdbeachinfo_clean_data of the status json '''
+    body = fixtures.load('sdbeachinfo_json', 400 * scale)
+    def run():
+        with instrumentation.stage('parse'):
+            closures_df = pd.DataFrame(json.loads(body))
+        with instrumentation.stage('clean'):
+            return beach_monitoring.sdbeachinfo_clean_data(closures_df)
+    return run, len(body)
+
+
+def ibwc(scale):
+    ''' the spills html table, with the gallons and status parsing of the spills asset '''
+    body = fixtures.load('ibwc_html', 500 * scale)
+    def run():
+        with instrumentation.stage('parse'):
+            df = pd.read_html(StringIO(body.decode('utf-8')), header=0)[0]
+            df = df.drop(index=0)
+        with instrumentation.stage('clean'):
+            df['Status'] = df.apply(ibwc_spills.spillStatus, axis=1)
+            df['Approximate Discharge Volume Value'] = df['Approximate Discharge Volume'].apply(lambda x: ibwc_spills.gallons(x))
+        return df
+    return run, len(body)
+
+
+def closure_weeks(scale):
+    ''' periods.span_counts of closures lasting from a day to years, the counts of beachwatch_closures_recent_weekly '''
+    rng = np.random.default_rng(0)
+    rows = 20000 * scale
+    start = pd.Timestamp('2011-01-01') + pd.to_timedelta(rng.integers(0, 5000, rows), unit='D')
+    end = start + pd.to_timedelta(rng.choice([0, 3, 20, 400, 2000], rows), unit='D')
+    def run():
+        with instrumentation.stage('span_counts') as stage:
+            stage.rows = rows
+            return periods.span_counts(start, end, 'W', column='week')
+    return run, int(start.nbytes + end.nbytes)
+
+
+def soda_geojson(scale):
+    ''' CDC SODA geojson pages read into one GeoDataFrame '''
+    pages = [fixtures.load('soda_geojson', 1000, seed=page) for page in range(5 * scale)]
+    def run():
+        frames = []
+        for page in pages:
+            with instrumentation.stage('parse') as stage:
+                frames.append(gpd.read_file(BytesIO(page)))
+                stage.rows = len(frames[-1])
+        return pd.concat(frames, ignore_index=True)
+    return run, sum(len(page) for page in pages)
+
+
+def soda_pager(scale):
+    ''' public.utils.soda.fetch of the same rows as soda_geojson, as concurrent 50000 row csv pages '''
+    rows = 5000 * scale
+    body = fixtures.load('soda_csv', rows)
+    total = body.count(b'\n') - 1
+    def handler(request):
+        if '.json' in request.url:
+            return 200, json.dumps([{'count': str(total)}]), 'application/json'
+        return 200, body, 'text/csv'
+    def run():
+        with replay(handler):
+            return soda.fetch('data.cdc.gov', 'x9gk-5huc', {'label': 'Mpox'}, geometry='geocode',
+                              page_size=total)
+    return run, len(body)
+
+
+def arcgis_layer(scale):
+    ''' FeatureLayer.features against a replayed FeatureServer with maxRecordCount 1000 '''
+    body = fixtures.load('arcgis_geojson', 10000 * scale)
+    collection = json.loads(body)
+    features = {f['properties']['objectid']: f for f in collection['features']}
+    def handler(request):
+        if request.method == 'GET':
+            return 200, json.dumps({'maxRecordCount': 1000}), 'application/json'
+        params = {k: v[0] for k, v in parse_qs(request.body if isinstance(request.body, str) else request.body.decode()).items()}
+        if params.get('returnIdsOnly') == 'true':
+            return 200, json.dumps({'objectIds': list(features)}), 'application/json'
+        ids = [int(i) for i in params['objectIds'].split(',')]
+        return 200, json.dumps({'type': 'FeatureCollection', 'features': [features[i] for i in ids]}), 'application/json'
+    layer_url = 'https://arcgis.test/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0'
+    def run():
+        with replay(handler):
+            return arcgis.FeatureLayer(layer_url).features()
+    return run, len(body)
+
+
+def complaints_frame(scale):
+    gdf = gpd.read_file(BytesIO(fixtures.load('arcgis_geojson', 10000 * scale)))
+    gdf['date_received'] = pd.to_datetime(gdf['date_received'], unit='ms').dt.tz_localize('UTC')
+    gdf['date'] = gdf['date_received'].dt.tz_convert('America/Los_Angeles')
+    return gdf
+
+
+def fix_col_types(scale):
+    ''' datetime formatting of the complaints frame '''
+    gdf = complaints_frame(scale)
+    def run():
+        with instrumentation.stage('fix_col_types') as stage:
+            stage.rows = len(gdf)
+            return store_assets.fix_col_types(gdf)
+    return run, int(gdf.memory_usage(deep=True).sum())
+
+
+def store(scale):
+    ''' geodataframe_to_s3 geojson, csv and geoparquet of the complaints frame, to a new bucket every run '''
+    gdf = complaints_frame(scale)
+    def run():
+        store_assets.geodataframe_to_s3(gdf, 'benchmark/complaints', fake_s3_resource(), formats=['geojson', 'csv', 'parquet'])
+        return gdf
+    return run, int(gdf.memory_usage(deep=True).sum())
+
+
+def store_unchanged(scale):
+    ''' geodataframe_to_s3 of content that is already in the bucket, the uploads are skipped '''
+    gdf = complaints_frame(scale)
+    s3_resource = fake_s3_resource()
+    store_assets.geodataframe_to_s3(gdf, 'benchmark/complaints', s3_resource, formats=['geojson', 'csv', 'parquet'])
+    def run():
+        store_assets.geodataframe_to_s3(gdf, 'benchmark/complaints', s3_resource, formats=['geojson', 'csv', 'parquet'])
+        return gdf
+    return run, int(gdf.memory_usage(deep=True).sum())
+
+
+CASES = {
+    'apcd': apcd,
+    'beachwatch': beachwatch,
+    'sdbeachinfo': sdbeachinfo,
+    'ibwc': ibwc,
+    'closure_weeks': closure_weeks,
+    'soda': soda_geojson,
+    'soda_pager': soda_pager,
+    'arcgis': arcgis_layer,
+    'fix_col_types': fix_col_types,
+    'store': store,
+    'store_unchanged': store_unchanged,
+}
+
+
+def measure(run, repeat=3):
+    ''' best time of repeat runs, the rows of the result and the stages of the best run '''
+    best = None
+    for _ in range(repeat):
+        instrumentation.stage_metadata()  # reset
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        stages = instrumentation.stage_metadata()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, len(result), stages)
+    return best
+
+
+def main(scale=1, names=None):
+    print(f"{'case':16} {'rows':>9} {'MB in':>8} {'seconds':>8} {'rows/s':>11} {'MB/s':>8}  stages")
+    for name in names or CASES:
+        run, input_bytes = CASES[name](scale)
+        seconds, rows, stages = measure(run)
+        breakdown = ' '.join(f"{k[:-len('_seconds')]} {v:.3f}s" for k, v in stages.items() if k.endswith('_seconds'))
+        print(f'{name:16} {rows:9d} {input_bytes / MB:8.2f} {seconds:8.3f} {rows / seconds:11.0f} '
+              f'{input_bytes / MB / seconds:8.2f}  {breakdown}')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    scale = int(args.pop(0)) if args and args[0].isdigit() else 1
+    main(scale, args or None)
@@ -0,0 +1,46 @@
+'''
+Wall time of translating the sdbeachinfo notices against benchmarks.openai_stub, with a fixed latency per request:
+one request at a time (the old Series.apply), concurrent requests, and concurrent batches of texts.
+Also checks that every mode returns the translations in order, with some requests rate limited.
+
+python -m benchmarks.translation [texts] [latency]
+'''
+import sys
+import time
+
+import openai
+
+from public.assets import beach_monitoring
+from public.utils import translation
+from benchmarks.openai_stub import serve, PREFIX
+
+MODES = {
+    'sequential': {'max_workers': 1, 'batch_size': 1},
+    'concurrent': {'max_workers': translation.TRANSLATION_WORKERS, 'batch_size': 1},
+    'batched': {'max_workers': translation.TRANSLATION_WORKERS, 'batch_size': 10},
+}
+
+
+def main(count=200, latency=0.2, rate_limited=0.05):
+    texts = [f'Beach {i} closed, sewage contaminated runoff from the Tijuana River' for i in range(count)]
+    print(f"{'mode':12} {'texts':>6} {'requests':>9} {'in flight':>10} {'seconds':>8}")
+    for mode, options in MODES.items():
+        with serve(latency=latency, rate_limited=rate_limited) as stub:
+            client = openai.OpenAI(base_url=stub.base_url, api_key='stub', max_retries=0)
+            start = time.perf_counter()
+            translations = translation.translate_all(
+                texts,
+                lambda x: beach_monitoring.translate(x, client),
+                lambda batch: beach_monitoring.translate_batch(batch, client),
+                **options)
+            seconds = time.perf_counter() - start
+        expected = [f'{PREFIX}{beach_monitoring.TRANSLATION_INSTRUCTIONS}{text}{beach_monitoring.TRANSLATION_NOTE}'
+                    if options['batch_size'] == 1 else f'{PREFIX}{text}{beach_monitoring.TRANSLATION_NOTE}'
+                    for text in texts]
+        assert translations == expected, f'{mode} translations out of order'
+        print(f'{mode:12} {count:6d} {stub.requests:9d} {stub.max_in_flight:10d} {seconds:8.2f}')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200, float(args[1]) if len(args) > 1 else 0.2)
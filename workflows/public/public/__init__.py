@@ -5,6 +5,7 @@ from dagster_openai import OpenAIResource
 from . import assets
 from .resources.minio import S3Resource
 from .resources.airtable import AirtableResource
+from .resources.asset_cache import AssetCacheResource
 
 def slack_message_fn(context: RunFailureSensorContext) -> str:
     return (
@@ -45,6 +46,10 @@ minio=S3Resource(
     S3_PORT=os.environ.get('S3_PORT'),
     S3_ACCESS_KEY=EnvVar('S3_ACCESS_KEY'), # not shown in UI
     S3_SECRET_KEY=EnvVar('S3_SECRET_KEY'),# not shown in UI
+    S3_SKIP_UNCHANGED=os.environ.get('S3_SKIP_UNCHANGED', 'true').lower() == 'true',
+    S3_POOL_SIZE=int(os.environ.get('S3_POOL_SIZE', 10)),
+    S3_KEEPALIVE=os.environ.get('S3_KEEPALIVE', 'true').lower() == 'true',
+    S3_PART_SIZE=int(os.environ.get('S3_PART_SIZE', 16 * 1024 * 1024)),
 
 
 )
@@ -52,6 +57,10 @@ airtable=AirtableResource(
     AIRTABLE_ACCESS_TOKEN=EnvVar('AIRTABLE_ACCESS_TOKEN') , # not shown in UI
     AIRTABLE_BASE_ID=EnvVar('AIRTABLE_BASE_ID')
 )
+asset_cache=AssetCacheResource(
+    ASSET_CACHE_MAX_ENTRIES=int(os.environ.get('ASSET_CACHE_MAX_ENTRIES', 8)),
+    ASSET_CACHE_TTL_SECONDS=int(os.environ.get('ASSET_CACHE_TTL_SECONDS', 900)),
+)
 openai=OpenAIResource(
    api_key=EnvVar("OPENAI_API_KEY"),
    base_url=EnvVar("OPENAI_BASE_URL")
@@ -63,11 +72,13 @@ resources ={
         "airtable": airtable,
         "openai":openai,
         "slack": SlackResource(token=EnvVar("SLACK_TOKEN")),
+        "asset_cache": asset_cache,
     },
     "production": {
         "s3":minio,
         "openai": openai,
         "slack":SlackResource(token=EnvVar("SLACK_TOKEN")),
+        "asset_cache": asset_cache,
     },
 }
 deployment_name = os.environ.get("DAGSTER_DEPLOYMENT", "local")
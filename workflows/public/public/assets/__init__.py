@@ -3,8 +3,7 @@ from .sd_complaints import (get_sd_complaints,
                             sd_complaints,
                             sd_complaints_summary,
                             sd_complaints_latest_bydate,
-                            sd_complaints_spatial_subregional,
-                            sd_complaints_spatial_tract,
+                            sd_complaints_by_geography,
                             complaints_data_sensor,
                             sd_complaints_90_days,
     # complaints_daily_job
@@ -31,7 +30,8 @@ from .ibwc_spills import (
 from .openmeteo import (forecast,
                         weather_historical,
                         weather_all_schedule)
-from .cdc_nnds import (mpox_weekly,
+from .cdc_nnds import (tracked_diseases_weekly,
+                       mpox_weekly,
                        nndss_weekly,
                        nndss_weekly_by_year,
                        measles_weekly,
@@ -41,5 +41,6 @@ from .gis import subregions, tracts
 from .airnow import (get_aq_combined_kml, get_aq_forecast, get_aq_site, aq_combined_geojson
                      )
 from .purple_air import memberGroup, getGroupData, purple_air_schedule
+from .air_quality_alerts import air_quality_alerts
 
 from .mpox_counties import mpox_la_powerbi, mpox_sf_dataportal, mpox_counties_weekly_schedule
@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+from dagster import (asset,
+                     get_dagster_logger,
+                     AssetKey,
+                     AutomationCondition,
+                     )
+from ..utils import store_assets, thresholds, alerts
+from . import sd_apcd
+
+'''
+Alerts for air quality readings over the guidance levels, for the APCD monitors (H2S, SO2, PM2.5, PM10),
+PurpleAir sensors (AQI) and AirNow monitors (AQI).
+One digest is posted to slack per run with the readings that were not alerted before.
+'''
+SLACK_CHANNEL = os.environ.get("SLACK_CHANNEL", "#test")
+output_path = 'tijuana/alerts'
+watermarks_path = f'{output_path}/store/watermarks.json'
+
+ALERT_RULES = [
+    {'name': 'h2s', 'source': 'apcd', 'parameter': sd_apcd.h2s_parameter, 'label': 'h2s',
+     'levels': thresholds.H2S_LEVELS, 'alert_levels': thresholds.H2S_ALERT_LEVELS},
+    {'name': 'so2', 'source': 'apcd', 'parameter': sd_apcd.so2_parameter, 'label': 'so2 ppb',
+     'levels': thresholds.SO2_LEVELS, 'alert_levels': thresholds.UNHEALTHY_LEVELS},
+    {'name': 'pm25', 'source': 'apcd', 'parameter': sd_apcd.pm25_parameter, 'label': 'pm2.5 ug/m3',
+     'levels': thresholds.PM25_LEVELS, 'alert_levels': thresholds.UNHEALTHY_LEVELS},
+    {'name': 'pm10', 'source': 'apcd', 'parameter': sd_apcd.pm10_parameter, 'label': 'pm10 ug/m3',
+     'levels': thresholds.PM10_LEVELS, 'alert_levels': thresholds.UNHEALTHY_LEVELS},
+    {'name': 'purple_air_aqi', 'source': 'purple_air', 'parameter': None, 'label': 'purple air aqi',
+     'levels': thresholds.AQI_LEVELS, 'alert_levels': thresholds.UNHEALTHY_LEVELS},
+    {'name': 'airnow_aqi', 'source': 'airnow', 'parameter': None, 'label': 'airnow aqi',
+     'levels': thresholds.AQI_LEVELS, 'alert_levels': thresholds.UNHEALTHY_LEVELS},
+]
+
+
+def airnow_readings(df) -> pd.DataFrame:
+    ''' airnow_current is fetched with verbose=0, which has no site names, so a monitor is named by its location '''
+    site = df['Latitude'].round(4).astype(str) + ',' + df['Longitude'].round(4).astype(str)
+    return alerts.readings(df.assign(Site=site), 'airnow', site='Site', parameter='Parameter', value='AQI', time='UTC')
+
+# source: (asset, frame -> readings)
+ALERT_SOURCES = {
+    'apcd': (AssetKey(["apcd", "current_apcd"]),
+             lambda df: alerts.readings(df, 'apcd', site='Site Name', parameter='Parameter', value='Result', time='Date with time')),
+    'purple_air': (AssetKey(["airquality", "purple_air_data"]),
+                   lambda df: alerts.readings(df, 'purple_air', site='name', value='AQI', time='last_modified')),
+    'airnow': (AssetKey(["airquality", "airnow_current"]), airnow_readings),
+}
+
+
+@asset(group_name="tijuana", key_prefix="airquality",
+       name="air_quality_alerts", required_resource_keys={"s3", "slack"},
+       deps=[key for key, _ in ALERT_SOURCES.values()],
+       automation_condition=AutomationCondition.eager()
+       )
+def air_quality_alerts(context) -> pd.DataFrame:
+    name = 'air_quality_alerts'
+    description = '''Air quality readings above the guidance levels for Yesterday and Today
+                  from the San Diego Air Pollution Control District monitors, PurpleAir sensors and AirNow monitors
+                  '''
+    metadata = store_assets.objectMetadata(name=name, description=description)
+    s3_resource = context.resources.s3
+    slack = context.resources.slack
+
+    source_readings = []
+    for source, (asset_key, to_readings) in ALERT_SOURCES.items():
+        try:
+            df = context.repository_def.load_asset_value(asset_key)
+            source_readings.append(to_readings(df))
+        except Exception as e:
+            # one source being down does not stop the alerts for the others
+            get_dagster_logger().error(f'alerts {source} readings not loaded {e}')
+    readings_df = pd.concat(source_readings, ignore_index=True) if source_readings else pd.DataFrame(columns=alerts.READING_COLUMNS)
+    alerts_df = alerts.evaluate(readings_df, ALERT_RULES)
+    store_assets.dataframe_to_s3(alerts_df, f'{output_path}/output/alerts', s3_resource, formats=['csv'], metadata=metadata)
+
+    watermarks = alerts.read_watermarks(s3_resource, watermarks_path)
+    new_df = alerts.new_alerts(alerts_df, watermarks)
+    notified = False
+    if len(new_df) > 0:
+        msg = alerts.digest(new_df)
+        get_dagster_logger().info(f'slack {msg} ')
+        try:
+            slack.get_client().chat_postMessage(channel=SLACK_CHANNEL, text=msg)
+            notified = True
+        except Exception as e:
+            get_dagster_logger().error(f'slack error {e}')
+        # the watermarks only move once the digest is posted, so a failed post is sent again next run
+        if notified:
+            alerts.write_watermarks(s3_resource, watermarks_path, alerts.advance_watermarks(watermarks, new_df))
+    else:
+        get_dagster_logger().info('no new air quality alerts')
+    context.add_output_metadata({'readings': len(readings_df), 'alerts': len(alerts_df),
+                                 'new_alerts': len(new_df), 'notified': notified})
+    return alerts_df
@@ -1,25 +1,28 @@
 import requests
 import os
 import re
+import json
 from dagster import ( asset,
                      get_dagster_logger,
                       TimeWindowPartitionsDefinition,
 DailyPartitionsDefinition,
 schedule, RunRequest, define_asset_job, AssetKey,
-AutomationCondition,
+AutomationCondition, BackfillPolicy,
 sensor,SensorEvaluationContext
                       )
 
 from .. import utils
 from ..resources import minio
-from ..utils import store_assets
+from ..utils import store_assets, instrumentation, http_fetch, periods, translation
 
 import requests
 import pandas as pd
 from pandas.api.types import is_datetime64_any_dtype, is_string_dtype
-from io import StringIO
+from io import StringIO, BytesIO
 import geopandas as gpd
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from ..utils.constants import ICONS
 from bs4 import BeautifulSoup
 
@@ -28,6 +31,7 @@ SLACK_CHANNEL = os.environ.get("SLACK_CHANNEL", "#test")
 baseurl = "https://beachwatch.waterboards.ca.gov/public/"
 reports_page=f"{baseurl}result.php"
 exports_page=f"{baseurl}export.php"
+closures_page=f"{baseurl}advisory.php"
 
 s3_output_path = 'tijuana/beachwatch'
 
@@ -51,30 +55,64 @@ limits=[
 {'method':'Enterolert', 'limits':[{'level':'close', 'min':104,}],}]
 start_date=datetime.datetime(2000,1,1)
 end_date=datetime.datetime.today()- datetime.timedelta(weeks=52)
-year_partitions = TimeWindowPartitionsDefinition(start=start_date,fmt='%Y', end=end_date,
-                                                 cron_schedule="@monthly" )
+# one partition per year, through the year of end_date
+end_date_year=datetime.datetime(end_date.year + 1, 1, 1)
+year_partitions = TimeWindowPartitionsDefinition(start=start_date,fmt='%Y', end=end_date_year,
+                                                 cron_schedule="0 0 1 1 *" )
 start_date_closures=datetime.datetime(2011,1,1)
-year_closure_partitions = TimeWindowPartitionsDefinition(start=start_date_closures,fmt='%Y', end=end_date,
-                                                 cron_schedule="@monthly" )
+year_closure_partitions = TimeWindowPartitionsDefinition(start=start_date_closures,fmt='%Y', end=end_date_year,
+                                                 cron_schedule="0 0 1 1 *" )
 
 #daily_partitions = DailyPartitionsDefinition(start_date="2025-01-01")
+
+# years fetched at once by a backfill of beachwatch_year or beachwatch_closure_year
+BEACHWATCH_WORKERS = int(os.environ.get('BEACHWATCH_WORKERS', 4))
+# closed years are not fetched again when their files are in the bucket, unless this is true
+BEACHWATCH_REFETCH_CLOSED = os.environ.get('BEACHWATCH_REFETCH_CLOSED', 'false').lower() == 'true'
+
+# incremental writes the current year layers only when the export has new, revised or removed samples,
+# full rewrites them every run
+BEACHWATCH_SYNC_MODE = os.environ.get('BEACHWATCH_SYNC_MODE', 'incremental')
+# a sample is a station, date, time, parameter and method
+sample_keys = ['Station_ID', 'SampleDate', 'SampleTime', 'Parameter', 'Method']
+
+closure_formdata = {
+    "type": "3",  # closure
+    "County": 10,
+    "stationID": "",
+    "cause": "",
+    "source": "",
+    "substance": "",
+    "created": "",
+    "year": "",
+    "sort": "`Start Date`",
+    "sortOrder": "DESC",
+    "submit": "Search ",
+}
 ###########################
 ### Data Fetch functions
 ###########################
 '''
 California Government BeachWatch data sources use cookies for exports
 '''
-def get_beachwatch_data(reports_page, exports_page, formdata) -> pd.DataFrame:
-    response = requests.post(reports_page, data=formdata)
+def get_beachwatch_data(reports_page, exports_page, formdata, session=None) -> pd.DataFrame:
+    ''' the export is the result of the last search made with the cookie, so a session is not shared between threads '''
+    http = session if session is not None else requests
+    with instrumentation.stage('fetch'):
+        response = http.post(reports_page, data=formdata)
     if response.status_code == 200:
         cookies = response.cookies
 
-        response = requests.get(exports_page, cookies=cookies)
+        with instrumentation.stage('fetch') as stage:
+            response = http.get(exports_page, cookies=cookies)
+            stage.bytes = len(response.content)
         if response.status_code == 200:
             data = response.text
             try:
             #beach_df = pd.read_csv(StringIO(data), sep="\t", parse_dates=['Start Date', 'End Date'], date_format="%Y-%m-%d")
-                beach_df = pd.read_csv(StringIO(data), sep="\t")
+                with instrumentation.stage('parse') as stage:
+                    beach_df = pd.read_csv(StringIO(data), sep="\t")
+                    stage.rows = len(beach_df)
                 return beach_df
             except Exception as  ex:
                 get_dagster_logger().info('Failed to parse beach data', ex)
@@ -87,6 +125,97 @@ def get_beachwatch_data(reports_page, exports_page, formdata) -> pd.DataFrame:
     raise Exception("Failed to download beach data")
 
 
+def closed_year(year) -> bool:
+    ''' a year before the previous one, its samples and closures no longer change '''
+    return int(year) < datetime.date.today().year - 1
+
+def fetch_years(years, fetch_year, s3_resource, paths):
+    '''
+    Runs fetch_year(year, session) for the years, BEACHWATCH_WORKERS at a time. Each thread has its own session,
+    reused for the years it fetches. Closed years with all of paths(year) in the bucket are skipped.
+    Returns the years fetched and the years skipped.
+    '''
+    # each year once, partition keys of a backfill can repeat
+    years = sorted(set(years))
+    skipped = [year for year in years
+               if not BEACHWATCH_REFETCH_CLOSED and closed_year(year)
+               and all(s3_resource.exists(path) for path in paths(year))]
+    fetched = [year for year in years if year not in skipped]
+    get_dagster_logger().info(f'beachwatch years fetched {fetched} skipped {skipped}')
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def fetch(year):
+        if not hasattr(local, 'session'):
+            local.session = http_fetch.retry_session()
+            with sessions_lock:
+                sessions.append(local.session)
+        return fetch_year(year, local.session)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(BEACHWATCH_WORKERS, len(fetched))),
+                                thread_name_prefix='beachwatch') as executor:
+            list(executor.map(instrumentation.propagate(fetch), fetched))
+    finally:
+        for session in sessions:
+            session.close()
+    return fetched, skipped
+
+def analyses_store_path(year):
+    return f'{s3_output_path}/store/analyses/beachwatch_{year}.parquet'
+
+def read_analyses_store(s3_resource, year):
+    ''' the stored export of the year's samples, None if it has not been written yet '''
+    try:
+        return pd.read_parquet(BytesIO(s3_resource.getFile(path=analyses_store_path(year))))
+    except Exception as e:
+        get_dagster_logger().info(f'beachwatch analyses store not read {e}')
+        return None
+
+def write_analyses_store(beach_df, s3_resource, year):
+    buffer = BytesIO()
+    beach_df.to_parquet(buffer, index=False)
+    s3_resource.putFile(buffer.getvalue(), path=analyses_store_path(year), content_type="application/vnd.apache.parquet")
+
+def _keyed(df):
+    ''' indexed by the sample keys, with a count for repeats of a key so replicate samples are kept apart.
+    The keys are compared as text, the stored parquet and a fresh read_csv do not always agree on their types '''
+    keys = _comparable(df[sample_keys])
+    occurrence = keys.groupby(sample_keys, sort=False).cumcount().rename('occurrence')
+    return df.set_index([*(keys[k] for k in sample_keys), occurrence])
+
+def _comparable(df):
+    ''' values as text, numbers through float so 5, 5.0 and '5' compare equal whatever type read_csv inferred '''
+    columns = {}
+    for c in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[c]):
+            # dates print as in the export, 2024-07-01
+            columns[c] = df[c].astype(str).where(df[c].notna(), '')
+            continue
+        numbers = pd.to_numeric(df[c], errors='coerce').astype('float64')
+        text = df[c].astype(str).where(df[c].notna(), '')
+        columns[c] = numbers.astype(str).where(numbers.notna(), text)
+    return pd.DataFrame(columns, index=df.index)
+
+def analyses_delta(store_df, beach_df):
+    ''' the samples of beach_df that are not in the store or whose values differ from the stored sample,
+    and the sync metadata '''
+    if store_df is None or not all(k in store_df.columns for k in sample_keys):
+        return beach_df, {'sync_mode': 'full', 'fetched': len(beach_df), 'delta_rows': len(beach_df)}
+    stored = _keyed(store_df)
+    fetched = _keyed(beach_df)
+    columns = [c for c in beach_df.columns if c in store_df.columns and c not in sample_keys]
+    added = ~fetched.index.isin(stored.index)
+    common = fetched.index[~added]
+    revised = (_comparable(stored.loc[common, columns]) != _comparable(fetched.loc[common, columns])).any(axis=1)
+    delta = added.copy()
+    delta[~added] = revised.to_numpy()
+    removed = int((~stored.index.isin(fetched.index)).sum())
+    delta_df = beach_df[delta].reset_index(drop=True)
+    return delta_df, {'sync_mode': 'incremental', 'fetched': len(beach_df), 'new_rows': int(added.sum()),
+                      'revised_rows': int(revised.sum()), 'removed_rows': removed, 'delta_rows': len(delta_df)}
+
 ###########################
 ### Data Cleaning functions
 ###########################
@@ -223,6 +352,7 @@ def get_sdbeachinfo_status(context) -> gpd.GeoDataFrame:
     Collects the San Diego Beachinfo Notices on daily schedule
     www.sdbeachinfo.com
     '''
+    instrumentation.begin()
     name = 'sdbeachinfo_status'
     description = '''Collects the San Diego Beachinfo Notices on daily schedule
          www.sdbeachinfo.com
@@ -262,6 +392,7 @@ def get_sdbeachinfo_status(context) -> gpd.GeoDataFrame:
                                     ]]
     filename = f'{s3_output_path}/output/current/sdbeachinfo_status'
     store_assets.geodataframe_to_s3(closures_gdf, filename, s3_resource, formats=['json','csv','geojson'], metadata=metadata)
+    context.add_output_metadata({**s3_resource.upload_stats(), **instrumentation.stage_metadata()})
     # just name, location
    # closures_name_df= closures_gdf[['SiteID','DehID','Name','Latitude','Longitude', 'IndicatorID', 'Active','RBGColor', 'Icon',
      #                               'Description', 'Advisory',	'Closure',
@@ -272,11 +403,8 @@ def get_sdbeachinfo_status(context) -> gpd.GeoDataFrame:
     return closures_gdf
 
 
-def translate(message,  openai_client, language_code='es', model='llama3',):
-    if message is None or message == '':
-        return ''
-    get_dagster_logger().debug(f" get beach closure translation: {message}")
-    instructions = f'''
+TRANSLATION_MODEL = 'llama3'
+TRANSLATION_INSTRUCTIONS = f'''
 Translate the following text into Spanish using the regional expressions common in the Tijuana area. Please:
    * Use “aguas negras” in place of “sewage.”
    * Use “aguas pluviales” for “runoff water.”
@@ -284,8 +412,24 @@ Translate the following text into Spanish using the regional expressions common
    * Ensure the translation resonates naturally with the local public in Tijuana.
 Maintain the html elements" 
     '''
+TRANSLATION_NOTE = ' (Note: AI-generated translation.)'
+TRANSLATION_BATCH_INSTRUCTIONS = '''
+Translate each text of the JSON array below. Answer with a JSON object {"translations": [...]} holding the
+translation of every text, in the same order.
+'''
+# part of the translation memo key, cached translations are not used once the prompt changes
+TRANSLATION_PROMPT_VERSION = translation.prompt_version(
+    TRANSLATION_INSTRUCTIONS, TRANSLATION_NOTE,
+    *([TRANSLATION_BATCH_INSTRUCTIONS] if translation.TRANSLATION_BATCH_SIZE > 1 else []))
+translation_memo_path = f'{s3_output_path}/store/translations/sdbeachinfo_translations.json'
+
+def translate(message,  openai_client, language_code='es', model=TRANSLATION_MODEL, usage=None):
+    if message is None or message == '':
+        return ''
+    get_dagster_logger().debug(f" get beach closure translation: {message}")
+    instructions = TRANSLATION_INSTRUCTIONS
 
-    prompt = f'{message } (Note: AI-generated translation.)'
+    prompt = f'{message }{TRANSLATION_NOTE}'
     resp= openai_client.chat.completions.create(
         model=model,
         messages=[ {
@@ -293,6 +437,8 @@ Maintain the html elements"
              "content": f"{instructions}{prompt}"
                     }]
     )
+    if usage is not None:
+        usage.add(resp)
     # resp= openai_client.responses.create(
     #     model=model,
     #     instructions=instructions,
@@ -302,6 +448,25 @@ Maintain the html elements"
     translation = resp.choices[0].message.content
     get_dagster_logger().debug(f" get beach closure translation: {translation}")
     return f'{translation}'
+
+def translate_batch(messages, openai_client, language_code='es', model=TRANSLATION_MODEL, usage=None):
+    ''' translations of several messages in one request, ValueError when the answer is not one translation per message '''
+    texts = json.dumps([f'{message}{TRANSLATION_NOTE}' for message in messages], ensure_ascii=False)
+    resp = openai_client.chat.completions.create(
+        model=model,
+        response_format={'type': 'json_object'},
+        messages=[{
+            'role': 'user',
+            'content': f"{TRANSLATION_INSTRUCTIONS}{TRANSLATION_BATCH_INSTRUCTIONS}{texts}"
+        }]
+    )
+    if usage is not None:
+        usage.add(resp)
+    answer = json.loads(resp.choices[0].message.content or '')
+    translations = answer.get('translations') if isinstance(answer, dict) else None
+    if not isinstance(translations, list) or len(translations) != len(messages):
+        raise ValueError(f'expected {len(messages)} translations, got {answer}'[:300])
+    return [f'{t}' for t in translations]
 @asset(group_name="tijuana", key_prefix="waterquality",
        name="sdbeachinfo_status_translation", required_resource_keys={"s3", "airtable","openai"},
        deps=[AssetKey(['waterquality','sdbeachinfo_status'])],
@@ -315,6 +480,7 @@ def beachwatch_status_translation(context) -> gpd.GeoDataFrame:
        * Closure_es
        * Advisory_es
      '''
+    instrumentation.begin()
     name = 'sdbeachinfo_status_translation'
     description = '''Translated notices from San Diego Beachinfo Notices
          Using the processed data sdbeachinfo_status  Translates www.sdbeachinfo.com status to spanish
@@ -329,17 +495,38 @@ def beachwatch_status_translation(context) -> gpd.GeoDataFrame:
     s3_resource = context.resources.s3
     openai_resource = context.resources.openai
     closure_gdf = context.repository_def.load_asset_value(AssetKey([f"waterquality", "sdbeachinfo_status"]))
-    with openai_resource.get_client(context) as client:
+    # most notices are the same as the day before, only the texts not in the memo are sent to the model
+    memo = translation.read_memo(s3_resource, translation_memo_path)
+    #columns = ['Description', 'Closure', 'Advisory', 'StatusNote']
+    columns = ['Description', 'StatusNote']
+    usage = translation.UsageCounter()
+    with openai_resource.get_client(context) as resource_client:
+        # the resource client retries twice on its own and counts usage without a lock, the translation threads use
+        # a copy that does not retry (translate_all retries), each response is added to usage under a lock
+        client = resource_client.with_options(max_retries=0)
+        def translate_texts(texts):
+            # concurrent requests, so the wall time is the slowest request rather than the sum of them
+            return translation.translate_all(
+                texts,
+                lambda x: translate(x, client, language_code='es', model=TRANSLATION_MODEL, usage=usage),
+                lambda batch: translate_batch(batch, client, language_code='es', model=TRANSLATION_MODEL, usage=usage))
         closure_translated = closure_gdf
         #closure_translated = closure_gdf.head(10)
-        closure_translated['Description_es']= closure_translated['Description'].apply(lambda x : translate(x, client, language_code='es', model='llama3'))
-        #closure_translated['Closure_es']= closure_translated['Closure'].apply(lambda x : translate(x, client, language_code='es', model='llama3'))
-        #closure_translated['Advisory_es']= closure_translated['Advisory'].apply(lambda x : translate(x, client, language_code='es', model='llama3'))
-        closure_translated['StatusNote_es'] = closure_translated['StatusNote'].apply(
-            lambda x: translate(x, client, language_code='es', model='llama3'))
+        # the misses of all the columns are translated together
+        values = [value for column in columns for value in closure_translated[column].tolist()]
+        with instrumentation.stage('translate') as stage:
+            translations, translate_stats = translation.translate_column(
+                values, translate_texts, memo, 'es', TRANSLATION_MODEL, TRANSLATION_PROMPT_VERSION)
+            stage.rows = translate_stats['misses']
+        for i, column in enumerate(columns):
+            closure_translated[f'{column}_es'] = translations[i * len(closure_translated):(i + 1) * len(closure_translated)]
+    stats = {'translation_hits': translate_stats['hits'], 'translation_misses': translate_stats['misses'],
+             **usage.metadata()}
+    translation.write_memo(s3_resource, translation_memo_path, memo)
 
     filename = f'{s3_output_path}/output/current/sdbeachinfo_status_translated'
     store_assets.geodataframe_to_s3(closure_translated, filename, s3_resource, formats=['json', 'geojson'], metadata=metadata )
+    context.add_output_metadata({**stats, 'translation_memo_entries': len(memo), **instrumentation.stage_metadata()})
     return closure_gdf
 
 
@@ -359,13 +546,25 @@ def beachwatch_closure_schedule(context):
        name="beachwatch_analyses_daily", required_resource_keys={"s3", "airtable"},
   )
 def beachwatch_analyses_daily(context):
-    '''Collects and cleans the recent years analyses on a daily schedule'''
+    '''Collects and cleans the recent years analyses on a daily schedule.
+    The export is compared to the stored export of the year, the layers are only written when samples were added,
+    revised or removed, and the changed samples are written to beachwatch_changes'''
+    instrumentation.begin()
     s3_resource = context.resources.s3
 
     year = datetime.date.today().year
     get_data = formdata.copy()
     get_data['year'] = year
     beach_df = get_beachwatch_data(reports_page, exports_page, get_data)
+    store_df = read_analyses_store(s3_resource, year) if BEACHWATCH_SYNC_MODE == 'incremental' else None
+    with instrumentation.stage('merge') as stage:
+        delta_df, sync = analyses_delta(store_df, beach_df)
+        stage.rows = len(beach_df)
+    get_dagster_logger().info(f'beachwatch analyses {year} {sync}')
+    if sync['sync_mode'] == 'incremental' and sync['delta_rows'] == 0 and sync['removed_rows'] == 0:
+        context.add_output_metadata({**sync, **instrumentation.stage_metadata()})
+        return
+    write_analyses_store(beach_df, s3_resource, year)
     beach_csv = beach_df.to_csv(
         index=False)
     filename = f'{s3_output_path}/raw/current/analyses/current/beachwatch_raw.csv'
@@ -378,43 +577,32 @@ def beachwatch_analyses_daily(context):
     # s3_resource.putFile_text(data=beach_csv, path_w_basename=filename)
     filename = f'{s3_output_path}/output/analyses/current/beachwatch'
     store_assets.geodataframe_to_s3(beach_gdf, filename, s3_resource )
+    filename = f'{s3_output_path}/output/analyses/current/beachwatch_changes'
+    # only removed samples, the changes layer is written empty with the columns of the layer
+    changes_gdf = beachwatch_clean_data(delta_df.copy()) if len(delta_df) else beach_gdf.iloc[:0]
+    store_assets.geodataframe_to_s3(changes_gdf, filename, s3_resource)
+    context.add_output_metadata({**sync, **instrumentation.stage_metadata()})
 
 @asset(group_name="tijuana",key_prefix="waterquality",
        name="beachwatch_closures_recent", required_resource_keys={"s3", "airtable"},
   )
 def beachwatch_closures_recent(context) -> gpd.GeoDataFrame:
     '''Collects and cleans the recent years closure data on a daily schedule'''
-    reports_page = f"{baseurl}advisory.php"
-    exports_page = f"{baseurl}export.php"
-
+    instrumentation.begin()
     name = 'beachwatch_closures_recent'
     description = '''Collects the Closure notices  for San Diego County from the California Data Site 
                  https://beachwatch.waterboards.ca.gov/public/
                  for the present year
                 '''
-    source_url = reports_page
+    source_url = closures_page
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
 
-    formdata = {
-        "type": "3",  # closure
-        "County": 10,
-        "stationID": "",
-        "cause": "",
-        "source": "",
-        "substance": "",
-        "created": "",
-        "year": "",
-        "sort": "`Start Date`",
-        "sortOrder": "DESC",
-        "submit": "Search ",
-    }
-
     s3_resource = context.resources.s3
 
     year = datetime.date.today().year
-    get_data = formdata.copy()
+    get_data = closure_formdata.copy()
     get_data['year'] = year
-    beach_df = get_beachwatch_data(reports_page, exports_page, get_data)
+    beach_df = get_beachwatch_data(closures_page, exports_page, get_data)
     if (len(beach_df)==0 ):
         get_dagster_logger().info(f'beachwatch_closures_recent {len(beach_df)}', )
         return gpd.GeoDataFrame()
@@ -433,22 +621,16 @@ def beachwatch_closures_recent(context) -> gpd.GeoDataFrame:
     filename = f'{s3_output_path}/output/current/closures/beachwatch_closures_recent'
     store_assets.geodataframe_to_s3(beach_gdf, filename, s3_resource, metadata=metadata)
     get_dagster_logger().info(f'beachwatch_closures_recent {len(beach_gdf)}', )
+    context.add_output_metadata(instrumentation.stage_metadata())
     return beach_gdf
 
-def weeks_spanned(row):
-    ''' This is utilized to create weekly counts of the closed beaches'''
-    # Calculate the Monday of the week for both start and end dates.
-    # This ensures that even a one-day event (start == end) lands in a week.
-    start_week = row['start'] - pd.to_timedelta(row['start'].weekday(), unit='D')
-    end_week = row['end'] - pd.to_timedelta(row['end'].weekday(), unit='D')
-    # Create a weekly date_range with a step of 7 days.
-    return pd.date_range(start=start_week, end=end_week, freq='7D')
 @asset(group_name="tijuana", key_prefix="waterquality",
        name="beachwatch_closures_recent_weekly", required_resource_keys={"s3", "airtable"},
        automation_condition=AutomationCondition.eager(),
        deps=[AssetKey([f"waterquality", "beachwatch_closures_recent"])]
        )
 def beachwatch_closure_recent_weekly(context)-> pd.DataFrame:
+    instrumentation.begin()
     name = 'beachwatch_closures_recent_weekly'
     description = '''Aggregates by conount  Closure notices for San Diego County from the California  Data Site 
                  https://beachwatch.waterboards.ca.gov/public/
@@ -462,16 +644,14 @@ def beachwatch_closure_recent_weekly(context)-> pd.DataFrame:
     get_dagster_logger().info(f'beachwatch_closures_recent  unpickle types {closure_gdf.dtypes}', )
     # for some reason this does not get a clean unpickle... just clean it again
     closure_gdf=beachwatch_closure_clean_data(closure_gdf)
-    closure_gdf['week'] = closure_gdf.apply(weeks_spanned, axis=1)
-
-# Explode the list of weeks into individual rows
-    df_exploded = closure_gdf.explode('week')
-
-    weekly_counts = df_exploded['week'].value_counts().reset_index().sort_values(by='week')
-    weekly_counts.columns = ['week', 'count']  # Rename columns for clarity
+    # closures open in each week, from the Monday of the start week to the week of the end
+    with instrumentation.stage('span_counts') as stage:
+        weekly_counts = periods.span_counts(closure_gdf['start'], closure_gdf['end'], 'W', column='week')
+        stage.rows = len(closure_gdf)
 
     filename = f'{s3_output_path}/output/current/closures/beachwatch_closures_recent_weekly'
     store_assets.dataframe_to_s3(weekly_counts, filename, s3_resource , metadata=metadata)
+    context.add_output_metadata(instrumentation.stage_metadata())
     return weekly_counts
 
 beach_waterquality_daily_job = define_asset_job(
@@ -484,13 +664,22 @@ beach_waterquality_daily_job = define_asset_job(
 def beach_waterquality_schedule(context):
     return RunRequest(
     )
+def beachwatch_year_paths(year):
+    return [f'{s3_output_path}/raw/analyses/year/beachwatch_raw_{year}.csv',
+            f'{s3_output_path}/output/analyses/year/beachwatch_{year}.csv']
+
+def beachwatch_closure_year_paths(year):
+    return [f'{s3_output_path}/raw/closures/year/beachwatch_closure_raw_{year}.csv',
+            f'{s3_output_path}/output/closures/year/beachwatch_closure_{year}.csv']
+
 @asset(group_name="tijuana",key_prefix="waterquality",
        name="beachwatch_year", required_resource_keys={"s3", "airtable"},
        partitions_def=year_partitions,
-
+       backfill_policy=BackfillPolicy.single_run(),
   )
 def beachwatch_year(context):
-    '''Collects and cleans the analyses by year '''
+    '''Collects and cleans the analyses by year. A backfill is one run that fetches the years concurrently '''
+    instrumentation.begin()
     name = 'beachwatch_year'
     description = '''Collects Analysis data by year  for San Diego County from the California  Data Site 
                  https://beachwatch.waterboards.ca.gov/public/
@@ -498,67 +687,58 @@ def beachwatch_year(context):
 
     metadata = store_assets.objectMetadata(name=name, description=description)
     s3_resource = context.resources.s3
-    year = context.asset_partition_key_for_output()
 
-    get_data = formdata.copy()
-    get_data['year'] = year
-    beach_df = get_beachwatch_data(reports_page, exports_page, get_data)
-    beach_csv= beach_df.to_csv(
-         index=False)
-    filename = f'{s3_output_path}/raw/analyses/year/beachwatch_raw_{year}.csv'
-    s3_resource.putFile_text(data=beach_csv, path=filename)
-    beach_gdf = beachwatch_clean_data(beach_df)
-    beach_csv= beach_gdf.to_csv(
-         index=False)
-    filename = f'{s3_output_path}/output/analyses/year/beachwatch_{year}.csv'
-    s3_resource.putFile_text(data=beach_csv, path=filename)
+    def fetch_year(year, session):
+        raw_filename, filename = beachwatch_year_paths(year)
+        get_data = formdata.copy()
+        get_data['year'] = year
+        beach_df = get_beachwatch_data(reports_page, exports_page, get_data, session=session)
+        beach_csv= beach_df.to_csv(
+             index=False)
+        s3_resource.putFile_text(data=beach_csv, path=raw_filename)
+        beach_gdf = beachwatch_clean_data(beach_df)
+        beach_csv= beach_gdf.to_csv(
+             index=False)
+        s3_resource.putFile_text(data=beach_csv, path=filename)
+
+    fetched, skipped = fetch_years(context.partition_keys, fetch_year, s3_resource, beachwatch_year_paths)
+    context.add_output_metadata({'years_fetched': len(fetched), 'years_skipped': len(skipped),
+                                 **instrumentation.stage_metadata()})
 
 @asset(group_name="tijuana",key_prefix="waterquality",
        name="beachwatch_closure_year", required_resource_keys={"s3", "airtable"},
        partitions_def=year_closure_partitions,
-
+       backfill_policy=BackfillPolicy.single_run(),
   )
 def beachwatch__closures_year(context):
     '''Collects and cleans the closure information by year. Hostorical back to 2011. Data change in 2010'''
+    instrumentation.begin()
     # the time is from 2011. There was a format change in 2010.
-    reports_page = f"{baseurl}advisory.php"
-    exports_page = f"{baseurl}export.php"
     name = 'beachwatch_closures_recent_weekly'
     description = '''Collects and cleans the closure information by year. Historical back to 2011. Data change in 2010
                      https://beachwatch.waterboards.ca.gov/public/
                     
                     '''
-    source_url = reports_page
+    source_url = closures_page
     metadata = store_assets.objectMetadata(name=name, description=description, source=source_url)
-
-    formdata = {
-        "type": "3",  # closure
-        "County": 10,
-        "stationID": "",
-        "cause": "",
-        "source": "",
-        "substance": "",
-        "created": "",
-        "year": "",
-        "sort": "`Start Date`",
-        "sortOrder": "DESC",
-        "submit": "Search ",
-    }
     s3_resource = context.resources.s3
-    year = context.asset_partition_key_for_output()
 
-    get_data = formdata.copy()
-    get_data['year'] = year
-    beach_df = get_beachwatch_data(reports_page, exports_page, get_data)
-    beach_csv= beach_df.to_csv(
-         index=False)
-    filename = f'{s3_output_path}/raw/closures/year/beachwatch_closure_raw_{year}.csv'
-    s3_resource.putFile_text(data=beach_csv, path=filename)
-    beach_gdf = beachwatch_closure_clean_data(beach_df)
-    beach_csv= beach_gdf.to_csv(
-         index=False)
-    filename = f'{s3_output_path}/output/closures/year/beachwatch_closure_{year}.csv'
-    s3_resource.putFile_text(data=beach_csv, path=filename)
+    def fetch_year(year, session):
+        raw_filename, filename = beachwatch_closure_year_paths(year)
+        get_data = closure_formdata.copy()
+        get_data['year'] = year
+        beach_df = get_beachwatch_data(closures_page, exports_page, get_data, session=session)
+        beach_csv= beach_df.to_csv(
+             index=False)
+        s3_resource.putFile_text(data=beach_csv, path=raw_filename)
+        beach_gdf = beachwatch_closure_clean_data(beach_df)
+        beach_csv= beach_gdf.to_csv(
+             index=False)
+        s3_resource.putFile_text(data=beach_csv, path=filename)
+
+    fetched, skipped = fetch_years(context.partition_keys, fetch_year, s3_resource, beachwatch_closure_year_paths)
+    context.add_output_metadata({'years_fetched': len(fetched), 'years_skipped': len(skipped),
+                                 **instrumentation.stage_metadata()})
 
 #### AI generate sensor
 
@@ -9,6 +9,7 @@ from dagster import ( asset,
                       )
 
 from ..resources import minio
+from ..resources import arcgis
 
 import requests
 import pandas as pd
@@ -21,7 +22,7 @@ from ..utils import store_assets
 
 s3_output_path = 'tijuana/gis/boundaries'
 tracts_geojson="https://oss.resilientservice.mooo.com/resilentpublic/tijuana/geographic/tracts_cleanwater.geojson"
-subregion_url="https://geo.sandag.org/server/rest/services/Hosted/Subregional_Areas_2020/FeatureServer/0/query?where=1%3D1&objectIds=&time=&geometry=&geometryType=esriGeometryEnvelope&inSR=&defaultSR=&spatialRel=esriSpatialRelIntersects&distance=&units=esriSRUnit_Foot&relationParam=&outFields=sra%2Cname%2Cglobalid&returnGeometry=true&maxAllowableOffset=&geometryPrecision=&outSR=&havingClause=&gdbVersion=&historicMoment=&returnDistinctValues=false&returnIdsOnly=false&returnCountOnly=false&returnExtentOnly=false&orderByFields=&groupByFieldsForStatistics=&outStatistics=&returnZ=false&returnM=false&multipatchOption=xyFootprint&resultOffset=&resultRecordCount=&returnTrueCurves=false&returnCentroid=false&returnEnvelope=false&timeReferenceUnknownClient=false&maxRecordCountFactor=&sqlFormat=none&resultType=&datumTransformation=&lodType=geohash&lod=&lodSR=&cacheHint=false&f=geojson"
+subregion_layer="https://geo.sandag.org/server/rest/services/Hosted/Subregional_Areas_2020/FeatureServer/0"
 @asset(group_name="tijuana",key_prefix="gis",
        name="subregional_areas",
        required_resource_keys={"s3"},
@@ -29,7 +30,7 @@ subregion_url="https://geo.sandag.org/server/rest/services/Hosted/Subregional_Ar
        )
 def subregions(context) -> gpd.GeoDataFrame:
     s3_resource = context.resources.s3
-    sr_gdf = gpd.read_file(subregion_url)
+    sr_gdf = arcgis.FeatureLayer(subregion_layer).features(out_fields='sra,name,globalid')
     sr_gdf.to_crs('EPSG:4326')
     sr_gdf = sr_gdf.drop_duplicates(['sra','globalid'])
     filename = f'{s3_output_path}/subregional_areas'
@@ -247,7 +247,7 @@ def spills_all(context):
     else:
         raise ValueError("No spills data found")
     filename = f'{s3_output_path}output/spills_all'
-    store_assets.geodataframe_to_s3(combined_gdf, filename, s3_resource, metadata=metadata )
+    store_assets.geodataframe_to_s3(combined_gdf, filename, s3_resource, formats=['geojson', 'csv', 'parquet'], metadata=metadata )
 
 spills_latest_job = define_asset_job(
     "ibwc_spills_latest_job",  selection=[AssetKey(["ibwc", "spills"]) ]
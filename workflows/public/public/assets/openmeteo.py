@@ -15,7 +15,7 @@ from dagster import ( asset,
                       )
 
 from ..resources import minio
-from ..utils import store_assets
+from ..utils import store_assets, instrumentation
 
 s3_output_path = 'tijuana/weather/'
 @asset(group_name="tijuana",key_prefix="weather",
@@ -27,6 +27,7 @@ s3_output_path = 'tijuana/weather/'
 }
   )
 def forecast(context):
+    instrumentation.begin()
     meta = context.assets_def.metadata_by_key[context.asset_key]
     description = meta["description"]  # -> "value"
     source_url = meta.get("source")  # -> "data-eng"
@@ -100,6 +101,7 @@ def forecast(context):
     filename = f'{s3_output_path}raw/forecast'
     #s3_resource.putFile_text(data=hourly_csv, path=filename)
     store_assets.dataframe_to_s3(hourly_dataframe, filename, s3_resource, metadata=metadata)
+    context.add_output_metadata({**s3_resource.upload_stats(), **instrumentation.stage_metadata()})
     return hourly_dataframe
 
 # Define a yearly partition
@@ -12,7 +12,7 @@ AutomationCondition,
 SensorEvaluationContext
                       )
 from shapely import Point
-from ..utils import store_assets
+from ..utils import store_assets, instrumentation
 
 output_path = 'tijuana/airquality/purpleair'
 # Here we store our API read key in a string variable that we can reference later.
@@ -106,6 +106,7 @@ def memberGroup(context):
        ins={"memberGroup": AssetIn(key_prefix=['airquality' ])},
        automation_condition=AutomationCondition.eager())
 def getGroupData(context, memberGroup ):
+    instrumentation.begin()
     s3_resource = context.resources.s3
     name = 'purple air current data'
     description = '''Collects data from the Purple Air API u
@@ -137,6 +138,7 @@ def getGroupData(context, memberGroup ):
                                                     )), axis=1)
         filename = f"{output_path}/output/current_data"
         store_assets.geodataframe_to_s3(gdf, filename, s3_resource, metadata=metadata)
+        context.add_output_metadata({**s3_resource.upload_stats(), **instrumentation.stage_metadata()})
         return gdf
     else:
         get_dagster_logger().error(f'{r.status_code} {r.text}')
@@ -17,9 +17,11 @@ AutomationCondition,
 AssetCheckSpec, AssetCheckResult, asset_check, AssetCheckExecutionContext
                       )
 from ..utils.constants import ICONS
+from ..utils import thresholds, instrumentation
 from ..resources import minio
 
 import pandas as pd
+import numpy as np
 import geopandas as gpd
 import csv
 import os
@@ -30,8 +32,8 @@ import glob
 from string import Template
 import requests
 from urllib.request import urlopen
-from io import StringIO
-from ..utils import store_assets
+from io import StringIO, BytesIO
+from ..utils import store_assets, http_fetch
 
 # docker env has RESILIENT_ prefix
 #             - SLACK_CHANNEL=${RESILIENT_SLACK_CHANNEL:-"#test"}
@@ -40,6 +42,10 @@ SLACK_CHANNEL = os.environ.get("SLACK_CHANNEL", "#test")
 
 daily_apcd_partitions = DailyPartitionsDefinition(start_date="2024-01-01")
 
+# the daily files are small, so wall time is all network wait. Fetch them concurrently, but be polite to the host
+APCD_FETCH_WORKERS = int(os.environ.get('APCD_FETCH_WORKERS', 8))
+APCD_FETCH_PER_HOST = int(os.environ.get('APCD_FETCH_PER_HOST', 4))
+
 airnow_station_url = "https://s3-us-west-1.amazonaws.com//files.airnowtech.org/airnow/today/Monitoring_Site_Locations_V2.dat"
 
 base_url = 'http://jtimmer.digitalspacemail17.net/data/'
@@ -51,9 +57,15 @@ pattern_file = 'yesterday_$filedate.CSV'
 #s3_bucket = os.getenv('PUBLIC_BUCKET', 'resilient-public')# defined in s3
 s3_data_path = 'tijuana/sd_apcd_air/source'
 s3_output_path = 'tijuana/sd_apcd_air/output'
+# columnar copy of all_sd_airquality. apcd_all only fetches the days after its watermark and merges them in
+apcd_store_path = f'{s3_data_path}/store/all_sd_airquality.parquet'
+# days before the watermark fetched again, APCD revises recent readings
+APCD_OVERLAP_DAYS = int(os.environ.get('APCD_OVERLAP_DAYS', 2))
 
 so2_parameter = '28 SO2 Tr PPB'
 h2s_parameter = '07 H2S PPB'
+pm25_parameter = "11 PM2.5 �g/M3"  # the micro sign does not survive decoding the APCD files
+pm10_parameter = 'PM10 STD'
 
 outputs = [
     {'parameter': "01 OZONE PPM", 'name': "01 OZONE PPM", 'file': "o2"},
@@ -69,6 +81,7 @@ outputs = [
        deps=[AssetKey([f"apcd", "locations"])]
   )
 def current(context) -> gpd.GeoDataFrame:
+    instrumentation.begin()
     name = 'current_apcd'
     description = '''Air Quality data for today and yesterday
         Data from San Diego Air Pollution Control District Air Quality Monitoring Sites
@@ -101,7 +114,7 @@ def current(context) -> gpd.GeoDataFrame:
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
 
     latest_h2s_df = output_gdf[output_gdf['Parameter'] == h2s_parameter]
-    latest_h2s_df['level'] = latest_h2s_df['Result'].apply(lambda r: h2s_guidance(r))
+    latest_h2s_df['level'] = thresholds.classify_levels(latest_h2s_df['Result'], thresholds.H2S_LEVELS)
     latest_h2s_df= latest_h2s_df.groupby(['Parameter', 'Site Name', ], as_index=False).tail(1)
 # use this to get last levels
     #  latest_h2s_df= latest_h2s_df.groupby(['Parameter', 'Site Name','levels' ], as_index=False).tail(1)
@@ -109,6 +122,7 @@ def current(context) -> gpd.GeoDataFrame:
     # s3_resource.putFile_text(data=h2s.to_csv( index=False), path=filename)
     filename = f'{s3_output_path}/lastvalue_h2s'
     store_assets.geodataframe_to_s3(latest_h2s_df, filename, s3_resource , metadata=metadata)
+    context.add_output_metadata({**s3_resource.upload_stats(), **instrumentation.stage_metadata()})
 
     return output_gdf
 
@@ -159,11 +173,12 @@ def current_freshness_check(context: AssetCheckExecutionContext, current):
     return AssetCheckResult(passed=passed, metadata=metadata)
 
 @asset(group_name="tijuana", key_prefix="apcd",
-       name="h2s_warnings", required_resource_keys={"s3", "airtable", "slack"},
+       name="h2s_warnings", required_resource_keys={"s3", "airtable"},
        deps=[AssetKey(['apcd','current_apcd']), AssetKey(['apcd', 'locations'])],
         automation_condition=AutomationCondition.eager()
        )
 def highh2s(context):
+    ''' the H2S readings at the alert levels. The slack alerts for them are sent by airquality/air_quality_alerts '''
     name = 'h2s_warnings'
     description = '''Records where H2S exceeds the standard for Yesterday and Today
 
@@ -173,51 +188,15 @@ def highh2s(context):
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
 
     s3_resource = context.resources.s3
-    slack = context.resources.slack
-    try:
-        last_h2s = context.repository_def.load_asset_value(AssetKey([f"apcd", "h2s_warnings"]))
-        get_dagster_logger().info(f'h2s events {last_h2s} ')
-        if (len(last_h2s) != 0):
-            last_h2s_date = last_h2s['Date with time'].max()
-            get_dagster_logger().info(f'last h2s date from asset {datetime.min} ')
-        else:
-            last_h2s_date = datetime.min
-            get_dagster_logger().info(f'last h2s date set to  {datetime.min} ')
-    except:
-        last_h2s = gpd.GeoDataFrame()
-        last_h2s_date = datetime.min
-        get_dagster_logger().info(f'issue starting the last date datetime min ')
     current = context.repository_def.load_asset_value(AssetKey([f"apcd", "current_apcd"]))
     h2s = current[current['Parameter'] == h2s_parameter]
-    h2s['level'] = h2s['Result'].apply(lambda r: h2s_guidance(r))
+    h2s['level'] = thresholds.classify_levels(h2s['Result'], thresholds.H2S_LEVELS)
     h2s.dropna(subset=['Result'], inplace=True)
-    h2s=h2s[h2s['Result']>=30 ]
+    h2s = h2s[h2s['level'].isin(thresholds.H2S_ALERT_LEVELS)]
     if len(h2s) >0:
         get_dagster_logger().info(f'h2s events {len(h2s)} ')
-        #filename = f'{s3_output_path}/warnings/h2s.json'
-        #s3_resource.putFile_text(data=h2s.to_json( index=False, orient='records'), path=filename)
         filename = f'{s3_output_path}/warnings/h2s'
         store_assets.dataframe_to_s3(h2s, filename, s3_resource, formats=['csv'], metadata=metadata)
-        try:
-            if last_h2s is None:
-                get_dagster_logger().info('Last h2s is None')
-            else:
-                get_dagster_logger().info(f'last h2s {last_h2s.to_csv()} ')
-                get_dagster_logger().info(f' h2s {h2s.to_csv()} ')
-                #get_dagster_logger().info(f' previous h2s {last_h2s.dtypes} ')
-                #get_dagster_logger().info(f' h2s {h2s.dtypes} ')
-                #diff_df= last_h2s.compare(h2s)
-                rows = h2s[h2s['Date with time']>str(last_h2s_date)]
-                get_dagster_logger().info(f' new data {len(rows)} rows ')
-                for i,h in rows.iterrows():
-                    msg = f":wave: {h['Site Name']} high h2s {h['Result']} at {h['Date with time']} "
-                    get_dagster_logger().info(f'slack {msg} ')
-                    try:
-                        slack.get_client().chat_postMessage(channel=SLACK_CHANNEL, text=msg)
-                    except Exception as e:
-                        get_dagster_logger().error(f'slack error {e}')
-        except Exception as e:
-            get_dagster_logger().error(f'issue with h2s comparisons {e} ')
     else:
         get_dagster_logger().info(f'no h2s events')
     return h2s
@@ -243,7 +222,7 @@ def hs2_latest(context):
     source_url = base_url
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
     h2s = current[current['Parameter'] == h2s_parameter]
-    h2s['level'] = h2s['Result'].apply(lambda r: h2s_guidance(r))
+    h2s['level'] = thresholds.classify_levels(h2s['Result'], thresholds.H2S_LEVELS)
     h2s.dropna(subset=['Result'], inplace=True)
     current_df = h2s.drop_duplicates(keep='last', subset=['Site Name'])
     filename = f'{s3_output_path}/hs2_current'
@@ -271,6 +250,7 @@ def hs2_latest(context):
        deps=[AssetKey(['apcd', 'locations'])],
   )
 def apcd_all(context, ) -> pd.DataFrame:
+    instrumentation.begin()
     name = 'all_sd_airquality'
     description = '''Air Quality Monitoring Site for all APCD locations
 
@@ -282,20 +262,68 @@ def apcd_all(context, ) -> pd.DataFrame:
     #earliest = context.asset_partition_key_for_output()
     earliest=os.environ.get('APCD_EARLIEST','2024-10-02' )
     earliest_date=datetime.fromisoformat(earliest).replace(tzinfo=timezone(timedelta(hours=-7)))
-    num_days = datetime.now(tz=ZoneInfo("America/Los_Angeles")) - earliest_date
-    get_dagster_logger().info(f'days to get from {earliest_date} {num_days.days}' )
-    file_paths = files_root(num_days=num_days.days)
+    today = datetime.now(tz=ZoneInfo("America/Los_Angeles"))
+    store_df = read_apcd_store(s3_resource)
+    watermark = apcd_watermark(store_df, earliest_date.date())
+    if watermark is None:
+        num_days = (today - earliest_date).days
+        get_dagster_logger().info(f'no apcd store, days to get from {earliest_date} {num_days}' )
+    else:
+        # refetch a couple of days before the watermark, the last files can be revised after they are published
+        num_days = (today.date() - watermark).days + APCD_OVERLAP_DAYS
+        get_dagster_logger().info(f'apcd store watermark {watermark}, days to get {num_days}' )
+    file_paths = files_root(num_days=num_days)
     get_dagster_logger().info(f'file paths {file_paths} ' )
     # Process the files
-    output_df = process_csv_files(file_paths)
+    new_df = process_csv_files(file_paths)
+    output_df = merge_apcd_store(store_df, new_df, earliest_date.date())
+    write_apcd_store(output_df, s3_resource)
+    context.add_output_metadata({'fetched_days': num_days, 'new_rows': len(new_df), 'rows': len(output_df)})
 
     #output_df.to_csv( index=False)
     # filename = f'{s3_output_path}/all.csv'
     # s3_resource.putFile_text(data=output_df.to_csv( index=False), path=filename)
     filename = f'{s3_output_path}/all'
-    store_assets.geodataframe_to_s3(output_df, filename, s3_resource, metadata=metadata )
+    store_assets.geodataframe_to_s3(output_df, filename, s3_resource, formats=['geojson', 'csv', 'parquet'], metadata=metadata )
+    context.add_output_metadata({**s3_resource.upload_stats(), **instrumentation.stage_metadata()})
     return output_df
 
+def read_apcd_store(s3_resource):
+    ''' the persisted parquet copy of all_sd_airquality, None if it has not been written yet '''
+    try:
+        return pd.read_parquet(BytesIO(s3_resource.getFile(path=apcd_store_path)))
+    except Exception as e:
+        get_dagster_logger().info(f'apcd store not read {e}')
+        return None
+
+def write_apcd_store(output_df, s3_resource):
+    buffer = BytesIO()
+    output_df.to_parquet(buffer, index=False)
+    s3_resource.putFile(buffer.getvalue(), path=apcd_store_path, content_type="application/vnd.apache.parquet")
+
+def apcd_watermark(store_df, earliest):
+    ''' last day in the store. None when the store needs a full load (missing, or APCD_EARLIEST moved before it) '''
+    if store_df is None or len(store_df) == 0:
+        return None
+    days = store_df['Date with time'].str[:10]
+    if days.min() > earliest.isoformat():
+        return None
+    return datetime.fromisoformat(days.max()).date()
+
+def merge_apcd_store(store_df, new_df, earliest):
+    ''' new readings replace stored readings for the same parameter, site and hour. Newest day first '''
+    if store_df is not None and len(store_df) > 0:
+        merged_df = pd.concat([store_df, new_df], ignore_index=True)
+    else:
+        merged_df = new_df
+    if len(merged_df) == 0:
+        return merged_df
+    merged_df = merged_df.drop_duplicates(subset=['Parameter', 'Site Name', 'Date with time'], keep='last')
+    days = merged_df['Date with time'].str[:10]
+    merged_df = merged_df[days >= earliest.isoformat()]
+    day_order = merged_df['Date with time'].str[:10].sort_values(ascending=False, kind='stable').index
+    return merged_df.loc[day_order].reset_index(drop=True)
+
 
 @asset(group_name="tijuana", key_prefix="apcd",
        name="day", required_resource_keys={"s3", "airtable"},
@@ -381,7 +409,7 @@ def generate_apcd(context):
     output_gdf = locations_gdf.merge(output_df, how='inner', left_on='SiteName', right_on='Site Name',
                                       suffixes=('', '_y'))
     h2s = output_gdf[output_gdf['Parameter'] == h2s_parameter]
-    h2s['level'] = h2s['Result'].apply(lambda r: h2s_guidance(r))
+    h2s['level'] = thresholds.classify_levels(h2s['Result'], thresholds.H2S_LEVELS)
 
     # filename = f'{s3_output_path}/h2s.csv'
     # s3_resource.putFile_text(data=h2s.to_csv( index=False), path=filename)
@@ -399,7 +427,7 @@ def generate_apcd(context):
     last_30_df=output_gdf[output_gdf['Date with time']>date_30]
 
     h2s = last_30_df[last_30_df['Parameter'] == h2s_parameter]
-    h2s['level'] = h2s['Result'].apply(lambda r: h2s_guidance(r))
+    h2s['level'] = thresholds.classify_levels(h2s['Result'], thresholds.H2S_LEVELS)
     # filename = f'{s3_output_path}/latest_h2s.csv'
     # s3_resource.putFile_text(data=h2s.to_csv( index=False), path=filename)
     filename = f'{s3_output_path}/h2s_30days'
@@ -419,125 +447,101 @@ def files_root(base_url='http://jtimmer.digitalspacemail17.net/data/', filepatte
     return urls
 
 def h2s_guidance(result):
-    levels=[{ 'min':0, 'max':5, 'level':"green"},
-            { 'min':5, 'max':30, 'level':"yellow"},
-            { 'min':30, 'max':27000, 'level':"orange"},
-            { 'min':27000, 'max': None, 'level':"purple"}]
-    if pd.isna(result) or result == '':
-        return 'white'
+    ''' level of a single H2S reading, use thresholds.classify_levels for a column '''
+    return thresholds.classify_levels([result], thresholds.H2S_LEVELS).iloc[0]
+
+APCD_COLUMNS = ['Parameter', 'Site Name', 'Date with time', 'Result', 'Qualifier', 'Original Value']
+
+def parse_apcd_file(data) -> pd.DataFrame:
+    ''' parses one APCD wide hourly file (date on the third line, hours header, one row per parameter/site)
+    into the long format, one row per reported hour.
+    The block is read with read_csv, and the 24 hour columns are flattened row major, which is the same order
+    as the original line by line loop. Qualifiers (<=, <, >) and values are pulled out with vectorized string ops.
+    '''
+    lines = data.splitlines()
+
+    date_str = lines[2]  # third line 0 base
+    if ',' in date_str:
+        date_str = date_str.strip().split('),')[1]  # Get date from third row
+        # Parse the date
+    date = datetime.strptime(date_str.strip(), '%m/%d/%Y')
+    date =pytz.timezone("America/Los_Angeles").localize(date)
+    get_dagster_logger().info(f'date dst {date.dst()}')
+    hours_header = lines[3]  # First row with parameter names
+    # Find the index where hour columns start
+    hour_start_index = hours_header.index('0')
+    parameter_index = 0
+    site_index = 1
+    # the file times are standard time, shifted by dst like the original per row loop. One string per hour, reused for every row
+    hour_stamps = np.array([(date + timedelta(hours=hour) + date.dst()).isoformat() for hour in range(24)], dtype=object)
+
+    block = lines[5:]
+    if len(block) == 0:
+        return pd.DataFrame(columns=APCD_COLUMNS)
+    num_columns = max(hour_start_index + 24, max(line.count(',') for line in block) + 1)
+    rows_df = pd.read_csv(StringIO('\n'.join(block)), header=None, names=range(num_columns), dtype=str,
+                          keep_default_na=False, quoting=csv.QUOTE_NONE, skip_blank_lines=True)
+    rows_df = rows_df.fillna('')
+    parameters = rows_df[parameter_index].str.strip()
+    # Skip new parameter headers, the parameter name is only on the first row of each parameter block
+    rows_df = rows_df[parameters != 'Parameter']
+    parameters = parameters[parameters != 'Parameter'].replace('', np.nan).ffill()
+    rows_df = rows_df[parameters.notna()]
+    parameters = parameters[parameters.notna()]
+    if len(rows_df) == 0:
+        return pd.DataFrame(columns=APCD_COLUMNS)
+
+    # melt the 24 hour columns, row major
+    hour_columns = list(range(hour_start_index, hour_start_index + 24))
+    results = pd.Series(rows_df[hour_columns].to_numpy(dtype=object).ravel()).str.strip()
+    long_df = pd.DataFrame({
+        'Parameter': np.repeat(parameters.to_numpy(dtype=object), 24),
+        'Site Name': np.repeat(rows_df[site_index].to_numpy(dtype=object), 24),
+        'Date with time': np.tile(hour_stamps, len(rows_df)),
+        'Original Value': results,
+    })
+    long_df = long_df[results.str.len() > 0].reset_index(drop=True)
+
+    # only a few readings carry a qualifier, so the replace passes run on that subset
+    value = long_df['Original Value'].copy()
+    qualifier = np.full(len(value), '', dtype=object)
+    qualified = value.str.contains('[<>]', regex=True).to_numpy()
+    if qualified.any():
+        subset = value[qualified]
+        has_le = subset.str.contains('<=', regex=False)
+        subset = subset.str.replace('<=', '', regex=False)
+        has_lt = subset.str.contains('<', regex=False)
+        subset = subset.str.replace('<', '', regex=False)
+        has_gt = subset.str.contains('>', regex=False)
+        subset = subset.str.replace('>', '', regex=False)
+        qualifier[qualified] = np.select([has_gt, has_lt, has_le], ['>', '<', '<='], default='')
+        value[qualified] = subset.str.strip()
+        qualified_empty = np.zeros(len(value), dtype=bool)
+        qualified_empty[qualified] = (subset.str.len() == 0).to_numpy()
     else:
-        result = float(result)
-    for level in levels:
-        if level['max'] is None:
-            if result >= level['min']:
-                return level['level']
-        elif result >= level['min'] and result < level['max']:
-            return level['level']
-
-def process_csv_files(file_paths):
-    transformed_data = []
-
-    with requests.Session() as s:
-        for file_path in file_paths:
-            # Read the date from the third row
-            get_dagster_logger().info(f'get file {file_path}')
-
-            response = s.get(file_path)
-            if response.status_code == 200:
-                get_dagster_logger().info(f'response {response.status_code}')
-                data = response.text
-                lines = data.splitlines()
-
-                date_str = lines[2]  # third line 0 base
-                if ',' in date_str:
-                    date_str = date_str.strip().split('),')[1]  # Get date from third row
-                    # Parse the date
-                date = datetime.strptime(date_str.strip(), '%m/%d/%Y')
-                date =pytz.timezone("America/Los_Angeles").localize(date)
-                get_dagster_logger().info(f'date dst {date.dst()}')
-                hours_header = lines[3]  # First row with parameter names
-                parameter_header = lines[4]  # Skip second row parmeters
-                # next(csv_reader)  # Skip third row (date)
-                # parameter_header = next(csv_reader)  # Fourth row with hour headers
-
-                # Find the index where hour columns start
-                hour_start_index = hours_header.index('0')
-                # parameter_index = parameter_header.index('Parameter')
-                # site_index = parameter_header.index('SiteName')
-                parameter_index = 0
-                site_index = 1
-                # Process each row
-                for row in lines[5:]:
-                    row = row.strip().split(',')
-                    if not row or row[0] == 'Parameter':  # Skip empty rows or new parameter headers
-                        continue
-
-                    site_name = row[site_index]
-
-                    # Find the corresponding parameter
-                    # parameter = None
-                    # for i in range(len(hours_header)):
-                    #     if hours_header[i] and row[i]:
-                    #         parameter = hours_header[i]
-                    #         break
-                    if row[parameter_index] and len(row[parameter_index]) > 0:
-                        parameter = row[parameter_index]
-
-                    if not parameter:
-                        continue
-
-                    # Process each hour's result
-                    for hour in range(24):
-                        result = row[hour_start_index + hour].strip()
-                        if result and len(result) > 0:
-                            value = result
-                            try:
-                                qualifier = ''
-                                if '<=' in value:
-                                    value = value.replace('<=', '')
-                                    qualifier = "<="
-                                if '<' in value:
-                                    value = value.replace('<', '')
-                                    qualifier = "<"
-                                if '>' in value:
-                                    value = value.replace('>', '')
-                                    qualifier = ">"
-                                date_time = date + timedelta(hours=hour) + date.dst()
-                                if len(value) > 0:
-                                    value = float(value)
-
-                                    transformed_data.append({
-                                        'Parameter': parameter,
-                                        'Site Name': site_name,
-                                        'Date with time': date_time.isoformat(),  # ('%Y-%m-%d %H:%M'),
-                                        'Result': float(value),
-                                        'Qualifier': qualifier,
-                                        'Original Value': result
-                                    })
-                                else:
-                                    transformed_data.append({
-                                        'Parameter': parameter,
-                                        'Site Name': site_name,
-                                        'Date with time': date_time.isoformat(),  # ('%Y-%m-%d %H:%M'),
-                                        'Result': None,
-                                        'Qualifier': qualifier,
-                                        'Original Value': result
-                                    })
-                            except ValueError:
-                                get_dagster_logger().debug(f' "{result}" is not a float')
-                                transformed_data.append({
-                                    'Parameter': parameter,
-                                    'Site Name': site_name,
-                                    'Date with time': date_time.isoformat(),  # ('%Y-%m-%d %H:%M'),
-                                    'Result': None,
-                                    'Qualifier': '',
-                                    'Original Value': result
-                                })
-            else:
-                get_dagster_logger().error(f'get file {file_path} {response.status_code}' )
-
-    # Create DataFrame from transformed data
-    output_df = pd.DataFrame(transformed_data)
+        qualified_empty = np.zeros(len(value), dtype=bool)
+    result = pd.to_numeric(value, errors='coerce')
+    # values like C (calibration) and M (missing) are not numbers, they keep no qualifier
+    not_a_float = result.isna().to_numpy() & ~qualified_empty
+    long_df['Result'] = result
+    long_df['Qualifier'] = np.where(not_a_float, '', qualifier)
+    return long_df[APCD_COLUMNS]
+
+def process_csv_files(file_paths, max_workers=None):
+    ''' downloads the APCD files concurrently, then parses them in the order of file_paths '''
+    if max_workers is None:
+        max_workers = APCD_FETCH_WORKERS
+    with instrumentation.stage('fetch') as stage:
+        files = http_fetch.fetch_texts(file_paths, max_workers=max_workers, per_host=APCD_FETCH_PER_HOST)
+        stage.bytes = sum(len(data) for data in files if data is not None)
+    with instrumentation.stage('parse') as stage:
+        frames = [parse_apcd_file(data) for data in files if data is not None]
+        frames = [f for f in frames if len(f) > 0]
+        if len(frames) > 0:
+            output_df = pd.concat(frames, ignore_index=True)
+        else:
+            output_df = pd.DataFrame()
+        stage.rows = len(output_df)
     output_df['Icons'] = ICONS['beach']
     return output_df
 
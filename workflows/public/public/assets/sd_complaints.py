@@ -4,6 +4,7 @@ from unittest.mock import inplace
 import pytz
 import requests
 import json
+from io import BytesIO
 import pandas as pd
 import geopandas as gpd
 from dagster import ( asset, op,
@@ -12,13 +13,15 @@ from dagster import ( asset, op,
 DailyPartitionsDefinition, define_asset_job,job, RunRequest, schedule,
 AutomationCondition,
 SensorEvaluationContext,AssetCheckSpec,
+in_process_executor,
                       AssetCheckResult,
                       asset_check,
                       AssetCheckExecutionContext
                       )
 from ..utils.constants import ICONS
 from .gis import subregions
-from ..utils import store_assets
+from ..utils import store_assets, spatial, instrumentation
+from ..resources import arcgis
 import datetime
 import pytz
 
@@ -36,6 +39,13 @@ output_path="tijuana/sd_complaints"
 # )
 
 sd_complaints_arcgis_base = "https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/"
+# incremental syncs the records edited or received since the stored watermark, full refetches the layer
+COMPLAINTS_SYNC_MODE = os.environ.get('COMPLAINTS_SYNC_MODE', 'incremental')
+COMPLAINTS_OVERLAP_DAYS = int(os.environ.get('COMPLAINTS_OVERLAP_DAYS', 2))
+complaints_store_path = f"{output_path}/store/complaints.parquet"
+sd_complaints_fields = ','.join(['nature_of_complaint', 'date_received', 'record_number', 'record_status',
+                                 'investigation_outcome', 'response_duration__hours_', 'x_coordinate', 'y_coordinate',
+                                 'cross_street___intersection', 'zip', 'city'])
 
 def dropUnnecessaryColumns(df):
     return df.drop( columns=['response_duration__hours_',
@@ -49,21 +59,94 @@ def dropUnnecessaryColumns(df):
        name="sd_complaints_raw",
        required_resource_keys={"s3"} ,
        automation_condition=AutomationCondition.eager() )
-def get_sd_complaints(context  ) -> str:
-    #sd_complaints_arcgis_base="https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/"
-    sd_complaints_arcgis_action="query"
-    sd_complaints_parmam1="where=1%3D1&objectIds=&time=&geometry=&geometryType=esriGeometryEnvelope&inSR=&spatialRel=esriSpatialRelIntersects&distance=&units=esriSRUnit_Foot&relationParam="
-    sd_complaints_fields= "outFields=nature_of_complaint%2C+date_received%2C+record_number%2C+record_status%2Cinvestigation_outcome%2C+response_duration__hours_%2C+x_coordinate%2C+y_coordinate%2C+cross_street___intersection%2C+zip%2C+city"
-    sd_complaints_parmam2="&returnGeometry=true&maxAllowableOffset=&geometryPrecision=&outSR=&havingClause=&gdbVersion=&historicMoment=&returnDistinctValues=false&returnIdsOnly=false&returnCountOnly=false&returnExtentOnly=false&orderByFields=&groupByFieldsForStatistics=&outStatistics=&returnZ=false&returnM=false&multipatchOption=xyFootprint&resultOffset=&resultRecordCount=&returnTrueCurves=false&returnCentroid=false&timeReferenceUnknownClient=false&sqlFormat=none&resultType=&datumTransformation=&lodType=geohash&lod=&lodSR=&f=geojson"
-    sd_complaints_url=f"{sd_complaints_arcgis_base}/{sd_complaints_arcgis_action}?{sd_complaints_parmam1}&{sd_complaints_fields}&{sd_complaints_parmam2}"
-    sd_complaints_url = "https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/query?where=1%3D1&objectIds=&time=&geometry=&geometryType=esriGeometryEnvelope&inSR=&spatialRel=esriSpatialRelIntersects&distance=&units=esriSRUnit_Foot&relationParam=&outFields=nature_of_complaint%2C+date_received%2C+record_number%2C+record_status%2Cinvestigation_outcome%2C+response_duration__hours_%2C+x_coordinate%2C+y_coordinate%2C+cross_street___intersection%2C+zip%2C+city&returnGeometry=true&maxAllowableOffset=&geometryPrecision=&outSR=&havingClause=&gdbVersion=&historicMoment=&returnDistinctValues=false&returnIdsOnly=false&returnCountOnly=false&returnExtentOnly=false&orderByFields=&groupByFieldsForStatistics=&outStatistics=&returnZ=false&returnM=false&multipatchOption=xyFootprint&resultOffset=&resultRecordCount=&returnTrueCurves=false&returnCentroid=false&timeReferenceUnknownClient=false&sqlFormat=none&resultType=&datumTransformation=&lodType=geohash&lod=&lodSR=&f=geojson&resultOffset=3000"
+def get_sd_complaints(context  ) -> gpd.GeoDataFrame:
     path=f"{output_path}/raw/complaints.json"
     s3_resource = context.resources.s3
-    sd_complaints_response = requests.get(sd_complaints_url)
-    sd_complaints = sd_complaints_response.text
+    layer = arcgis.FeatureLayer(sd_complaints_arcgis_base)
+    store_gdf = read_complaints_store(s3_resource) if COMPLAINTS_SYNC_MODE == 'incremental' else None
+    complaints_gdf, sync = sync_complaints(layer, store_gdf)
+    write_complaints_store(complaints_gdf, s3_resource)
+    complaints_gdf = published_complaints(complaints_gdf, sync['watermark_field'])
+    store_assets.write_geojson(complaints_gdf, path, s3_resource)
+    context.add_output_metadata({'features': len(complaints_gdf), **sync})
+    return complaints_gdf
 
-    s3_resource.putFile_text( sd_complaints, path=path)
-    return sd_complaints
+def read_complaints_store(s3_resource):
+    ''' the persisted GeoParquet copy of the complaints layer, None if it has not been written yet '''
+    try:
+        return gpd.read_parquet(BytesIO(s3_resource.getFile(path=complaints_store_path)))
+    except Exception as e:
+        get_dagster_logger().info(f'complaints store not read {e}')
+        return None
+
+def write_complaints_store(complaints_gdf, s3_resource):
+    buffer = BytesIO()
+    complaints_gdf.to_parquet(buffer, index=False)
+    s3_resource.putFile(buffer.getvalue(), path=complaints_store_path, content_type="application/vnd.apache.parquet")
+
+def complaint_dates(date_received) -> pd.Series:
+    ''' the date column of sd_complaints, date_received is epoch ms of the local time '''
+    return pd.to_datetime(date_received, unit='ms').dt.strftime('%Y-%m-%d')
+
+def watermark_field(layer):
+    ''' the layer's edit date field when editor tracking is on, so edits to older complaints are synced too '''
+    try:
+        edit_fields = layer.info().get('editFieldsInfo') or {}
+    except Exception as e:
+        get_dagster_logger().info(f'complaints layer info {e}')
+        edit_fields = {}
+    return edit_fields.get('editDateField') or 'date_received'
+
+def published_complaints(complaints_gdf, field):
+    ''' the complaints without the edit date field, which is only kept in the store for the watermark '''
+    if field in sd_complaints_fields.split(',') or field not in complaints_gdf.columns:
+        return complaints_gdf
+    return complaints_gdf.drop(columns=field)
+
+def changed_complaints(store_gdf, new_gdf):
+    ''' record numbers in new_gdf that are not in the store, or whose fields differ from the stored record '''
+    key = 'record_number'
+    columns = [c for c in new_gdf.columns if c in store_gdf.columns and c not in (key, 'geometry')]
+    stored = store_gdf.drop_duplicates(key, keep='last').set_index(key)
+    fetched = new_gdf.drop_duplicates(key, keep='last').set_index(key)
+    added = fetched.index.difference(stored.index)
+    common = fetched.index.intersection(stored.index)
+    before = stored.loc[common, columns]
+    after = fetched.loc[common, columns]
+    differs = ((before != after) & ~(before.isna() & after.isna())).any(axis=1)
+    geometry_differs = ~stored.loc[common, 'geometry'].geom_equals(fetched.loc[common, 'geometry'])
+    return added.union(common[(differs | geometry_differs).to_numpy()])
+
+def sync_complaints(layer, store_gdf):
+    ''' complaints layer merged into the store. Returns the merged GeoDataFrame and the sync metadata,
+    changed_dates lists the complaint dates whose records were added or changed '''
+    field = watermark_field(layer)
+    out_fields = sd_complaints_fields if field in sd_complaints_fields.split(',') else f'{sd_complaints_fields},{field}'
+    if store_gdf is None or len(store_gdf) == 0 or field not in store_gdf.columns:
+        complaints_gdf = layer.features(out_fields=out_fields)
+        return complaints_gdf, {'sync_mode': 'full', 'watermark_field': field, 'fetched': len(complaints_gdf)}
+    # refetch an overlap before the watermark, records can be revised shortly after they are received
+    since = pd.to_datetime(store_gdf[field].max(), unit='ms') - pd.Timedelta(days=COMPLAINTS_OVERLAP_DAYS)
+    where = f"{field} >= TIMESTAMP '{since.strftime('%Y-%m-%d %H:%M:%S')}'"
+    new_gdf = layer.features(where=where, out_fields=out_fields)
+    if len(new_gdf) == 0:
+        # an empty query result has only a geometry column
+        new_gdf = store_gdf.iloc[:0]
+    changed = changed_complaints(store_gdf, new_gdf)
+    merged = pd.concat([store_gdf, new_gdf], ignore_index=True).drop_duplicates('record_number', keep='last')
+    merged = merged.sort_values('date_received', kind='stable').reset_index(drop=True)
+    # deleted records are not returned by an incremental query, a count that does not match means a full sync
+    layer_count = layer.count()
+    if layer_count != len(merged):
+        get_dagster_logger().info(f'complaints layer has {layer_count} records, merged store {len(merged)}, full sync')
+        complaints_gdf = layer.features(out_fields=out_fields)
+        return complaints_gdf, {'sync_mode': 'full', 'watermark_field': field, 'fetched': len(complaints_gdf)}
+    previous = store_gdf[store_gdf['record_number'].isin(changed)]
+    current = new_gdf[new_gdf['record_number'].isin(changed)]
+    changed_dates = set(complaint_dates(previous['date_received'])) | set(complaint_dates(current['date_received']))
+    get_dagster_logger().info(f'complaints since {since} fetched {len(new_gdf)} changed {len(changed)} dates {sorted(changed_dates)}')
+    return merged, {'sync_mode': 'incremental', 'watermark_field': field, 'fetched': len(new_gdf), 'changed_records': len(changed),
+                    'changed_dates': sorted(changed_dates)}
 
 @asset(group_name="tijuana",key_prefix="complaints",
        name="sd_complaints",
@@ -79,12 +162,15 @@ def sd_complaints(context):
     source_url='https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/'
     metadata = store_assets.objectMetadata(name=name,description=description, source_url=source_url)
     s3_resource = context.resources.s3
-    json_txt = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints_raw"]))
-    featueres = json.loads(json_txt)
-    complaints_gdf = gpd.GeoDataFrame.from_features(featueres)
+    raw = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints_raw"]))
+    if isinstance(raw, str):
+        # geojson text stored before sd_complaints_raw returned a GeoDataFrame
+        complaints_gdf = gpd.GeoDataFrame.from_features(json.loads(raw))
+    else:
+        complaints_gdf = raw
     complaints_gdf['datetime'] = pd.to_datetime(complaints_gdf['date_received'], unit='ms')
     complaints_gdf['datetime']=complaints_gdf['datetime'].dt.tz_localize('US/Pacific')
-    complaints_gdf['date'] = complaints_gdf['datetime'].dt.strftime('%Y-%m-%d')
+    complaints_gdf['date'] = complaint_dates(complaints_gdf['date_received'])
     complaints_gdf.dropna(how='any', subset=['x_coordinate', 'y_coordinate','geometry'], inplace=True)
     complaints_gdf= complaints_gdf[(complaints_gdf['x_coordinate']!=0) | (complaints_gdf['y_coordinate']!=0)]
     complaints_gdf['Icons'] = ICONS['beach']
@@ -148,7 +234,7 @@ def sd_complaints_freshness_check(context: AssetCheckExecutionContext, sd_compla
 
 @asset(group_name="tijuana", key_prefix="complaints",
        name="sd_complaints_90_days",
-       required_resource_keys={"s3"},
+       required_resource_keys={"s3", "asset_cache"},
        deps=[AssetKey(["complaints", "sd_complaints"])]
     ,
        automation_condition=AutomationCondition.eager())
@@ -161,16 +247,17 @@ def sd_complaints_90_days(context):
     source_url = 'https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/'
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
     s3_resource = context.resources.s3
-    complaints_gdf = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints"]))
-    complaints_90_gdf = complaints_gdf[complaints_gdf['datetime']> datestart.strftime('%Y-%m-%d')]
+    complaints_gdf = context.resources.asset_cache.load(context, AssetKey([f"complaints", "sd_complaints"]))
+    # datetime is tz aware, or iso strings in values stored before fix_col_types stopped converting in place
+    complaints_90_gdf = complaints_gdf[pd.to_datetime(complaints_gdf['datetime'], utc=True) >= pd.Timestamp(datestart).normalize()]
     complaints_90_gdf= dropUnnecessaryColumns(complaints_90_gdf)
     filename = f"{output_path}/output/latest/complaints"
     store_assets.geodataframe_to_s3(complaints_90_gdf, filename, s3_resource, metadata=metadata)
-
+    context.add_output_metadata(context.resources.asset_cache.cache_stats())
     return complaints_90_gdf
 @asset(group_name="tijuana",key_prefix="complaints",
        name="sd_complaints_summary",
-       required_resource_keys={"s3"},
+       required_resource_keys={"s3", "asset_cache"},
        deps=[AssetKey(["complaints","sd_complaints"])],
 
  automation_condition = AutomationCondition.eager()
@@ -183,15 +270,54 @@ def sd_complaints_summary(context):
     source_url = 'https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/'
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
     s3_resource = context.resources.s3
-    complaints_gdf = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints"]))
-    complaint_groupby_date = complaints_gdf[complaints_gdf['nature_of_complaint'] == 'Odor'].groupby(
+    complaints_gdf = context.resources.asset_cache.load(context, AssetKey([f"complaints", "sd_complaints"]))
+    odor_gdf = complaints_gdf[complaints_gdf['nature_of_complaint'] == 'Odor']
+    changed_dates, raw_storage_id = summary_changed_dates(context)
+    previous = None
+    if changed_dates is not None:
+        try:
+            previous = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints_summary"]))
+        except Exception as e:
+            get_dagster_logger().info(f'no previous complaints summary {e}')
+    if previous is not None:
+        # only the dates with added or changed complaints are counted again
+        odor_gdf = odor_gdf[odor_gdf['date'].isin(changed_dates)]
+    complaint_groupby_date = odor_gdf.groupby(
         by=['date', 'nature_of_complaint'],  as_index=False).agg(count=('date_received', 'count'))
     complaint_groupby_date['Icon'] = 'pin'
+    if previous is not None:
+        complaint_groupby_date = pd.concat([previous[~previous['date'].isin(changed_dates)], complaint_groupby_date],
+                                           ignore_index=True).sort_values(by=['date', 'nature_of_complaint']).reset_index(drop=True)
+    context.add_output_metadata({'raw_storage_id': raw_storage_id,
+                                 'changed_dates': sorted(changed_dates) if previous is not None else 'all',
+                                 **context.resources.asset_cache.cache_stats()})
 
     filename = f"{output_path}/output/complaints_by_date"
     store_assets.dataframe_to_s3(complaint_groupby_date, filename, s3_resource, metadata=metadata)
     return complaint_groupby_date
 
+def summary_changed_dates(context, limit=20):
+    ''' complaint dates changed by the sd_complaints_raw materializations the summary has not counted yet.
+    Returns (dates or None when the summary has to be counted in full, storage id of the latest raw materialization) '''
+    raw_key = AssetKey(["complaints", "sd_complaints_raw"])
+    records = context.instance.fetch_materializations(raw_key, limit=limit).records
+    if len(records) == 0:
+        return None, None
+    newest = records[0].storage_id
+    counted = latest_metadata_value(context, AssetKey(["complaints", "sd_complaints_summary"]), 'raw_storage_id')
+    if counted is None:
+        return None, newest
+    dates = set()
+    for record in records:
+        if record.storage_id <= counted:
+            return dates, newest
+        raw_metadata = record.asset_materialization.metadata
+        if 'sync_mode' not in raw_metadata or raw_metadata['sync_mode'].value != 'incremental':
+            return None, newest
+        dates.update(raw_metadata['changed_dates'].value)
+    # more unseen materializations than the limit
+    return None, newest
+
 @asset(group_name="tijuana",key_prefix="complaints",
        name="sd_complaints_latest_bydate",
        required_resource_keys={"s3"},
@@ -208,9 +334,22 @@ def sd_complaints_latest_bydate(context):
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
 
     s3_resource = context.resources.s3
+    start = datetime.datetime.now() - datetime.timedelta(days=90)
+    window_start = start.strftime('%Y-%m-%d')
+    changed_dates = latest_changed_dates(context, AssetKey([f"complaints", "sd_complaints_summary"]))
+    if changed_dates is not None:
+        changed_dates = [d for d in changed_dates if d >= window_start]
+    context.add_output_metadata({'window_start': window_start,
+                                 'changed_dates': changed_dates if changed_dates is not None else 'all'})
+    if changed_dates is not None and len(changed_dates) == 0 and \
+            latest_metadata_value(context, AssetKey([f"complaints", "sd_complaints_latest_bydate"]), 'window_start') == window_start:
+        try:
+            # same window and no changed dates in it, the published files are current
+            return context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints_latest_bydate"]))
+        except Exception as e:
+            get_dagster_logger().info(f'no previous complaints_latest_bydate {e}')
     complaints_gdf = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints_summary"]))
     complaints_gdf['datetime'] = pd.to_datetime(complaints_gdf['date'], )
-    start = datetime.datetime.now() - datetime.timedelta(days=90)
     complaint_last_90 = complaints_gdf[complaints_gdf['datetime'] >= start]
     complaint_last_90['Icon'] = 'pin'
     complaint_last_90.drop(columns=['datetime'], inplace=True)
@@ -218,78 +357,88 @@ def sd_complaints_latest_bydate(context):
     store_assets.dataframe_to_s3(complaint_last_90, filename, s3_resource, metadata=metadata)
     return complaint_last_90
 
-@asset(group_name="tijuana",key_prefix="complaints",
-       name="sd_complaints_by_subregional",
-       required_resource_keys={"s3"},
-       deps=[AssetKey(["complaints","sd_complaints"]), AssetKey(["gis","subregional_areas"])]
-       , automation_condition=AutomationCondition.eager() )
-
-def sd_complaints_spatial_subregional(context):
-    name = 'complaints_by_subregional'
-    description = '''Complaints with joined with census subregional areas  
-     the from San Diego Air Pollution Control District Complaints ArcGIS service
-        '''
-    source_url = 'https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/'
-    metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
-
-    s3_resource = context.resources.s3
-    complaints_gdf = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints"]))
-    geo_gdf = context.repository_def.load_asset_value(AssetKey([f"gis", "subregional_areas"]))
-
-    complaint_with_tract_gdf = gpd.sjoin(
-        geo_gdf,
-        complaints_gdf,
-        how='left',
-        predicate='contains'
-    )
-    complaint_with_tract_gdf.dropna(how='any', subset=['x_coordinate', 'y_coordinate'], inplace=True)
-    complaint_with_tract_gdf.reset_index(inplace=True)
-    filename = f"{output_path}/output/complaints_with_subregional"
-    store_assets.geodataframe_to_s3(complaint_with_tract_gdf.drop('geometry', axis='columns'), filename, s3_resource, metadata=metadata)
-
-    complaint_by_tract = complaint_with_tract_gdf[complaint_with_tract_gdf['nature_of_complaint'] == 'Odor'].groupby(
-        by=['sra', 'date', 'nature_of_complaint', 'geometry','name','globalid'], as_index=False).agg(count=('date', 'count'))
-    complaint_by_tract['Icon'] = 'pin'
-    complaint_with_tract_gdf=gpd.GeoDataFrame(complaint_by_tract)
-    filename = f"{output_path}/output/complaints_by_tract"
-    store_assets.geodataframe_to_s3(complaint_with_tract_gdf, filename, s3_resource)
-    return complaint_with_tract_gdf
+def latest_metadata_value(context, asset_key, key):
+    ''' a metadata value of the latest materialization of asset_key, None if there is none '''
+    event = context.instance.get_latest_materialization_event(asset_key)
+    if event is None or event.asset_materialization is None:
+        return None
+    value = event.asset_materialization.metadata.get(key)
+    return value.value if value is not None else None
+
+def latest_changed_dates(context, asset_key):
+    ''' changed_dates recorded by the latest materialization, None when it was counted in full '''
+    changed_dates = latest_metadata_value(context, asset_key, 'changed_dates')
+    return changed_dates if isinstance(changed_dates, list) else None
+
+# boundary layers complaints are counted by: asset of the layer, id column, columns kept in the geojson layer
+complaint_geographies = {
+    'tract': {'asset': AssetKey(["gis", "tracts"]), 'id': 'tract', 'columns': ['tract']},
+    'subregional': {'asset': AssetKey(["gis", "subregional_areas"]), 'id': 'sra', 'columns': ['sra', 'name', 'globalid']},
+}
 
 @asset(group_name="tijuana",key_prefix="complaints",
-       name="sd_complaints_by_tract",
-       required_resource_keys={"s3"},
-       deps=[AssetKey(["complaints","sd_complaints"]), AssetKey(["gis","tracts"])]
+       name="sd_complaints_by_geography",
+       required_resource_keys={"s3", "asset_cache"},
+       deps=[AssetKey(["complaints","sd_complaints"])] + [g['asset'] for g in complaint_geographies.values()]
        , automation_condition=AutomationCondition.eager() )
 
-def sd_complaints_spatial_tract(context):
-    name = 'complaints_with_tract'
-    description = '''Complaints with joined with census tracts areas  
-     the from San Diego Air Pollution Control District Complaints ArcGIS service
+def sd_complaints_by_geography(context):
+    '''
+    Daily complaint counts for every boundary layer in complaint_geographies.
+    The complaints are loaded once and assigned to each layer with its boundary index, writes
+    complaints_with_<geography> (complaint points with the boundary attributes, geojson and csv),
+    complaints_by_<geography> (odor complaints per boundary and date, geojson layer for the map)
+    and complaints_by_geography (tidy table of geography, boundary_id, date, nature_of_complaint, count)
+    '''
+    instrumentation.begin()
+    name = 'complaints_by_geography'
+    description = '''Daily complaint counts by census tract and subregional area 
+     from the San Diego Air Pollution Control District Complaints ArcGIS service
         '''
     source_url = 'https://gis-public.sandiegocounty.gov/arcgis/rest/services/Hosted/SDAPCD_Complaints/FeatureServer/0/'
+    s3_resource = context.resources.s3
+    complaints_gdf = context.resources.asset_cache.load(context, AssetKey([f"complaints", "sd_complaints"]))
+    complaints_gdf = complaints_gdf.dropna(how='any', subset=['x_coordinate', 'y_coordinate'])
+
+    counts = []
+    counts_metadata = {}
+    for geography, layer in complaint_geographies.items():
+        geo_gdf = context.resources.asset_cache.load(context, layer['asset'])
+        with instrumentation.stage('spatial_join') as stage:
+            index = spatial.BoundaryIndex(geo_gdf)
+            complaints_df = index.join(complaints_gdf, geometry=True)
+            stage.rows = len(complaints_df)
+        metadata = store_assets.objectMetadata(name=f'complaints_with_{geography}', source_url=source_url,
+                                               description=f"Complaints joined with {geography} areas")
+        store_assets.geodataframe_to_s3(complaints_df.drop(columns=spatial.BOUNDARY),
+                                        f"{output_path}/output/complaints_with_{geography}", s3_resource, metadata=metadata)
+
+        by_boundary = complaints_by_boundary(complaints_df, layer['columns'])
+        odor_gdf = index.attach_geometry(by_boundary[by_boundary['nature_of_complaint'] == 'Odor'].reset_index(drop=True))
+        odor_gdf = odor_gdf[[layer['id'], 'date', 'nature_of_complaint', 'geometry', *layer['columns'][1:], 'count']]
+        odor_gdf['Icon'] = 'pin'
+        store_assets.geodataframe_to_s3(odor_gdf, f"{output_path}/output/complaints_by_{geography}", s3_resource)
+
+        tidy = by_boundary[[layer['id'], 'date', 'nature_of_complaint', 'count']].rename(columns={layer['id']: 'boundary_id'})
+        tidy.insert(0, 'geography', geography)
+        counts.append(tidy)
+        counts_metadata[f'{geography}_complaints'] = len(complaints_df)
+        counts_metadata[f'{geography}_boundaries'] = int(by_boundary[spatial.BOUNDARY].nunique())
+
+    counts_df = pd.concat(counts, ignore_index=True)
+    counts_df['boundary_id'] = counts_df['boundary_id'].astype(str)
     metadata = store_assets.objectMetadata(name=name, description=description, source_url=source_url)
+    store_assets.dataframe_to_s3(counts_df, f"{output_path}/output/{name}", s3_resource, metadata=metadata)
+    context.add_output_metadata({'num_records': len(counts_df), **counts_metadata,
+                                 **context.resources.asset_cache.cache_stats(), **instrumentation.stage_metadata()})
+    return counts_df
+
+def complaints_by_boundary(complaints_df, boundary_columns) -> pd.DataFrame:
+    ''' count of complaints per boundary, date and nature of complaint, grouped on the boundary position
+    rather than on the polygon, which spatial.BoundaryIndex.attach_geometry adds back '''
+    return complaints_df.groupby(by=[spatial.BOUNDARY, *boundary_columns, 'date', 'nature_of_complaint'],
+                                 as_index=False).agg(count=('date', 'count'))
 
-    s3_resource = context.resources.s3
-    complaints_gdf = context.repository_def.load_asset_value(AssetKey([f"complaints", "sd_complaints"]))
-    geo_gdf = context.repository_def.load_asset_value(AssetKey([f"gis", "tracts"]))
-    complaint_with_tract_gdf = gpd.sjoin(
-        geo_gdf,
-        complaints_gdf,
-        how='left',
-        predicate='contains'
-    )
-    complaint_with_tract_gdf=complaint_with_tract_gdf.dropna(how='any', subset=['x_coordinate', 'y_coordinate'])
-    complaint_with_tract_gdf.reset_index(inplace=True)
-    filename = f"{output_path}/output/complaints_with_tract"
-    store_assets.geodataframe_to_s3(complaint_with_tract_gdf.drop('geometry', axis='columns'), filename, s3_resource, metadata=metadata)
-
-    complaint_by_tract = complaint_with_tract_gdf[complaint_with_tract_gdf['nature_of_complaint'] == 'Odor'].groupby(
-        by=['tract','date', 'nature_of_complaint','geometry'],  as_index=False).agg(count=('date', 'count'))
-    complaint_by_tract['Icon'] = 'pin'
-    complaint_with_tract_gdf = gpd.GeoDataFrame(complaint_by_tract)
-    filename = f"{output_path}/output/complaints_by_tract"
-    store_assets.geodataframe_to_s3(complaint_with_tract_gdf, filename, s3_resource)
-    return complaint_with_tract_gdf
 # @job()
 # def complaints_daily_job():
 #     sd_complaints(get_sd_complaints())
@@ -297,9 +446,14 @@ def sd_complaints_spatial_tract(context):
 complaints_sensor_job = define_asset_job(
     "complaints_sensor", selection=[
         AssetKey(["complaints", "sd_complaints_raw"]),
-        #AssetKey(["complaints", "sd_complaints"]),  # maybe we do not need this
-
-    ]
+        AssetKey(["complaints", "sd_complaints"]),
+        AssetKey(["complaints", "sd_complaints_90_days"]),
+        AssetKey(["complaints", "sd_complaints_summary"]),
+        AssetKey(["complaints", "sd_complaints_latest_bydate"]),
+        AssetKey(["complaints", "sd_complaints_by_geography"]),
+    ],
+    # the chain runs in one process, so the readers of sd_complaints share one load through asset_cache
+    executor_def=in_process_executor,
 )
 # weekly updates seem to happen at 8 am, so lets check at 8:30.
 # need to do an arcgis sensor to check use the layer /metadata, that will return xml
@@ -1,33 +1,112 @@
-
 import requests
-import json
-from pyproj import Transformer
-import minio
+import pandas as pd
+import geopandas as gpd
+from dagster import get_dagster_logger
 
-def getGeojson(host, org_id,layer_name,layer_id, s3bucket="public", s3path="public", auth=None):
+from ..utils import http_fetch
+
+'''
+Client for ArcGIS FeatureServer layers.
+A query first asks for the object ids that match (returnIdsOnly), then fetches the features in pages of object ids,
+several pages at a time, and converts each page to a GeoDataFrame as it arrives. A layer never silently stops at the
+service maxRecordCount, and only a window of page responses is held in memory at once.
+'''
+
+DEFAULT_PAGE_SIZE = 1000  # the ArcGIS default maxRecordCount
+DEFAULT_WORKERS = 4
+
+
+class ArcGISError(Exception):
+    pass
+
+
+def _check(response, url):
+    if response is None:
+        raise ArcGISError(f"arcgis query {url} failed")
+    if response.status_code != 200:
+        raise ArcGISError(f"arcgis query {url} {response.status_code} {response.text[:200]}")
+    result = response.json()
+    # the rest api reports errors with a 200 status
+    if 'error' in result:
+        raise ArcGISError(f"arcgis query {url} {result['error']}")
+    return result
 
-    if org_id is None:
-        # https://geo.sandag.org/server/rest/services/Hosted/Sewer_Main_SD/FeatureServer
-        url = "https://{host}/server/rest/services/{layer_name}/FeatureServer/{layer_id}/query"
-    else:
-        url = "https://{host}/{org_id}/arcgis/rest/services/{layer_name}/FeatureServer/{layer_id}/query"
-    params = {
-        'where': '1=1',
-        'outSR': '4326',  # Request WGS84
-        'f': 'geojson'
-    }
 
-    # Step 2: Request the data
-    response = requests.get(url, params=params)
-    geojson_data = response.json()
+class FeatureLayer:
+    ''' a FeatureServer layer, eg https://geo.sandag.org/server/rest/services/Hosted/Subregional_Areas_2020/FeatureServer/0 '''
 
-    # Step 3: Convert CRS to WGS84 (if needed, here it's not needed as outSR=4326)
-    # If transformation was needed, you could use pyproj like this:
-    # transformer = Transformer.from_crs("EPSG:your_input_crs", "EPSG:4326")
+    def __init__(self, layer_url, page_size=None, max_workers=DEFAULT_WORKERS, timeout=http_fetch.DEFAULT_TIMEOUT):
+        self.layer_url = layer_url.rstrip('/')
+        self.query_url = f"{self.layer_url}/query"
+        self._page_size = page_size
+        self.max_workers = max_workers
+        self.timeout = timeout
 
-    # You can save the GeoJSON or process it further
-    with open('data_wgs84.geojson', 'w') as f:
-        json.dump(geojson_data, f)
+    def _query(self, params):
+        # POST, since a where clause or a page of object ids can be longer than a GET url allows
+        with http_fetch.retry_session() as session:
+            response = session.post(self.query_url, data=params, timeout=self.timeout)
+        return _check(response, self.query_url)
+
+    def info(self) -> dict:
+        ''' the layer description, fields, maxRecordCount, editingInfo ... '''
+        with http_fetch.retry_session() as session:
+            response = session.get(self.layer_url, params={'f': 'json'}, timeout=self.timeout)
+        return _check(response, self.layer_url)
+
+    def page_size(self) -> int:
+        if self._page_size is None:
+            try:
+                self._page_size = int(self.info().get('maxRecordCount', DEFAULT_PAGE_SIZE))
+            except (ArcGISError, requests.RequestException, ValueError) as ex:
+                get_dagster_logger().warning(f"arcgis layer info {self.layer_url} {ex}, using pages of {DEFAULT_PAGE_SIZE}")
+                self._page_size = DEFAULT_PAGE_SIZE
+        return self._page_size
+
+    def count(self, where='1=1') -> int:
+        return int(self._query({'where': where, 'returnCountOnly': 'true', 'f': 'json'})['count'])
+
+    def object_ids(self, where='1=1') -> list:
+        result = self._query({'where': where, 'returnIdsOnly': 'true', 'f': 'json'})
+        return sorted(result.get('objectIds') or [])
+
+    def features(self, where='1=1', out_fields='*', out_sr=4326, return_geometry=True) -> gpd.GeoDataFrame:
+        ''' all the features matching where as a GeoDataFrame in object id order '''
+        ids = self.object_ids(where)
+        page_size = self.page_size()
+        get_dagster_logger().info(f"arcgis {self.layer_url} {len(ids)} features in pages of {page_size}")
+        pages = [ids[i:i + page_size] for i in range(0, len(ids), page_size)]
+        page_requests = [{'method': 'POST', 'url': self.query_url,
+                          'data': {'objectIds': ','.join(str(i) for i in page),
+                                   'outFields': out_fields,
+                                   'returnGeometry': 'true' if return_geometry else 'false',
+                                   'outSR': out_sr,
+                                   'f': 'geojson'}}
+                         for page in pages]
+        frames = []
+        # a window of pages in flight, each page is converted before the next window is fetched
+        window = max(1, self.max_workers * 2)
+        for start in range(0, len(page_requests), window):
+            responses = http_fetch.fetch_all(page_requests[start:start + window],
+                                             max_workers=self.max_workers, per_host=self.max_workers, timeout=self.timeout)
+            for response in responses:
+                page = _check(response, self.query_url)
+                frames.append(gpd.GeoDataFrame.from_features(page['features'], crs=f'EPSG:{out_sr}'))
+        if len(frames) == 0:
+            return gpd.GeoDataFrame(geometry=[], crs=f'EPSG:{out_sr}')
+        gdf = pd.concat(frames, ignore_index=True)
+        if len(gdf) != len(ids):
+            raise ArcGISError(f"arcgis {self.layer_url} returned {len(gdf)} of {len(ids)} features")
+        return gdf
+
+
+def layer_url(host, org_id, layer_name, layer_id):
+    if org_id is None:
+        # https://geo.sandag.org/server/rest/services/Hosted/Sewer_Main_SD/FeatureServer
+        return f"https://{host}/server/rest/services/{layer_name}/FeatureServer/{layer_id}"
+    return f"https://{host}/{org_id}/arcgis/rest/services/{layer_name}/FeatureServer/{layer_id}"
 
-    print("GeoJSON data saved as data_wgs84.geojson")
 
+def getGeojson(host, org_id, layer_name, layer_id, s3bucket="public", s3path="public", auth=None) -> gpd.GeoDataFrame:
+    ''' all features of a layer in WGS84 '''
+    return FeatureLayer(layer_url(host, org_id, layer_name, layer_id)).features(out_sr=4326)
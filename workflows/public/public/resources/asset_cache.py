@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from dagster import get_dagster_logger, ConfigurableResource, AssetKey
+from pydantic import Field, PrivateAttr
+
+
+class ResourceWithAssetCacheConfiguration(ConfigurableResource):
+    ASSET_CACHE_MAX_ENTRIES: int = Field(
+        default=8, description="Upstream values kept in memory, least recently used are dropped first")
+    ASSET_CACHE_TTL_SECONDS: int = Field(
+        default=900, description="Seconds a cached value is handed out before it is loaded again")
+
+
+class AssetCacheResource(ResourceWithAssetCacheConfiguration):
+    '''
+    In process cache of upstream asset values, for assets that read the same upstream with
+    context.repository_def.load_asset_value, eg the complaints chain reading sd_complaints.
+    The value is unpickled from the IO manager once per materialization of the upstream and
+    shared by the assets that run in the same process, so a job of readers should use the in_process_executor
+    (eg complaints_sensor_job). With the multiprocess executor every step is its own process and every load a miss.
+    DataFrames are handed out as shallow copies: adding, replacing or dropping columns and rows is fine,
+    changing values in place (df.loc[...] = ...) would change the cached value.
+    '''
+    # asset key -> (materialization id, loaded at, value), in least recently used order
+    _entries: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _lock: object = PrivateAttr(default_factory=threading.RLock)
+    _stats: dict = PrivateAttr(default_factory=lambda: {'hits': 0, 'misses': 0})
+
+    def _materialization_id(self, context, asset_key):
+        ''' identifies the latest materialization, so a new materialization is never served from the cache '''
+        try:
+            event = context.instance.get_latest_materialization_event(asset_key)
+        except Exception as ex:
+            get_dagster_logger().debug(f"asset cache no materialization for {asset_key.to_user_string()} {ex}")
+            return None
+        if event is None:
+            return None
+        return (event.run_id, event.timestamp)
+
+    def load(self, context, asset_key: AssetKey):
+        ''' the value of asset_key, loaded with context.repository_def.load_asset_value on a miss '''
+        key = asset_key.to_user_string()
+        materialization_id = self._materialization_id(context, asset_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_id, loaded_at, value = entry
+                fresh = time.monotonic() - loaded_at < self.ASSET_CACHE_TTL_SECONDS
+                if fresh and materialization_id is not None and cached_id == materialization_id:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    get_dagster_logger().info(f"asset cache hit {key}")
+                    return view(value)
+                del self._entries[key]
+            self._stats['misses'] += 1
+            value = context.repository_def.load_asset_value(asset_key)
+            get_dagster_logger().info(f"asset cache loaded {key}")
+            if materialization_id is not None:
+                self._entries[key] = (materialization_id, time.monotonic(), value)
+                while len(self._entries) > self.ASSET_CACHE_MAX_ENTRIES:
+                    self._entries.popitem(last=False)
+            return view(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cache_stats(self, reset=True) -> dict:
+        ''' counts since the last call, for asset metadata, eg context.add_output_metadata(asset_cache.cache_stats()) '''
+        with self._lock:
+            stats = {f'asset_cache_{k}': v for k, v in self._stats.items()}
+            if reset:
+                for key in self._stats:
+                    self._stats[key] = 0
+            return stats
+
+
+def view(value):
+    ''' shallow copy, so callers changing columns or dropping rows do not change the cached value '''
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    return value
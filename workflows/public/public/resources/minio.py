@@ -1,8 +1,17 @@
 from dagster import asset, get_dagster_logger, define_asset_job, ConfigurableResource
 from minio import Minio
 import io
+import os
+import hashlib
+import socket
+import threading
+import certifi
+import urllib3
+from urllib3.connection import HTTPConnection
 #from dagster import Field
-from pydantic import Field,ConfigDict
+from pydantic import Field,ConfigDict, PrivateAttr
+
+from ..utils import instrumentation
 
 
 def PythonMinioAddress(url, port=None):
@@ -14,6 +23,37 @@ def PythonMinioAddress(url, port=None):
         PYTHON_MINIO_URL = f"{PYTHON_MINIO_URL}:{port}"
     return PYTHON_MINIO_URL
 
+MiB = 1024 * 1024
+
+class IterableReader(io.RawIOBase):
+    ''' file-like read() over an iterator of bytes or str chunks, for putFile_stream '''
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes_read += len(data)
+        return data
+
+# user metadata key holding the digest of the content that was uploaded
+DIGEST_METADATA = "content-digest"
+def content_digest(data) -> str:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.md5(data).hexdigest()
 
 
 
@@ -32,9 +72,22 @@ class ResourceWithS3Configuration(ConfigurableResource):
         description="S3_ACCESS_KEY")
     S3_SECRET_KEY: str = Field(
         description="S3_SECRET_KEY")
+    S3_SKIP_UNCHANGED: bool = Field(
+        default=True, description="Skip uploads when the object already holds the same content")
+    S3_POOL_SIZE: int = Field(
+        default=10, description="Connections kept open to the S3 host, shared by all threads of a run")
+    S3_KEEPALIVE: bool = Field(
+        default=True, description="Enable TCP keep-alive on pooled connections")
+    S3_PART_SIZE: int = Field(
+        default=16 * MiB, ge=5 * MiB, description="Part size of multipart uploads, at least 5MiB")
     ## https://docs.dagster.io/_apidocs/libraries/dagster-a
 
 class S3Resource(ResourceWithS3Configuration):
+    # path -> digest of what is known to be stored, so repeated writes in a run do not need a HEAD
+    _digests: dict = PrivateAttr(default_factory=dict)
+    # one client (and connection pool) for the lifetime of the resource, created on first use
+    _client: object = PrivateAttr(default=None)
+    _client_lock: object = PrivateAttr(default_factory=threading.Lock)
 
     def MinioOptions(self):
         return  {"secure": self.S3_USE_SSL
@@ -42,8 +95,30 @@ class S3Resource(ResourceWithS3Configuration):
             , "access_key":  self.S3_ACCESS_KEY
             , "secret_key": self.S3_SECRET_KEY
                          }
+    def httpClient(self) -> urllib3.PoolManager:
+        ''' pooled http client for Minio, same timeouts and retries as the minio default with a configurable pool size '''
+        socket_options = list(HTTPConnection.default_socket_options)
+        if self.S3_KEEPALIVE:
+            socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        timeout = 300
+        return urllib3.PoolManager(
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            maxsize=self.S3_POOL_SIZE,
+            block=False,
+            socket_options=socket_options,
+            cert_reqs='CERT_REQUIRED',
+            ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
+
     def getClient(self):
-        return     Minio(PythonMinioAddress(self.S3_ADDRESS, self.S3_PORT), self.S3_ACCESS_KEY, self.S3_SECRET_KEY)
+        ''' the Minio client is thread safe, so it is created once and shared '''
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = Minio(PythonMinioAddress(self.S3_ADDRESS, self.S3_PORT), self.S3_ACCESS_KEY, self.S3_SECRET_KEY,
+                                         http_client=self.httpClient())
+        return self._client
 
 ## https://docs.dagster.io/_apidocs/libraries/dagster-aws#s3
 #   fields from dagster_aws.s3.S3Resource
@@ -60,27 +135,96 @@ class S3Resource(ResourceWithS3Configuration):
         )
         return result["Contents"]
     def getFile(self, path='test'):
+        ''' returns the bytes of the object at path, raises if it does not exist '''
         try:
-            result =   self.getClient().get_object(
-                Bucket=self.S3_BUCKET,
-                Key=path,
-            )
+            with instrumentation.stage('s3_download') as stage:
+                result =   self.getClient().get_object(
+                    self.S3_BUCKET, path
+                )
+                try:
+                    data = result.read()
+                finally:
+                    result.close()
+                    result.release_conn()
+                stage.bytes = len(data)
             get_dagster_logger().info(
-                f"file {result['Body']}" )
-            return result["Body"]
+                f"file {path} {len(data)} bytes" )
+            return data
         except Exception as ex:
             get_dagster_logger().info(f"file {path} not found  in {self.S3_BUCKET} at {self.S3_ADDRESS} {ex}")
             raise Exception(f"file {path} not found  in {self.S3_BUCKET} at {self.S3_ADDRESS} {ex}")
 
+    def isUnchanged(self, path, digest, etag_comparable=True) -> bool:
+        ''' True when the object at path already holds content with this digest.
+        The digest is compared to the one recorded in the object metadata, or to the ETag, which is the md5 of a
+        single part upload '''
+        if self._digests.get(path) == digest:
+            return True
+        try:
+            stat = self.getClient().stat_object(self.S3_BUCKET, path)
+        except Exception as ex:
+            get_dagster_logger().debug(f"file {path} not in {self.S3_BUCKET} {ex}")
+            return False
+        stored_digest = stat.metadata.get(f"x-amz-meta-{DIGEST_METADATA}") if stat.metadata is not None else None
+        if stored_digest == digest or (etag_comparable and stat.etag == digest):
+            self._digests[path] = digest
+            return True
+        return False
+
+    def exists(self, path) -> bool:
+        ''' True when there is an object at path '''
+        try:
+            self.getClient().stat_object(self.S3_BUCKET, path)
+            return True
+        except Exception as ex:
+            get_dagster_logger().debug(f"file {path} not in {self.S3_BUCKET} {ex}")
+            return False
+
+    def _count(self, key, length):
+        # counted in the instrumentation totals of the asset, the resource is shared by the steps of a run
+        instrumentation.count(f's3_{key}')
+        instrumentation.count(f's3_bytes_{key}', length)
+
+    def upload_stats(self, reset=True) -> dict:
+        ''' counts since the last call, for asset metadata, eg context.add_output_metadata(s3_resource.upload_stats()) '''
+        return instrumentation.counts(['s3_uploaded', 's3_skipped', 's3_bytes_uploaded', 's3_bytes_skipped'], reset)
+
 # note metadata is S3 metadata not JSONLD metadata
-    def putFile_text(self, data, metadata={}, path='test'):
+    def putFile(self, data:bytes, metadata={}, path='test', content_type="application/octet-stream", digest=None):
+        ''' digest identifies the content for skipping unchanged uploads. By default it is the md5 of data,
+        pass a digest of the content without volatile parts (eg a lastUpdated stamp) to skip those too.
+        A skipped object is left as it is, volatile parts included, so its lastUpdated is the time its content
+        last changed (as is the object Last-Modified), not the time of the last run '''
+        etag_comparable = digest is None
+        if digest is None:
+            digest = content_digest(data)
+        return self._put(io.BytesIO(data), len(data), metadata, path, content_type, digest, etag_comparable)
+
+    def putFile_stream(self, stream, length=-1, metadata={}, path='test', content_type="application/octet-stream", digest=None):
+        ''' upload from a file-like object (or an iterator of bytes) without holding it in memory.
+        Objects larger than S3_PART_SIZE, or of unknown length (-1), are sent as a multipart upload.
+        Unchanged content is only skipped when a digest is given, since the stream cannot be read twice '''
+        if not hasattr(stream, 'read'):
+            stream = IterableReader(stream)
+        return self._put(stream, length, metadata, path, content_type, digest, False)
+
+    def _put(self, stream, length, metadata, path, content_type, digest, etag_comparable):
+        if digest is not None and self.S3_SKIP_UNCHANGED and self.isUnchanged(path, digest, etag_comparable=etag_comparable):
+            get_dagster_logger().info(f"file {path} unchanged, skipped upload")
+            self._count('skipped', max(length, 0))
+            return path
+        if digest is not None:
+            metadata = {**metadata, DIGEST_METADATA: digest}
         try:
-            result =  self.getClient().put_object(
-                self.S3_BUCKET, path,
-                data=io.BytesIO(data.encode('utf-8')),
-                length=len(data),
-                content_type="text/plain", metadata=metadata
-            )
+            with instrumentation.stage('s3_upload') as stage:
+                result =  self.getClient().put_object(
+                    self.S3_BUCKET, path,
+                    data=stream,
+                    length=length,
+                    content_type=content_type, metadata=metadata,
+                    part_size=self.S3_PART_SIZE
+                )
+                stage.bytes = length if length >= 0 else getattr(stream, 'bytes_read', 0)
             get_dagster_logger().info(
                 "created {0} object; etag: {1}, version-id: {2}".format(
                     result.object_name, result.etag, result.version_id,
@@ -88,8 +232,14 @@ class S3Resource(ResourceWithS3Configuration):
             )
             get_dagster_logger().info(
                 f"file {result.object_name}" )
+            if digest is not None:
+                self._digests[path] = digest
+            self._count('uploaded', length if length >= 0 else getattr(stream, 'bytes_read', 0))
             return result.object_name
         except Exception as ex:
             get_dagster_logger().info(f"file {path} failed to push  to {self.S3_BUCKET} at {self.S3_ADDRESS} {ex}")
             raise Exception(f"file {path} failed to push  to {self.S3_BUCKET} at {self.S3_ADDRESS} {ex}")
 
+    def putFile_text(self, data, metadata={}, path='test', digest=None):
+        # length is the encoded length, not the number of characters
+        return self.putFile(data.encode('utf-8'), metadata=metadata, path=path, content_type="text/plain", digest=digest)
@@ -0,0 +1,108 @@
+import json
+
+import pandas as pd
+from dagster import get_dagster_logger
+
+from . import thresholds
+
+'''
+Threshold alerts for sensor readings.
+The readings of every source are put in one frame of READING_COLUMNS, each rule labels the readings of its source
+and parameter with thresholds.classify_levels in one operation, and readings at one of the rule alert_levels are alerts.
+A watermark per source/site/parameter (time of the last alerted reading) is kept in the bucket, so a reading is
+alerted once, and the new alerts of a run are sent as one digest.
+
+A rule is a dict:
+    {'name': 'h2s', 'source': 'apcd', 'parameter': '07 H2S PPB', 'label': 'H2S ppb',
+     'levels': thresholds.H2S_LEVELS, 'alert_levels': ['orange', 'purple']}
+parameter None matches every parameter of the source.
+'''
+
+READING_COLUMNS = ['source', 'site', 'parameter', 'value', 'time']
+MAX_DIGEST_LINES = 40
+
+
+def readings(df, source, site, value, time, parameter=None) -> pd.DataFrame:
+    ''' the readings of a source frame as READING_COLUMNS. parameter is the column with the parameter names,
+    None when the frame has one parameter, named by the value column. time is a column of iso strings or epoch seconds '''
+    times = df[time]
+    if pd.api.types.is_numeric_dtype(times):
+        times = pd.to_datetime(times, unit='s', utc=True)
+    else:
+        times = pd.to_datetime(times, utc=True, format='ISO8601')
+    return pd.DataFrame({
+        'source': source,
+        'site': df[site].astype(str),
+        'parameter': df[parameter] if parameter is not None else value,
+        'value': pd.to_numeric(df[value], errors='coerce'),
+        'time': times,
+    }, index=df.index).reset_index(drop=True)
+
+
+def evaluate(readings_df, rules) -> pd.DataFrame:
+    ''' the readings at an alert level of their rule, with the rule name, label and level '''
+    alerts = []
+    for rule in rules:
+        matched = readings_df['source'] == rule['source']
+        if rule.get('parameter') is not None:
+            matched &= readings_df['parameter'] == rule['parameter']
+        rule_readings = readings_df[matched]
+        levels = thresholds.classify_levels(rule_readings['value'], rule['levels'])
+        alerting = levels.isin(rule['alert_levels'])
+        alerts.append(rule_readings[alerting].assign(rule=rule['name'], label=rule.get('label', rule['name']),
+                                                     level=levels[alerting]))
+    if len(alerts) == 0:
+        return pd.DataFrame(columns=READING_COLUMNS + ['rule', 'label', 'level'])
+    return pd.concat(alerts, ignore_index=True).sort_values(['time', 'source', 'site'], ignore_index=True)
+
+
+def watermark_keys(df) -> pd.Series:
+    return df['source'] + '|' + df['site'] + '|' + df['parameter'].astype(str)
+
+
+def read_watermarks(s3_resource, path) -> dict:
+    ''' {source|site|parameter: iso time of the last alerted reading}, empty if it has not been written yet '''
+    try:
+        return json.loads(s3_resource.getFile(path=path))
+    except Exception as e:
+        get_dagster_logger().info(f'alert watermarks not read {e}')
+        return {}
+
+
+def write_watermarks(s3_resource, path, watermarks):
+    s3_resource.putFile_text(data=json.dumps(watermarks, indent=2, sort_keys=True), path=path)
+
+
+def new_alerts(alerts, watermarks) -> pd.DataFrame:
+    ''' the alerts after the watermark of their source/site/parameter '''
+    if len(alerts) == 0:
+        return alerts
+    last = pd.to_datetime(watermark_keys(alerts).map(watermarks), utc=True, format='ISO8601')
+    return alerts[last.isna() | (alerts['time'] > last)].reset_index(drop=True)
+
+
+def advance_watermarks(watermarks, alerts) -> dict:
+    ''' watermarks moved up to the latest alerted reading of each source/site/parameter '''
+    advanced = dict(watermarks)
+    if len(alerts) == 0:
+        return advanced
+    latest = alerts.groupby(watermark_keys(alerts))['time'].max()
+    for key, time in latest.items():
+        previous = advanced.get(key)
+        if previous is None or pd.Timestamp(previous) < time:
+            advanced[key] = time.isoformat()
+    return advanced
+
+
+def digest(alerts, max_lines=MAX_DIGEST_LINES) -> str:
+    ''' one message for all the alerts, a line per site and parameter with its highest reading '''
+    keys = watermark_keys(alerts)
+    peaks = alerts.loc[alerts.groupby(keys)['value'].idxmax()]
+    peaks = peaks.assign(readings=watermark_keys(peaks).map(keys.value_counts())).sort_values('value', ascending=False)
+    lines = [f":wave: {len(alerts)} air quality readings above the alert levels, {len(peaks)} sites and parameters"]
+    for _, p in peaks.head(max_lines).iterrows():
+        lines.append(f"{p['site']} high {p['label']} {p['value']} ({p['level']}) at {p['time'].isoformat()}"
+                     + (f", {p['readings']} readings" if p['readings'] > 1 else ''))
+    if len(peaks) > max_lines:
+        lines.append(f"and {len(peaks) - max_lines} more")
+    return '\n'.join(lines)
@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dagster import get_dagster_logger
+
+'''
+Bounded concurrency fetching for sources that publish many small files (APCD daily CSVs, SODA pages, ArcGIS pages).
+Requests run on a thread pool, at most per_host requests are in flight against one host,
+transient failures are retried with exponential backoff, and responses come back in the order they were requested.
+'''
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = 60
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+
+def retry_session(retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_PER_HOST) -> requests.Session:
+    ''' requests session that retries connection errors and 429/5xx responses with exponential backoff '''
+    retry = Retry(total=retries,
+                  backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUS,
+                  allowed_methods=None,  # the ArcGIS and SODA queries are idempotent POST/GETs
+                  raise_on_status=False,
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_all(fetch_requests, max_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST,
+              retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT):
+    '''
+    Fetch a list of requests concurrently.
+    Each request is either a url string (GET) or a dict of keyword arguments for requests.Session.request,
+    eg {'method': 'POST', 'url': url, 'data': params}
+    Returns a list of responses in the same order as fetch_requests. A request that still fails after the
+    retries is logged and returned as None, so one bad file does not lose the rest of the batch.
+    '''
+    fetch_requests = [{'method': 'GET', 'url': r} if isinstance(r, str) else r for r in fetch_requests]
+    if len(fetch_requests) == 0:
+        return []
+    host_limits = {}
+    for r in fetch_requests:
+        host = urlparse(r['url']).netloc
+        if host not in host_limits:
+            host_limits[host] = threading.BoundedSemaphore(per_host)
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = retry_session(retries=retries, backoff=backoff, pool_size=per_host)
+            with sessions_lock:
+                sessions.append(local.session)
+        return local.session
+
+    def fetch(r):
+        kwargs = dict(r)
+        method = kwargs.pop('method', 'GET')
+        url = kwargs.pop('url')
+        kwargs.setdefault('timeout', timeout)
+        with host_limits[urlparse(url).netloc]:
+            try:
+                get_dagster_logger().info(f'get file {url}')
+                return session().request(method, url, **kwargs)
+            except requests.RequestException as ex:
+                get_dagster_logger().error(f'get file {url} failed after {retries} retries {ex}')
+                return None
+
+    workers = max(1, min(max_workers, len(fetch_requests)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http_fetch') as executor:
+            # map keeps the input order, so reassembly is just the list of results
+            return list(executor.map(fetch, fetch_requests))
+    finally:
+        for s in sessions:
+            s.close()
+
+
+def fetch_texts(urls, **kwargs):
+    ''' GET a list of urls concurrently, returns the body text for 200 responses and None for anything else, in url order '''
+    texts = []
+    for url, response in zip(urls, fetch_all(urls, **kwargs)):
+        if response is None:
+            texts.append(None)
+        elif response.status_code == 200:
+            get_dagster_logger().info(f'response {url} {response.status_code}')
+            texts.append(response.text)
+        else:
+            get_dagster_logger().error(f'get file {url} {response.status_code}')
+            texts.append(None)
+    return texts
@@ -0,0 +1,161 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+from dagster import get_dagster_logger
+
+'''
+Timings for the stages of an asset (fetch, parse, spatial join, serialize, upload).
+A stage records its duration, and the rows and bytes it handled when the caller sets them.
+Totals are kept per stage name for the asset being materialized, stage_metadata() returns them (and resets them)
+as flat materialization metadata, eg fetch_seconds, fetch_bytes, parse_rows, s3_upload_calls, peak_rss_mb,
+so each value is plotted over the materializations of the asset in the UI.
+begin() starts the totals of an asset, they live in a context variable so the assets run one after another
+by the in_process_executor each report only their own. Outside of begin() they are kept for the process.
+
+    instrumentation.begin()
+    with instrumentation.stage('parse') as s:
+        df = parse(data)
+        s.rows = len(df)
+    ...
+    context.add_output_metadata(instrumentation.stage_metadata())
+
+Stages can run on several threads (store_assets writes formats concurrently, http_fetch pages), functions given
+to an executor are wrapped with propagate() so they add to the totals of the asset. The totals add up their
+durations, so a stage total can be longer than the wall time of the run.
+'''
+
+
+class Stage:
+    ''' set rows and bytes on the stage while it runs '''
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.bytes = None
+
+
+class Totals:
+    ''' the stage totals and counters of one asset '''
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+
+_process_totals = Totals()
+_current = contextvars.ContextVar('instrumentation_totals', default=None)
+
+
+def current() -> Totals:
+    return _current.get() or _process_totals
+
+
+def begin():
+    ''' fresh totals for the asset being materialized, call it first in every asset that reports stage_metadata() '''
+    _current.set(Totals())
+
+
+def propagate(function):
+    ''' function run in a copy of the calling context, for executor.submit and executor.map '''
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # a context can only be entered by one thread at a time
+        return context.copy().run(function, *args, **kwargs)
+    return wrapper
+
+
+def peak_rss_mb():
+    ''' peak resident memory of the process in MB, None where it is not available '''
+    if resource is None:
+        return None
+    # kilobytes on linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def record(name, seconds, rows=None, nbytes=None):
+    current_totals = current()
+    with current_totals.lock:
+        totals = current_totals.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0})
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        if rows is not None:
+            totals['rows'] += int(rows)
+        if nbytes is not None:
+            totals['bytes'] += int(nbytes)
+
+
+@contextmanager
+def stage(name, rows=None, nbytes=None):
+    s = Stage(name)
+    s.rows = rows
+    s.bytes = nbytes
+    start = time.perf_counter()
+    try:
+        yield s
+    finally:
+        seconds = time.perf_counter() - start
+        record(name, seconds, s.rows, s.bytes)
+        get_dagster_logger().debug(f'stage {name} {seconds:.3f}s rows {s.rows} bytes {s.bytes}')
+
+
+def timed(name, rows=None, nbytes=None):
+    ''' decorator, a stage for every call. rows and nbytes are functions of the return value, eg rows=len '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name) as s:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+                if nbytes is not None:
+                    s.bytes = nbytes(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    ''' add n to a counter of the current totals, eg s3_uploaded '''
+    totals = current()
+    with totals.lock:
+        totals.counts[name] = totals.counts.get(name, 0) + n
+
+
+def counts(names, reset=True) -> dict:
+    ''' the counters since the last call, 0 for the ones not counted '''
+    totals = current()
+    with totals.lock:
+        result = {name: totals.counts.get(name, 0) for name in names}
+        if reset:
+            for name in names:
+                totals.counts.pop(name, None)
+    return result
+
+
+def stage_metadata(reset=True) -> dict:
+    ''' the stage totals since the last call, as materialization metadata '''
+    current_totals = current()
+    with current_totals.lock:
+        metadata = {}
+        for name, totals in sorted(current_totals.stages.items()):
+            metadata[f'{name}_seconds'] = round(totals['seconds'], 3)
+            metadata[f'{name}_calls'] = totals['calls']
+            if totals['rows']:
+                metadata[f'{name}_rows'] = totals['rows']
+            if totals['bytes']:
+                metadata[f'{name}_bytes'] = totals['bytes']
+        if reset:
+            current_totals.stages.clear()
+    rss = peak_rss_mb()
+    if rss is not None:
+        metadata['peak_rss_mb'] = rss
+    return metadata
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+'''
+Counts of intervals (eg beach closures from start to end) by the periods they span.
+Each interval adds one at its first period and takes one off after its last period in a difference array
+over the period numbers, the cumulative sum is the count for every period, so a closure spanning hundreds
+of weeks costs the same as one spanning a day.
+Periods are days (D), weeks starting on Monday (W) or months (M).
+'''
+
+FREQS = ('D', 'W', 'M')
+# 1970-01-01 was a Thursday, 1970-01-05 (day 4) starts week 1
+_WEEK_OFFSET = 3
+
+
+def _naive(dates) -> pd.DatetimeIndex:
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    return dates.tz_localize(None) if dates.tz is not None else dates
+
+
+def period_numbers(dates, freq='W') -> np.ndarray:
+    ''' the period of each date as an integer, days or weeks since 1970 or months since 1970-01. dates must not be NaT '''
+    days = _naive(dates).values.astype('datetime64[D]').astype('int64')
+    if freq == 'D':
+        return days
+    if freq == 'W':
+        return (days + _WEEK_OFFSET) // 7
+    if freq == 'M':
+        return _naive(dates).values.astype('datetime64[M]').astype('int64')
+    raise ValueError(f'freq {freq} is not one of {FREQS}')
+
+
+def period_starts(numbers, freq='W') -> pd.DatetimeIndex:
+    ''' the first day of each period number '''
+    numbers = np.asarray(numbers, dtype='int64')
+    if freq == 'D':
+        days = numbers.astype('datetime64[D]')
+    elif freq == 'W':
+        days = (numbers * 7 - _WEEK_OFFSET).astype('datetime64[D]')
+    elif freq == 'M':
+        days = numbers.astype('datetime64[M]').astype('datetime64[D]')
+    else:
+        raise ValueError(f'freq {freq} is not one of {FREQS}')
+    return pd.DatetimeIndex(days.astype('datetime64[ns]'))
+
+
+def span_counts(start, end, freq='W', column='period') -> pd.DataFrame:
+    '''
+    The number of intervals spanning each period, for the periods spanned by at least one interval, in period order.
+    Both ends are included, an interval with a missing end or an end before its start is not counted.
+    '''
+    start = pd.Series(_naive(start))
+    end = pd.Series(_naive(end))
+    valid = (start.notna() & end.notna()).to_numpy()
+    first = period_numbers(start[valid], freq)
+    last = period_numbers(end[valid], freq)
+    spanning = last >= first
+    first, last = first[spanning], last[spanning]
+    if len(first) == 0:
+        return pd.DataFrame({column: pd.DatetimeIndex([]), 'count': np.array([], dtype='int64')})
+    low = first.min()
+    size = last.max() - low + 2
+    diff = np.bincount(first - low, minlength=size) - np.bincount(last - low + 1, minlength=size)
+    counts = np.cumsum(diff)[:-1]
+    spanned = np.flatnonzero(counts)
+    return pd.DataFrame({column: period_starts(spanned + low, freq), 'count': counts[spanned]})
@@ -0,0 +1,115 @@
+import os
+from io import StringIO
+
+import pandas as pd
+import geopandas as gpd
+from dagster import get_dagster_logger
+
+from . import http_fetch, instrumentation
+
+'''
+Pager for Socrata (SODA) datasets, eg the CDC NNDSS weekly tables on data.cdc.gov.
+The rows are counted first, then all the pages are requested concurrently as CSV ordered by :id (so pages do not
+overlap or skip rows), parsed with read_csv and concatenated once. The geometry is built in one pass from the
+WKT of the location column, instead of parsing a GeoJSON page at a time with GDAL.
+Every column is read as a string, which is how the GeoJSON pages read them before.
+
+query() builds the parameters, so the filtering and the column projection are done by the server:
+
+    fetch(domain, dataset, query(select=['year', 'week', 'label'], where=is_in('label', ['Mpox']), year=2024))
+'''
+
+SODA_PAGE_SIZE = int(os.environ.get('SODA_PAGE_SIZE', 50000))
+SODA_WORKERS = int(os.environ.get('SODA_WORKERS', 4))
+
+
+class SodaError(Exception):
+    pass
+
+
+def resource_url(domain, dataset, format='csv'):
+    ''' eg resource_url('data.cdc.gov', 'x9gk-5huc') '''
+    return f"https://{domain}/resource/{dataset}.{format}"
+
+
+def literal(value):
+    ''' a SoQL string literal, quotes doubled '''
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def is_in(column, values):
+    ''' column IN ('a', 'b') '''
+    return f"{column} IN ({', '.join(literal(v) for v in values)})"
+
+
+def query(select=None, where=None, **equals):
+    '''
+    SODA parameters: select is a list of columns ($select), where a SoQL clause or a list of clauses joined with
+    AND ($where), and equals are simple filters eg year=2024, which SODA compares by the column type.
+    '''
+    params = {column: str(value) for column, value in equals.items()}
+    if select:
+        params['$select'] = ', '.join(select)
+    if isinstance(where, str):
+        where = [where]
+    if where:
+        params['$where'] = ' AND '.join(f'({clause})' for clause in where) if len(where) > 1 else where[0]
+    return params
+
+
+def _get(url, params):
+    response = http_fetch.fetch_all([{'method': 'GET', 'url': url, 'params': params}], max_workers=1)[0]
+    if response is None or response.status_code != 200:
+        raise SodaError(f"soda query {url} {params} failed {'' if response is None else response.status_code}"
+                        f" {'' if response is None else response.text[:200]}")
+    return response
+
+
+def count(domain, dataset, params=None) -> int:
+    ''' rows matching params (simple filters like {'year': 2024} or {'$where': ...}) '''
+    params = {**(params or {}), '$select': 'count(*) as count'}
+    rows = _get(resource_url(domain, dataset, 'json'), params).json()
+    return int(rows[0]['count']) if rows else 0
+
+
+def read_csv_page(text) -> pd.DataFrame:
+    # only empty fields are missing, a value like NA stays a string
+    return pd.read_csv(StringIO(text), dtype=str, keep_default_na=False, na_values=[''])
+
+
+def fetch(domain, dataset, params=None, geometry=None, page_size=None, max_workers=None) -> pd.DataFrame:
+    '''
+    All the rows of dataset matching params, a GeoDataFrame (EPSG:4326) when geometry names the location column,
+    rows without a location have an empty geometry.
+    '''
+    page_size = page_size or SODA_PAGE_SIZE
+    max_workers = max_workers or SODA_WORKERS
+    params = dict(params or {})
+    total = count(domain, dataset, params)
+    url = resource_url(domain, dataset, 'csv')
+    get_dagster_logger().info(f"soda {url} {params} {total} rows in pages of {page_size}")
+    page_requests = [{'method': 'GET', 'url': url,
+                      'params': {**params, '$order': ':id', '$offset': offset, '$limit': page_size}}
+                     for offset in range(0, total, page_size)]
+    with instrumentation.stage('fetch') as stage:
+        responses = http_fetch.fetch_all(page_requests, max_workers=max_workers, per_host=max_workers)
+        stage.bytes = sum(len(r.content) for r in responses if r is not None)
+    with instrumentation.stage('parse') as stage:
+        frames = []
+        for page, response in zip(page_requests, responses):
+            if response is None or response.status_code != 200:
+                raise SodaError(f"soda page {url} {page['params']} failed "
+                                f"{'' if response is None else response.status_code}")
+            frames.append(read_csv_page(response.text))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        stage.rows = len(df)
+    if len(df) != total:
+        raise SodaError(f"soda {url} {params} returned {len(df)} of {total} rows")
+    if geometry is None:
+        return df
+    if geometry in df.columns:
+        locations = df.pop(geometry)
+        geoms = gpd.GeoSeries.from_wkt(locations.where(locations.notna(), None), crs='EPSG:4326')
+    else:
+        geoms = gpd.GeoSeries([None] * len(df), crs='EPSG:4326')
+    return gpd.GeoDataFrame(df, geometry=geoms.values, crs='EPSG:4326')
@@ -2,14 +2,18 @@ import logging
 import json
 from typing import List
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import csv
 import os
+import hashlib
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pytz
 
-import awswrangler as wr
 from dagster import get_dagster_logger
 from foursquare.data_sdk.models import DatasetMetadata
 
@@ -19,73 +23,236 @@ from pydantic_schemaorg.URL import URL
 from pydantic_schemaorg.Organization import Organization
 from pydantic_schemaorg.PropertyValue import PropertyValue
 from ..resources.minio import S3Resource
+from . import instrumentation
 def getTodayAsIso():
     return datetime.now(pytz.timezone('America/Los_Angeles')).isoformat()
 def fix_col_types(df, date_format=None):
+    ''' returns a copy of df with the datetime columns as strings, Timestamp.isoformat() or date_format, NaT as None.
+    The caller's frame is not changed '''
     columns = [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])]
+    if len(columns) == 0:
+        return df
+    df = df.copy(deep=False)
     for col in columns:
-        df[col] = df[col].apply(lambda x: x.strftime(date_format) if pd.notnull(x) and date_format else x.isoformat() if pd.notnull(x) else None)
+        df[col] = format_datetimes(df[col], date_format)
     return df
-def addLastUpdatedGeojson(json_str, date_str) -> str:
-    json_obj = json.loads(json_str)
-    json_obj['lastUpdated'] = date_str
-    return json.dumps(json_obj, indent=2)
-def addLastUpdatedRecords(json_str, date_str) -> str:
-    json_obj = json.loads(json_str)
-    new_json = {'lastUpdated': date_str, 'data': json_obj}
-    return json.dumps(new_json, indent=2)
+
+def _utc_offsets(offset_minutes):
+    ''' +HH:MM strings for an array of utc offsets in minutes, there are only a few distinct offsets '''
+    def offset(minutes):
+        sign = '-' if minutes < 0 else '+'
+        hours, minutes = divmod(abs(int(minutes)), 60)
+        return f'{sign}{hours:02d}:{minutes:02d}'
+    distinct = {m: offset(m) for m in np.unique(offset_minutes)}
+    return np.array([distinct[m] for m in offset_minutes], dtype=object)
+
+def format_datetimes(series, date_format=None) -> pd.Series:
+    ''' vectorized x.strftime(date_format) or x.isoformat() for a datetime series, NaT as None '''
+    missing = series.isna().to_numpy()
+    if date_format:
+        text = series.dt.strftime(date_format).to_numpy(dtype=object)
+    elif (series.dt.nanosecond.fillna(0) != 0).any():
+        # numpy iso strings stop at microseconds, isoformat shows the nanoseconds
+        text = series.apply(lambda x: x.isoformat() if pd.notnull(x) else None).to_numpy(dtype=object)
+    else:
+        # isoformat is the local wall time, microseconds only when not zero and the utc offset for tz aware values
+        wall = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        values = wall.to_numpy(dtype='datetime64[us]')
+        text = np.datetime_as_string(values, unit='s').astype(object)
+        fraction = (wall.dt.microsecond != 0).to_numpy() & ~missing
+        if fraction.any():
+            text[fraction] = np.datetime_as_string(values[fraction], unit='us')
+        if series.dt.tz is not None and not missing.all():
+            utc = series.dt.tz_convert(None).to_numpy(dtype='datetime64[us]')
+            offset_minutes = (values[~missing] - utc[~missing]) // np.timedelta64(1, 'm')
+            text[~missing] = text[~missing] + _utc_offsets(offset_minutes)
+    text[missing] = None
+    return pd.Series(text, index=series.index, name=series.name, dtype=object)
+# formats of one asset are serialized and uploaded concurrently, uploads share the S3Resource connection pool
+STORE_WORKERS = int(os.environ.get('STORE_WORKERS', 4))
+
+def write_formats(writers, max_workers=STORE_WORKERS) -> List[DataDownload]:
+    ''' writers is a list of (format, function returning the object path).
+    Runs the writers on a thread pool and returns the distributions in the order of writers '''
+    if len(writers) <= 1:
+        return [distribution(format, write()) for format, write in writers]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(writers)), thread_name_prefix='store_assets') as executor:
+        futures = [(format, executor.submit(instrumentation.propagate(write))) for format, write in writers]
+        return [distribution(format, future.result()) for format, future in futures]
+
+def _fixed_frames(dataframe, formats, json_formats, date_format=None):
+    ''' the json formats need the datetime columns as strings. csv listed after a json format has always
+    been written from the converted columns, csv listed first from the datetimes.
+    Returns (frame for the json formats, frame for csv) '''
+    json_positions = [i for i, format in enumerate(formats) if format in json_formats]
+    if len(json_positions) == 0:
+        return dataframe, dataframe
+    fixed = fix_col_types(dataframe, date_format)
+    if 'csv' in formats and formats.index('csv') < json_positions[0]:
+        return fixed, dataframe
+    return fixed, fixed
+
+# serializers write rows in chunks into a spool that stays in memory up to SPOOL_MAX_BYTES and then moves to disk,
+# so a large layer is never held as a whole python string
+CHUNK_ROWS = int(os.environ.get('STORE_CHUNK_ROWS', 10000))
+SPOOL_MAX_BYTES = int(os.environ.get('STORE_SPOOL_MAX_BYTES', 32 * 1024 * 1024))
+PARQUET_COMPRESSION = os.environ.get('STORE_PARQUET_COMPRESSION', 'zstd')
+PARQUET_ROW_GROUP_SIZE = int(os.environ.get('STORE_PARQUET_ROW_GROUP_SIZE', 100000))
+
+class TextSpool:
+    ''' text sink for the serializers (pandas to_csv accepts it as a buffer), digests what is written '''
+    def __init__(self, max_size=SPOOL_MAX_BYTES, rows=None):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size)
+        self.length = 0
+        self.rows = rows
+        self._md5 = hashlib.md5()
+        self._started = time.perf_counter()
+
+    def write(self, text, digest=True):
+        data = text.encode('utf-8')
+        self.file.write(data)
+        self.length += len(data)
+        if digest:
+            self._md5.update(data)
+        return len(text)
+
+    def track_file(self):
+        ''' for writers that write bytes to .file directly (parquet), measure and digest what they wrote '''
+        self.file.seek(0)
+        for block in iter(lambda: self.file.read(1024 * 1024), b''):
+            self._md5.update(block)
+            self.length += len(block)
+
+    def upload(self, s3_resource, path, content_type="text/plain"):
+        # everything before the upload is serializing
+        instrumentation.record('serialize', time.perf_counter() - self._started, self.rows, self.length)
+        self.file.seek(0)
+        return s3_resource.putFile_stream(self.file, length=self.length, path=path, content_type=content_type,
+                                          digest=self._md5.hexdigest())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+def _chunks(df, chunk_rows=CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def _write_json_array(spool, chunks, level=1):
+    ''' writes the list made of chunks of items the way json.dumps(indent=2) writes a list nested level deep '''
+    pad = '  ' * level
+    first = True
+    for items in chunks:
+        if len(items) == 0:
+            continue
+        text = pad + json.dumps(items, indent=2)[2:-2].replace('\n', '\n' + pad)
+        spool.write(('[\n' if first else ',\n') + text)
+        first = False
+    spool.write('[]' if first else '\n' + pad + ']')
+
+def _geojson_writer(df, path, s3_resource, date):
+    def write():
+        # the empty frame gives the collection members other than the features, eg crs
+        collection = json.loads(df.iloc[:0].to_json())
+        with TextSpool(rows=len(df)) as spool:
+            spool.write('{\n  "type": "FeatureCollection",\n  "features": ')
+            _write_json_array(spool, (chunk.to_geo_dict()['features'] for chunk in _chunks(df)))
+            for key, value in collection.items():
+                if key not in ('type', 'features'):
+                    spool.write(f',\n  {json.dumps(key)}: ' + json.dumps(value, indent=2).replace('\n', '\n  '))
+            # lastUpdated changes every run, so the digest covers the features only. When the features are
+            # unchanged the upload is skipped and the stored lastUpdated stays the time they last changed
+            spool.write(f',\n  "lastUpdated": {json.dumps(date)}\n}}', digest=False)
+            return spool.upload(s3_resource, path)
+    return write
+
+def _records_writer(df, path, s3_resource, date):
+    def clean(chunk):
+        records = chunk.drop(columns='geometry').to_dict(orient='records')
+        return [
+            {k: v for k, v in record.items() if pd.notna(v)}
+            for record in records
+        ]
+    def write():
+        with TextSpool(rows=len(df)) as spool:
+            spool.write(f'{{\n  "lastUpdated": {json.dumps(date)},\n  "data": ', digest=False)
+            _write_json_array(spool, (clean(chunk) for chunk in _chunks(df)))
+            spool.write('\n}')
+            return spool.upload(s3_resource, path)
+    return write
+
+def _json_writer(df, path, s3_resource, date):
+    def write():
+        with TextSpool(rows=len(df)) as spool:
+            spool.write(f'{{\n  "lastUpdated": {json.dumps(date)},\n  "data": ', digest=False)
+            # parsing the pandas json gives the values json.dumps writes, eg / rather than \\/
+            _write_json_array(spool, (json.loads(chunk.to_json(orient='records')) for chunk in _chunks(df)))
+            spool.write('\n}')
+            return spool.upload(s3_resource, path)
+    return write
+
+def _csv_writer(df, path, s3_resource, **to_csv_args):
+    def write():
+        with TextSpool(rows=len(df)) as spool:
+            df.to_csv(spool, index=False, chunksize=CHUNK_ROWS, **to_csv_args)
+            return spool.upload(s3_resource, path)
+    return write
+
+def _parquet_safe(df):
+    ''' arrow needs one type per column, object columns mixing types (eg numbers and text) are written as text '''
+    mixed = [col for col in df.columns
+             if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed')]
+    if len(mixed) == 0:
+        return df
+    df = df.copy()
+    for col in mixed:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def _parquet_writer(df, path, s3_resource):
+    ''' GeoParquet for a GeoDataFrame with a geometry column, plain Parquet otherwise '''
+    def write():
+        df_safe = _parquet_safe(df)
+        with TextSpool(rows=len(df)) as spool:
+            df_safe.to_parquet(spool.file, index=False, compression=PARQUET_COMPRESSION, row_group_size=PARQUET_ROW_GROUP_SIZE)
+            spool.track_file()
+            return spool.upload(s3_resource, path, content_type="application/vnd.apache.parquet")
+    return write
+
+def _parquet_format(df):
+    if isinstance(df, gpd.GeoDataFrame) and df.active_geometry_name in df.columns:
+        return 'geoparquet'
+    return 'parquet'
+
+def write_geojson(geodataframe, path, s3_resource:S3Resource):
+    ''' a single geojson file at path, eg for raw copies of a layer '''
+    return _geojson_writer(fix_col_types(geodataframe), path, s3_resource, getTodayAsIso())()
+
 def geodataframe_to_s3(geodataframe, path_w_basename, s3_resource:S3Resource,
                        formats=[
                              'geojson',
                              'csv',
                            #'json' # write a non-geometry json
-                            # 'parquet',
+                            # 'parquet', # GeoParquet
                              # 'arrow',
                          ], metadata=None
 
                        ):
     date = getTodayAsIso()
-    distributions:List[distribution]=[]
+    df, csv_df = _fixed_frames(geodataframe, formats, ['geojson', 'json'])
+    writers = []
     for format in formats:
        if format == 'geojson':
-            df = fix_col_types(geodataframe)
-            gdf_json = df.to_json()
-            new_json = addLastUpdatedGeojson(gdf_json, date)
-            path = f"{path_w_basename}.geojson"
-            object = s3_resource.putFile_text(data=new_json, path=path)
-            distributions.append(distribution('geojson',object))
+            writers.append(('geojson', _geojson_writer(df, f"{path_w_basename}.geojson", s3_resource, date)))
        elif format == 'json':
-           df = fix_col_types(geodataframe)
-           new_df= df.drop(columns='geometry')
-           #gdf_json = df.to_json()
-           records= new_df.to_dict(orient='records')
-           cleaned_data = [
-               {k: v for k, v in record.items() if pd.notna(v)}
-               for record in records
-           ]
-           json_records = json.dumps(cleaned_data)
-           new_json =addLastUpdatedRecords(json_records, date)
-
-           path = f"{path_w_basename}.records.json"
-           object = s3_resource.putFile_text(data=new_json, path=path)
-           distributions.append(distribution('json', object))
+           writers.append(('json', _records_writer(df, f"{path_w_basename}.records.json", s3_resource, date)))
        elif format == 'csv':
-           complaints_csv = geodataframe.to_csv(index=False)
-           path = f"{path_w_basename}.csv"
-           object= s3_resource.putFile_text(data=complaints_csv, path=path)
-           distributions.append(distribution('csv', object))
+           writers.append(('csv', _csv_writer(csv_df, f"{path_w_basename}.csv", s3_resource)))
        elif format == 'parquet':
-           # https://github.com/aws/aws-sdk-pandas
-           # get the url to the minio, somewhere from the client.
-           pass
-           object= wr.s3.to_parquet(
-               df=geodataframe,
-               path="s3://bucket/dataset/",
-               dataset=True,
-               database="my_db",
-               table="my_table"
-           )
-           distributions.append(distribution('parquet', object.name))
+           writers.append((_parquet_format(geodataframe), _parquet_writer(geodataframe, f"{path_w_basename}.parquet", s3_resource)))
+    distributions = write_formats(writers)
     if metadata is not None:
         metadata.distribution = distributions
         metadata_to_s3(metadata, path_w_basename, s3_resource)
@@ -101,35 +268,18 @@ def dataframe_to_s3(dataframe, path_w_basename, s3_resource:S3Resource,
 
                           ):
     date = getTodayAsIso()
-    distributions: List[distribution] = []
+    if 'json' in formats and isinstance(dataframe, gpd.GeoDataFrame):
+        get_dagster_logger().info("geodataframe_to_s3, pass format['csv','json','geojson] to get a flat json ")
+    df, csv_df = _fixed_frames(dataframe, formats, ['json'])
+    writers = []
     for format in formats:
        if format == 'json':
-            if isinstance(dataframe, gpd.GeoDataFrame):
-                get_dagster_logger().info("geodataframe_to_s3, pass format['csv','json','geojson] to get a flat json ")
-            df = fix_col_types(dataframe)
-            gdf_json = df.to_json(orient='records')
-            new_json =addLastUpdatedRecords(gdf_json, date)
-
-            path = f"{path_w_basename}.json"
-            object= s3_resource.putFile_text(data=new_json, path=path)
-            distributions.append(distribution('json', object))
+            writers.append(('json', _json_writer(df, f"{path_w_basename}.json", s3_resource, date)))
        elif format == 'csv':
-           complaints_csv = dataframe.to_csv(index=False, date_format='%Y-%m-%dT%H:%M:%SZ')
-           path = f"{path_w_basename}.csv"
-           object= s3_resource.putFile_text(data=complaints_csv, path=path)
-           distributions.append(distribution('csv', object))
+           writers.append(('csv', _csv_writer(csv_df, f"{path_w_basename}.csv", s3_resource, date_format='%Y-%m-%dT%H:%M:%SZ')))
        elif format == 'parquet':
-           # https://github.com/aws/aws-sdk-pandas
-           # get the url to the minio, somewhere from the client.
-           pass
-           wr.s3.to_parquet(
-               df=dataframe,
-               path="s3://bucket/dataset/",
-               dataset=True,
-               database="my_db",
-               table="my_table"
-           )
-           distributions.append(distribution('parquet', object))
+           writers.append((_parquet_format(dataframe), _parquet_writer(dataframe, f"{path_w_basename}.parquet", s3_resource)))
+    distributions = write_formats(writers)
     if metadata is not None:
         metadata.distribution = distributions
         metadata_to_s3(metadata, path_w_basename, s3_resource)
@@ -144,34 +294,17 @@ def series_to_s3(pdseries, path_w_basename, s3_resource:S3Resource,
 
                           ):
     date = getTodayAsIso()
-    distributions: List[distribution] = []
+    if 'json' in formats and (isinstance(pdseries, gpd.GeoDataFrame) or isinstance(pdseries, pd.DataFrame)):
+        get_dagster_logger().info("series_to_s3, is for pandas series")
+    writers = []
     for format in formats:
        if format == 'json':
-            if isinstance(pdseries, gpd.GeoDataFrame) or isinstance(pdseries, pd.DataFrame):
-                get_dagster_logger().info("series_to_s3, is for pandas series")
-            series  = pdseries #fix_col_types(dataframe)
-            gdf_json = series.to_json(orient='records')
-            new_json =addLastUpdatedRecords(gdf_json, date)
-
-            path = f"{path_w_basename}.json"
-            object= s3_resource.putFile_text(data=new_json, path=path)
-            distributions.append(distribution('json', object))
+            writers.append(('json', _json_writer(pdseries, f"{path_w_basename}.json", s3_resource, date)))
        elif format == 'csv':
-           complaints_csv = pdseries.to_csv(index=False, date_format='%Y-%m-%dT%H:%M:%SZ')
-           path = f"{path_w_basename}.csv"
-           object= s3_resource.putFile_text(data=complaints_csv, path=path)
-           distributions.append(distribution('csv', object))
-       # elif format == 'parquet':
-       #     # https://github.com/aws/aws-sdk-pandas
-       #     # get the url to the minio, somewhere from the client.
-       #     pass
-       #     wr.s3.to_parquet(
-       #         df=pdseries,
-       #         path="s3://bucket/dataset/",
-       #         dataset=True,
-       #         database="my_db",
-       #         table="my_table"
-       #     )
+           writers.append(('csv', _csv_writer(pdseries, f"{path_w_basename}.csv", s3_resource, date_format='%Y-%m-%dT%H:%M:%SZ')))
+       elif format == 'parquet':
+           writers.append(('parquet', _parquet_writer(pdseries.to_frame(name=pdseries.name or 'value'), f"{path_w_basename}.parquet", s3_resource)))
+    distributions = write_formats(writers)
     if metadata is not None:
         metadata.distribution = distributions
         metadata_to_s3(metadata, path_w_basename, s3_resource)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+'''
+Guidance levels for pollutant readings.
+A threshold table is a list of {'min', 'max', 'level'} in increasing order, a reading is in a level when
+min <= reading < max, and the last level has max None (no upper bound).
+classify_levels labels a whole column at once, blank readings (None, NaN, '') are BLANK_LEVEL.
+'''
+
+BLANK_LEVEL = 'white'
+
+# ppb, San Diego APCD H2S guidance
+H2S_LEVELS = [{'min': 0, 'max': 5, 'level': "green"},
+              {'min': 5, 'max': 30, 'level': "yellow"},
+              {'min': 30, 'max': 27000, 'level': "orange"},
+              {'min': 27000, 'max': None, 'level': "purple"}]
+H2S_ALERT_LEVELS = ["orange", "purple"]  # >= 30 ppb
+
+# EPA AQI breakpoints (2024), levels named by the AQI colors, good to hazardous
+AQI_LEVELS = [{'min': 0, 'max': 51, 'level': "green"},
+              {'min': 51, 'max': 101, 'level': "yellow"},
+              {'min': 101, 'max': 151, 'level': "orange"},
+              {'min': 151, 'max': 201, 'level': "red"},
+              {'min': 201, 'max': 301, 'level': "purple"},
+              {'min': 301, 'max': None, 'level': "maroon"}]
+
+# ppb, 1 hour
+SO2_LEVELS = [{'min': 0, 'max': 36, 'level': "green"},
+              {'min': 36, 'max': 76, 'level': "yellow"},
+              {'min': 76, 'max': 186, 'level': "orange"},
+              {'min': 186, 'max': 305, 'level': "red"},
+              {'min': 305, 'max': 605, 'level': "purple"},
+              {'min': 605, 'max': None, 'level': "maroon"}]
+
+# ug/m3
+PM25_LEVELS = [{'min': 0, 'max': 9.1, 'level': "green"},
+               {'min': 9.1, 'max': 35.5, 'level': "yellow"},
+               {'min': 35.5, 'max': 55.5, 'level': "orange"},
+               {'min': 55.5, 'max': 125.5, 'level': "red"},
+               {'min': 125.5, 'max': 225.5, 'level': "purple"},
+               {'min': 225.5, 'max': None, 'level': "maroon"}]
+
+# ug/m3
+PM10_LEVELS = [{'min': 0, 'max': 55, 'level': "green"},
+               {'min': 55, 'max': 155, 'level': "yellow"},
+               {'min': 155, 'max': 255, 'level': "orange"},
+               {'min': 255, 'max': 355, 'level': "red"},
+               {'min': 355, 'max': 425, 'level': "purple"},
+               {'min': 425, 'max': None, 'level': "maroon"}]
+
+# unhealthy for sensitive groups and above
+UNHEALTHY_LEVELS = ["orange", "red", "purple", "maroon"]
+
+
+def classify_levels(values, levels, blank=BLANK_LEVEL) -> pd.Series:
+    ''' level of every reading in values (Series or list like), in the same order and index.
+    Readings below the first min, or that are not numbers, have no level (None) '''
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    is_blank = (series.isna() | series.eq('')).to_numpy()
+    readings = pd.to_numeric(series.where(~is_blank), errors='coerce').to_numpy(dtype=float)
+    conditions = [is_blank]
+    choices = [blank]
+    for level in levels:
+        in_level = readings >= level['min']
+        if level['max'] is not None:
+            in_level &= readings < level['max']
+        conditions.append(in_level)
+        choices.append(level['level'])
+    # select the position of the level, then take the labels, -1 (no level) is the None at the end
+    codes = np.select(conditions, list(range(len(choices))), default=-1)
+    labels = np.array(choices + [None], dtype=object)[codes]
+    return pd.Series(labels, index=series.index, dtype=object, name=series.name)
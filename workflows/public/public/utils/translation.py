@@ -0,0 +1,195 @@
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from dagster import get_dagster_logger
+
+'''
+Memo of LLM translations kept in the bucket, so a text is only sent to the model the first time it is seen.
+An entry is keyed by the sha256 of the model, target language, prompt version and source text, so a new model,
+language or prompt translates the texts again. Entries not used for TRANSLATION_MEMO_DAYS are dropped.
+
+    memo = read_memo(s3_resource, path)
+    df['Description_es'], stats = translate_column(df['Description'], translate_texts, memo, 'es', model, version)
+    write_memo(s3_resource, path, memo)
+
+translate_texts(texts) returns the translations of a list of texts, in order, it is only called for the misses.
+
+translate_all is a translate_texts that sends the requests concurrently, TRANSLATION_WORKERS at a time and at most
+TRANSLATION_RATE_LIMIT requests a second, retrying rate limited and failed requests with exponential backoff.
+With a translate_batch function and TRANSLATION_BATCH_SIZE over 1, several texts go in one request, a batch whose
+answer does not parse is translated a text at a time.
+The retries are done here, so the OpenAI client should not retry on its own (max_retries=0), and its token usage is
+counted with UsageCounter.add(response) after each request, which is safe to call from the translation threads.
+'''
+
+TRANSLATION_MEMO_DAYS = int(os.environ.get('TRANSLATION_MEMO_DAYS', 90))
+TRANSLATION_WORKERS = int(os.environ.get('TRANSLATION_WORKERS', 8))
+# texts per request, 1 sends each text on its own
+TRANSLATION_BATCH_SIZE = int(os.environ.get('TRANSLATION_BATCH_SIZE', 1))
+# requests a second, 0 for no limit
+TRANSLATION_RATE_LIMIT = float(os.environ.get('TRANSLATION_RATE_LIMIT', 0))
+TRANSLATION_RETRIES = int(os.environ.get('TRANSLATION_RETRIES', 4))
+TRANSLATION_BACKOFF = 1.0
+
+
+def prompt_version(*prompt_parts) -> str:
+    ''' identifies the prompt text, editing the instructions changes the version '''
+    return hashlib.sha256('\n'.join(prompt_parts).encode('utf-8')).hexdigest()[:12]
+
+
+def memo_key(text, language, model, version) -> str:
+    return hashlib.sha256(json.dumps([model, language, version, text]).encode('utf-8')).hexdigest()
+
+
+def read_memo(s3_resource, path) -> dict:
+    ''' {key: {'translation': text, 'used': iso date}}, empty if it has not been written yet '''
+    try:
+        return json.loads(s3_resource.getFile(path=path))
+    except Exception as e:
+        get_dagster_logger().info(f'translation memo not read {e}')
+        return {}
+
+
+def prune_memo(memo, days=TRANSLATION_MEMO_DAYS) -> int:
+    ''' drops the entries not used in days, returns the number dropped '''
+    oldest = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+    stale = [key for key, entry in memo.items() if entry.get('used', '') < oldest]
+    for key in stale:
+        del memo[key]
+    return len(stale)
+
+
+def write_memo(s3_resource, path, memo):
+    prune_memo(memo)
+    s3_resource.putFile_text(data=json.dumps(memo, sort_keys=True), path=path)
+
+
+def translate_column(values, translate_texts, memo, language, model, version):
+    '''
+    Translations of values from the memo, the texts not in it are translated with translate_texts (once per
+    distinct text) and added. Empty values translate to ''. Returns the translations, in order, and the counts:
+    hits are values served from the memo, misses the distinct texts translated.
+    '''
+    today = datetime.date.today().isoformat()
+    keys = [None if value is None or value == '' or value != value else memo_key(value, language, model, version)
+            for value in values]
+    missing = {}
+    hits = 0
+    for value, key in zip(values, keys):
+        if key is None:
+            continue
+        if key in memo:
+            memo[key]['used'] = today
+            hits += 1
+        elif key not in missing:
+            missing[key] = value
+    if missing:
+        translations = translate_texts(list(missing.values()))
+        for key, translation in zip(missing, translations):
+            memo[key] = {'translation': translation, 'used': today}
+    get_dagster_logger().info(f'translations {language} {model} hits {hits} misses {len(missing)}')
+    return ([memo[key]['translation'] if key is not None else '' for key in keys],
+            {'hits': hits, 'misses': len(missing)})
+
+
+class RateLimiter:
+    ''' spaces the calls of all threads at least 1/rate seconds apart, rate 0 does not wait '''
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.interval == 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class UsageCounter:
+    ''' calls and tokens of the chat completions of a client, by model, as the openai.<model>.<count> metadata
+    dagster-openai records, counted under a lock so the requests of all threads are counted '''
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, response):
+        usage = getattr(response, 'usage', None)
+        with self._lock:
+            self.counts[f'openai.{response.model}.calls'] += 1
+            for name in ('total_tokens', 'prompt_tokens', 'completion_tokens'):
+                if getattr(usage, name, None) is not None:
+                    self.counts[f'openai.{response.model}.{name}'] += getattr(usage, name)
+
+    def metadata(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+
+def retryable(ex) -> bool:
+    ''' connection errors, timeouts, rate limits and server errors are retried, anything else is raised '''
+    if isinstance(ex, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    return isinstance(ex, openai.APIStatusError) and ex.status_code >= 500
+
+
+def retry_after(ex):
+    ''' seconds from a Retry-After header of the error response, None if there is none '''
+    response = getattr(ex, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except Exception:
+        return None
+
+
+def call_with_retries(call, limiter, retries=TRANSLATION_RETRIES, backoff=TRANSLATION_BACKOFF):
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return call()
+        except Exception as ex:
+            if attempt == retries or not retryable(ex):
+                raise
+            delay = retry_after(ex) or backoff * 2 ** attempt * (0.5 + random.random())
+            get_dagster_logger().info(f'translation request failed, retry {attempt + 1} in {delay:.1f}s {ex}')
+            time.sleep(delay)
+
+
+def translate_all(texts, translate_one, translate_batch=None, batch_size=TRANSLATION_BATCH_SIZE,
+                  max_workers=TRANSLATION_WORKERS, rate_limit=TRANSLATION_RATE_LIMIT, retries=TRANSLATION_RETRIES):
+    '''
+    Translations of texts, in order. translate_one(text) translates a text, translate_batch(texts) a list of texts in
+    one request and raises ValueError when the answer is not one translation per text.
+    '''
+    if len(texts) == 0:
+        return []
+    limiter = RateLimiter(rate_limit)
+    if translate_batch is None or batch_size <= 1:
+        batches = [[text] for text in texts]
+    else:
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    def translate(batch):
+        if len(batch) == 1:
+            return [call_with_retries(lambda: translate_one(batch[0]), limiter, retries)]
+        try:
+            return call_with_retries(lambda: translate_batch(batch), limiter, retries)
+        except ValueError as ex:
+            get_dagster_logger().info(f'translation batch of {len(batch)} not parsed, one text at a time {ex}')
+            return [call_with_retries(lambda: translate_one(text), limiter, retries) for text in batch]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches))),
+                            thread_name_prefix='translation') as executor:
+        return [translation for batch in executor.map(translate, batches) for translation in batch]
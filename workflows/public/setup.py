@@ -2,7 +2,7 @@ from setuptools import find_packages, setup
 
 setup(
     name="sheild",
-    packages=find_packages(exclude=["sheild_tests"]),
+    packages=find_packages(exclude=["sheild_tests", "benchmarks"]),
     install_requires=[
         "dagster",
         "dagster-cloud",
@@ -0,0 +1,39 @@
+import importlib
+from io import StringIO
+
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import Point
+
+from public.utils import alerts
+
+air_quality_alerts = importlib.import_module('public.assets.air_quality_alerts')
+
+# an airnow /aq/data/ response with verbose=0, as get_aq_site requests it
+AIRNOW_VERBOSE_0 = '''[
+{"Latitude":32.631242,"Longitude":-117.059088,"UTC":"2025-04-18T19:00","Parameter":"OZONE","Unit":"PPB","AQI":46,"Category":1},
+{"Latitude":32.631242,"Longitude":-117.059088,"UTC":"2025-04-18T19:00","Parameter":"PM2.5","Unit":"UG/M3","AQI":158,"Category":4},
+{"Latitude":32.552164,"Longitude":-116.937772,"UTC":"2025-04-18T19:00","Parameter":"PM10","Unit":"UG/M3","AQI":112,"Category":3},
+{"Latitude":32.552164,"Longitude":-116.937772,"UTC":"2025-04-18T19:00","Parameter":"PM2.5","Unit":"UG/M3","AQI":-999,"Category":7}
+]'''
+
+
+def airnow_current():
+    ''' the airnow_current value, built the way get_aq_site builds it '''
+    df = pd.read_json(StringIO(AIRNOW_VERBOSE_0))
+    df['geometry'] = df.apply(lambda row: Point(row['Longitude'], row['Latitude']), axis=1)
+    return gpd.GeoDataFrame(df, geometry='geometry', crs="EPSG:4326")
+
+
+def test_airnow_readings_from_verbose_0_frame():
+    readings_df = air_quality_alerts.airnow_readings(airnow_current())
+    assert list(readings_df.columns) == alerts.READING_COLUMNS
+    assert readings_df['site'].tolist()[:2] == ['32.6312,-117.0591'] * 2
+    assert readings_df['time'].iloc[0] == pd.Timestamp('2025-04-18T19:00', tz='UTC')
+
+
+def test_airnow_aqi_rule_fires():
+    _, to_readings = air_quality_alerts.ALERT_SOURCES['airnow']
+    alerts_df = alerts.evaluate(to_readings(airnow_current()), air_quality_alerts.ALERT_RULES)
+    assert alerts_df['rule'].tolist() == ['airnow_aqi', 'airnow_aqi']
+    assert sorted(zip(alerts_df['parameter'], alerts_df['level'])) == [('PM10', 'orange'), ('PM2.5', 'red')]
@@ -0,0 +1,81 @@
+import importlib
+import threading
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.fake_s3 import fake_s3_resource
+
+beach_monitoring = importlib.import_module('public.assets.beach_monitoring')
+
+
+def samples(rows):
+    columns = ['Station_ID', 'SampleDate', 'SampleTime', 'Parameter', 'Method', 'Result', 'Qualifier']
+    return pd.DataFrame(rows, columns=columns)
+
+
+STORE = samples([
+    ['EH-010', '2024-07-01', '08:00:00', 'Enterococcus', 'ddPCR', 10, '='],
+    ['EH-010', '2024-07-01', '08:00:00', 'Enterococcus', 'ddPCR', 12, '='],
+    ['EH-020', '2024-07-01', '09:00:00', 'Enterococcus', 'MF', 5, '<'],
+    ['EH-030', '2024-07-01', '10:00:00', 'Coliform, Total', 'MTF', 100, '='],
+])
+
+
+def test_unchanged_samples_have_no_delta():
+    # the numbers read back as text or floats are the same values
+    fetched = STORE.astype({'Result': str})
+    fetched.loc[2, 'Result'] = '5.0'
+    delta_df, sync = beach_monitoring.analyses_delta(STORE, fetched)
+    assert len(delta_df) == 0
+    assert sync == {'sync_mode': 'incremental', 'fetched': 4, 'new_rows': 0, 'revised_rows': 0,
+                    'removed_rows': 0, 'delta_rows': 0}
+
+
+def test_new_revised_and_removed_samples():
+    fetched = pd.concat([STORE.drop(index=3), samples([
+        ['EH-010', '2024-07-01', '08:00:00', 'Enterococcus', 'ddPCR', 14, '='],  # a third replicate
+        ['EH-040', '2024-07-02', '08:00:00', 'Enterococcus', 'ddPCR', 7, '='],
+    ])], ignore_index=True)
+    fetched.loc[2, 'Result'] = 50
+    delta_df, sync = beach_monitoring.analyses_delta(STORE, fetched)
+    assert sync['new_rows'] == 2 and sync['revised_rows'] == 1 and sync['removed_rows'] == 1
+    assert delta_df[['Station_ID', 'Result']].values.tolist() == [['EH-020', 50], ['EH-010', 14], ['EH-040', 7]]
+
+
+def test_without_store_everything_is_the_delta():
+    delta_df, sync = beach_monitoring.analyses_delta(None, STORE)
+    assert len(delta_df) == len(STORE)
+    assert sync['sync_mode'] == 'full'
+
+
+def test_unchanged_fetch_after_parquet_round_trip():
+    # read_csv gives float station ids once a row has none, and the stored dates can come back as datetimes
+    fetched = samples([
+        [10, '2024-07-01', '08:00:00', 'Enterococcus', 'ddPCR', 10, '='],
+        [None, '2024-07-01', '09:00:00', 'Enterococcus', 'MF', 5, '<'],
+    ])
+    buffer = BytesIO()
+    fetched.to_parquet(buffer, index=False)
+    store_df = pd.read_parquet(BytesIO(buffer.getvalue()))
+    store_df['SampleDate'] = pd.to_datetime(store_df['SampleDate'])
+    unchanged = fetched.astype({'Station_ID': object})
+    unchanged.loc[0, 'Station_ID'] = '10'
+    delta_df, sync = beach_monitoring.analyses_delta(store_df, unchanged)
+    assert delta_df.empty
+    assert sync['new_rows'] == 0 and sync['revised_rows'] == 0 and sync['removed_rows'] == 0
+
+
+def test_fetch_years_fetches_each_year_once():
+    # the partition keys of a backfill can hold a year several times
+    calls = []
+    lock = threading.Lock()
+
+    def fetch_year(year, session):
+        with lock:
+            calls.append(year)
+
+    years = ['2023', '2024', '2023', '2024', '2025', '2023']
+    fetched, skipped = beach_monitoring.fetch_years(years, fetch_year, fake_s3_resource(), lambda year: [f'{year}.csv'])
+    assert sorted(calls) == ['2023', '2024', '2025']
+    assert fetched == ['2023', '2024', '2025'] and skipped == []
@@ -0,0 +1,29 @@
+from public.utils import instrumentation, store_assets
+from benchmarks.fake_s3 import fake_s3_resource
+
+
+def instrumented_asset(s3, name, rows, files):
+    ''' the shape of an instrumented asset, the uploads run on the store_assets thread pool '''
+    instrumentation.begin()
+    with instrumentation.stage('parse') as stage:
+        stage.rows = rows
+    writers = [('text/plain', lambda path=f'{name}/{i}.txt', i=i: s3.putFile_text(f'{name} {i}', path=path) or path)
+               for i in range(files)]
+    store_assets.write_formats(writers)
+    return {**s3.upload_stats(), **instrumentation.stage_metadata()}
+
+
+def test_back_to_back_assets_report_their_own_totals():
+    s3 = fake_s3_resource()
+    # a stage recorded before, by an asset that does not report its metadata
+    with instrumentation.stage('parse', rows=1000):
+        s3.putFile_text('not reported', path='unreported.txt')
+
+    first = instrumented_asset(s3, 'first', 10, 3)
+    second = instrumented_asset(s3, 'second', 20, 2)
+
+    assert first['parse_rows'] == 10 and first['parse_calls'] == 1
+    assert first['s3_uploaded'] == 3
+    assert second['parse_rows'] == 20 and second['parse_calls'] == 1
+    assert second['s3_uploaded'] == 2
+    assert second['s3_bytes_uploaded'] == sum(len(f'second {i}') for i in range(2))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from public.utils import periods
+
+
+def weeks_spanned(row):
+    ''' the per closure weeks the weekly closure counts used before span_counts '''
+    start_week = row['start'] - pd.to_timedelta(row['start'].weekday(), unit='D')
+    end_week = row['end'] - pd.to_timedelta(row['end'].weekday(), unit='D')
+    return pd.date_range(start=start_week, end=end_week, freq='7D')
+
+
+def closures(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2011-01-01') + pd.to_timedelta(rng.integers(0, 5000, rows), unit='D')
+    end = start + pd.to_timedelta(rng.choice([0, 1, 6, 20, 400, 2000], rows), unit='D')
+    return pd.DataFrame({'start': start, 'end': end})
+
+
+def test_weekly_counts_match_exploded_weeks():
+    df = closures()
+    df['week'] = df.apply(weeks_spanned, axis=1)
+    expected = df.explode('week')['week'].value_counts().reset_index().sort_values(by='week')
+    expected.columns = ['week', 'count']
+    result = periods.span_counts(df['start'], df['end'], 'W', column='week')
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize('freq, date_range_freq', [('D', 'D'), ('M', 'MS')])
+def test_daily_and_monthly_counts_match_date_range(freq, date_range_freq):
+    df = closures(200, seed=1)
+    first = df['start'].dt.to_period(freq if freq == 'D' else 'M').dt.start_time
+    spans = [pd.date_range(s, e, freq=date_range_freq) for s, e in zip(first, df['end'])]
+    expected = pd.Series(np.concatenate(spans)).value_counts().sort_index()
+    result = periods.span_counts(df['start'], df['end'], freq)
+    assert result['period'].tolist() == expected.index.tolist()
+    assert result['count'].tolist() == expected.tolist()
+
+
+def test_missing_and_reversed_intervals_are_not_counted():
+    start = pd.Series(pd.to_datetime(['2024-01-01', '2024-01-10', None, '2024-01-03']))
+    end = pd.Series(pd.to_datetime(['2024-01-02', '2024-01-01', '2024-01-05', None]))
+    result = periods.span_counts(start, end, 'W')
+    assert result['period'].tolist() == [pd.Timestamp('2024-01-01')]
+    assert result['count'].tolist() == [1]
+
+
+def test_no_intervals():
+    result = periods.span_counts(pd.Series([], dtype='datetime64[ns]'), pd.Series([], dtype='datetime64[ns]'))
+    assert list(result.columns) == ['period', 'count']
+    assert len(result) == 0
+
+
+def test_tz_aware_dates_count_by_wall_time():
+    start = pd.Series(pd.to_datetime(['2024-01-07 23:00']).tz_localize('America/Los_Angeles'))
+    result = periods.span_counts(start, start, 'W')
+    # Sunday evening in San Diego is in the week of Monday 2024-01-01
+    assert result['period'].tolist() == [pd.Timestamp('2024-01-01')]
@@ -0,0 +1,115 @@
+import importlib
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+import pytz
+
+from benchmarks import fixtures
+
+sd_apcd = importlib.import_module('public.assets.sd_apcd')
+
+
+def parse_apcd_file_loop(data):
+    ''' the line by line parser parse_apcd_file replaced '''
+    transformed_data = []
+    lines = data.splitlines()
+
+    date_str = lines[2]
+    if ',' in date_str:
+        date_str = date_str.strip().split('),')[1]
+    date = datetime.strptime(date_str.strip(), '%m/%d/%Y')
+    date =pytz.timezone("America/Los_Angeles").localize(date)
+    hours_header = lines[3]
+
+    hour_start_index = hours_header.index('0')
+    parameter_index = 0
+    site_index = 1
+    parameter = None
+
+    for row in lines[5:]:
+        row = row.strip().split(',')
+        if not row or row[0] == 'Parameter':  # Skip empty rows or new parameter headers
+            continue
+
+        site_name = row[site_index]
+
+        if row[parameter_index] and len(row[parameter_index]) > 0:
+            parameter = row[parameter_index]
+
+        if not parameter:
+            continue
+
+        for hour in range(24):
+            result = row[hour_start_index + hour].strip()
+            if result and len(result) > 0:
+                value = result
+                try:
+                    qualifier = ''
+                    if '<=' in value:
+                        value = value.replace('<=', '')
+                        qualifier = "<="
+                    if '<' in value:
+                        value = value.replace('<', '')
+                        qualifier = "<"
+                    if '>' in value:
+                        value = value.replace('>', '')
+                        qualifier = ">"
+                    date_time = date + timedelta(hours=hour) + date.dst()
+                    if len(value) > 0:
+                        value = float(value)
+
+                        transformed_data.append({
+                            'Parameter': parameter,
+                            'Site Name': site_name,
+                            'Date with time': date_time.isoformat(),
+                            'Result': float(value),
+                            'Qualifier': qualifier,
+                            'Original Value': result
+                        })
+                    else:
+                        transformed_data.append({
+                            'Parameter': parameter,
+                            'Site Name': site_name,
+                            'Date with time': date_time.isoformat(),
+                            'Result': None,
+                            'Qualifier': qualifier,
+                            'Original Value': result
+                        })
+                except ValueError:
+                    transformed_data.append({
+                        'Parameter': parameter,
+                        'Site Name': site_name,
+                        'Date with time': date_time.isoformat(),
+                        'Result': None,
+                        'Qualifier': '',
+                        'Original Value': result
+                    })
+    return transformed_data
+
+
+EDGE_FILE = '\n'.join([
+    'San Diego Air Pollution Control District', 'Hourly Data', 'Hourly Averages (PST),03/10/2024',
+    ',,' + ','.join(str(h) for h in range(24)), '',
+    'Parameter,Site,' + ','.join(str(h) for h in range(24)),
+    '07 H2S PPB,Site A,' + ','.join(['<=1.0', '<0.5', '>27000', 'C', 'M', '', ' 3.5 ', '<', '4'] + ['1'] * 15),
+    ',Site B,' + ','.join(['2'] * 24),
+    'Parameter,Site,' + ','.join(str(h) for h in range(24)),
+    '28 SO2 Tr PPB,Site A,' + ','.join([''] * 23 + ['0.2']),
+]) + '\n'
+
+
+@pytest.mark.parametrize('data', [
+    fixtures.apcd_csv(60),
+    fixtures.apcd_csv(60, seed=3, day=datetime(2024, 11, 3)),
+    EDGE_FILE,
+], ids=['summer', 'dst_end', 'edges'])
+def test_parse_apcd_file_matches_loop(data):
+    expected = pd.DataFrame(parse_apcd_file_loop(data), columns=sd_apcd.APCD_COLUMNS)
+    pd.testing.assert_frame_equal(sd_apcd.parse_apcd_file(data), expected, check_dtype=False)
+
+
+def test_parse_apcd_file_without_rows():
+    data = '\n'.join(EDGE_FILE.splitlines()[:6]) + '\n'
+    assert list(sd_apcd.parse_apcd_file(data).columns) == sd_apcd.APCD_COLUMNS
+    assert len(sd_apcd.parse_apcd_file(data)) == 0
@@ -0,0 +1,70 @@
+import importlib
+
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import Point
+
+sd_complaints = importlib.import_module('public.assets.sd_complaints')
+
+DAY_MS = 86400000
+
+
+def complaints(rows):
+    ''' rows of record_number, date_received (days after 2024-01-01), record_status, x, y '''
+    return gpd.GeoDataFrame({
+        'record_number': [r[0] for r in rows],
+        'date_received': [1704067200000 + r[1] * DAY_MS for r in rows],
+        'record_status': [r[2] for r in rows],
+        'EditDate': [1704067200000 + r[1] * DAY_MS for r in rows],
+    }, geometry=[Point(r[3], r[4]) for r in rows], crs='EPSG:4326')
+
+
+STORE = complaints([('a', 0, 'Open', 0, 0), ('b', 1, 'Open', 1, 1), ('c', 2, 'Open', 2, 2)])
+
+
+class Layer:
+    ''' the part of arcgis.FeatureLayer sync_complaints uses, returning new_gdf for the incremental query '''
+    def __init__(self, new_gdf, count):
+        self.new_gdf = new_gdf
+        self._count = count
+
+    def info(self):
+        return {'editFieldsInfo': {'editDateField': 'EditDate'}}
+
+    def features(self, where='1=1', out_fields='*'):
+        return self.new_gdf
+
+    def count(self):
+        return self._count
+
+
+def test_changed_complaints():
+    new_gdf = complaints([('b', 1, 'Closed', 1, 1), ('c', 2, 'Open', 2, 2.5), ('a', 0, 'Open', 0, 0), ('d', 3, 'Open', 3, 3)])
+    changed = sd_complaints.changed_complaints(STORE, new_gdf)
+    # b changed status, c moved, d is new, a is the same
+    assert sorted(changed) == ['b', 'c', 'd']
+
+
+def test_sync_adds_changed_dates():
+    new_gdf = complaints([('b', 1, 'Closed', 1, 1), ('d', 3, 'Open', 3, 3)])
+    merged, sync = sd_complaints.sync_complaints(Layer(new_gdf, 4), STORE)
+    assert merged['record_number'].tolist() == ['a', 'b', 'c', 'd']
+    assert merged.loc[1, 'record_status'] == 'Closed'
+    assert sync['sync_mode'] == 'incremental'
+    assert sync['changed_dates'] == ['2024-01-02', '2024-01-04']
+
+
+def test_sync_without_edits():
+    # an empty query result from the FeatureServer has a geometry column only
+    empty = gpd.GeoDataFrame(geometry=[], crs='EPSG:4326')
+    merged, sync = sd_complaints.sync_complaints(Layer(empty, 3), STORE)
+    pd.testing.assert_frame_equal(merged, STORE)
+    assert sync['fetched'] == 0 and sync['changed_dates'] == []
+
+
+def test_edit_date_is_not_published():
+    published = sd_complaints.published_complaints(STORE, 'EditDate')
+    assert 'EditDate' not in published.columns
+    assert 'EditDate' in STORE.columns
+    # a watermark on one of the published fields is kept
+    assert 'date_received' in sd_complaints.published_complaints(STORE, 'date_received').columns
@@ -0,0 +1,18 @@
+from public.utils import soda
+
+
+def test_is_in_quotes_values():
+    assert soda.is_in('label', ['Mpox', "Measles, Children's"]) == "label IN ('Mpox', 'Measles, Children''s')"
+
+
+def test_query():
+    assert soda.query() == {}
+    assert soda.query(select=['year', 'week'], where=soda.is_in('label', ['Mpox']), year=2024) == {
+        'year': '2024', '$select': 'year, week', '$where': "label IN ('Mpox')"}
+    assert soda.query(where=['year >= 2023', "label = 'Mpox'"])['$where'] == "(year >= 2023) AND (label = 'Mpox')"
+
+
+def test_read_csv_page_keeps_text():
+    df = soda.read_csv_page('states,m1,m1_flag\nNA,007,\n')
+    assert df.loc[0, 'states'] == 'NA' and df.loc[0, 'm1'] == '007'
+    assert df['m1_flag'].isna().all()
@@ -0,0 +1,94 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+
+from public.utils import store_assets, instrumentation
+from benchmarks.fake_s3 import fake_s3_resource
+from benchmarks.fix_col_types import fix_col_types_apply, sample_frame
+
+
+@pytest.mark.parametrize('df, date_format', [
+    (sample_frame(2000), None),
+    (sample_frame(2000, seed=1), '%Y-%m-%dT%H:%M:%SZ'),
+    (pd.DataFrame({'t': pd.to_datetime(['2024-03-10 01:59:59.000000001', None, '2024-11-03 01:30:00.000000000'], format='ISO8601')
+                        .tz_localize('America/Los_Angeles', ambiguous=[True, True, False])}), None),
+    (pd.DataFrame({'t': pd.Series([pd.NaT, pd.NaT], dtype='datetime64[ns, UTC]')}), None),
+], ids=['iso', 'date_format', 'nanoseconds', 'all_missing'])
+def test_fix_col_types_matches_apply(df, date_format):
+    before = df.copy()
+    pd.testing.assert_frame_equal(store_assets.fix_col_types(df, date_format), fix_col_types_apply(df, date_format))
+    # the caller's frame is not changed
+    pd.testing.assert_frame_equal(df, before)
+
+
+def geojson_indent_2(gdf, date):
+    ''' what geodataframe_to_s3 wrote before the writers were streamed '''
+    collection = json.loads(gdf.to_json())
+    collection['lastUpdated'] = date
+    return json.dumps(collection, indent=2)
+
+
+def records_indent_2(json_str, date):
+    return json.dumps({'lastUpdated': date, 'data': json.loads(json_str)}, indent=2)
+
+
+@pytest.fixture(params=[7, 10000], ids=['chunked', 'one_chunk'])
+def chunk_rows(request, monkeypatch):
+    monkeypatch.setattr(store_assets._chunks, '__defaults__', (request.param,))
+    return request.param
+
+
+@pytest.fixture(params=[25, 0], ids=['rows', 'empty'])
+def points_gdf(request):
+    n = request.param
+    gdf = gpd.GeoDataFrame({
+        'a': np.arange(n),
+        'b': [1.123456789123 if i % 3 else np.nan for i in range(n)],
+        'c': ['x/y é' if i % 2 else None for i in range(n)],
+        'd': pd.date_range('2024-01-01', periods=n, freq='h', tz='America/Los_Angeles'),
+    }, geometry=[Point(i, -i) for i in range(n)], crs='EPSG:4326')
+    return store_assets.fix_col_types(gdf)
+
+
+def test_geojson_layout(chunk_rows, points_gdf):
+    s3 = fake_s3_resource()
+    store_assets._geojson_writer(points_gdf, 'g.geojson', s3, 'today')()
+    assert s3.getFile('g.geojson').decode() == geojson_indent_2(points_gdf, 'today')
+
+
+def test_records_layout(chunk_rows, points_gdf):
+    s3 = fake_s3_resource()
+    store_assets._records_writer(points_gdf, 'r.json', s3, 'today')()
+    records = [{k: v for k, v in record.items() if pd.notna(v)}
+               for record in points_gdf.drop(columns='geometry').to_dict(orient='records')]
+    assert s3.getFile('r.json').decode() == records_indent_2(json.dumps(records), 'today')
+
+
+def test_json_layout(chunk_rows, points_gdf):
+    s3 = fake_s3_resource()
+    df = pd.DataFrame(points_gdf.drop(columns='geometry'))
+    store_assets._json_writer(df, 'j.json', s3, 'today')()
+    assert s3.getFile('j.json').decode() == records_indent_2(df.to_json(orient='records'), 'today')
+
+
+def test_unchanged_json_is_not_uploaded_again(points_gdf):
+    instrumentation.begin()
+    s3 = fake_s3_resource()
+    store_assets._geojson_writer(points_gdf, 'g.geojson', s3, 'yesterday')()
+    store_assets._geojson_writer(points_gdf, 'g.geojson', s3, 'today')()
+    # the skipped upload keeps the lastUpdated of the content
+    assert json.loads(s3.getFile('g.geojson'))['lastUpdated'] == 'yesterday'
+    assert s3.upload_stats()['s3_skipped'] == 1
+    # the counts are reset when they are reported
+    assert s3.upload_stats() == {'s3_uploaded': 0, 's3_skipped': 0, 's3_bytes_uploaded': 0, 's3_bytes_skipped': 0}
+
+
+def test_unnamed_series_to_parquet():
+    s3 = fake_s3_resource()
+    store_assets.series_to_s3(pd.Series([1, 2, 3]), 'series', s3, formats=['parquet'])
+    assert list(pd.read_parquet(io.BytesIO(s3.getFile('series.parquet'))).columns) == ['value']
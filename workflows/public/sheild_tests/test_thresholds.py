@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from public.utils.thresholds import classify_levels, H2S_LEVELS
+from benchmarks.h2s_levels import h2s_guidance_loop, sample_readings
+
+EDGES = [0, 4.99, 5, 29.9, 30, 26999, 27000, 1e6, -1, None, np.nan, '', '12', '0']
+
+
+@pytest.mark.parametrize('readings', [
+    pd.Series(EDGES, dtype=object, index=range(100, 100 + len(EDGES))),
+    sample_readings(5000),
+    pd.Series([], dtype=float),
+], ids=['edges', 'floats', 'empty'])
+def test_h2s_levels_match_loop(readings):
+    expected = readings.apply(lambda r: h2s_guidance_loop(r)).astype(object)
+    pd.testing.assert_series_equal(classify_levels(readings, H2S_LEVELS), expected, check_dtype=False)
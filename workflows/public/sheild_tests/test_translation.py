@@ -0,0 +1,115 @@
+import threading
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from public.utils import translation
+
+
+def spanish(texts):
+    return ['es: ' + text for text in texts]
+
+
+def test_translate_column_uses_the_memo():
+    memo = {}
+    calls = []
+    def translate_texts(texts):
+        calls.append(list(texts))
+        return spanish(texts)
+    values = ['Closed', '', None, 'Open', 'Closed']
+    translations, stats = translation.translate_column(values, translate_texts, memo, 'es', 'model', 'v1')
+    assert translations == ['es: Closed', '', '', 'es: Open', 'es: Closed']
+    # each distinct text is translated once
+    assert calls == [['Closed', 'Open']]
+    assert stats == {'hits': 0, 'misses': 2}
+    translations, stats = translation.translate_column(values, translate_texts, memo, 'es', 'model', 'v1')
+    assert translations[0] == 'es: Closed' and len(calls) == 1
+    assert stats == {'hits': 3, 'misses': 0}
+    # a new prompt version translates again
+    translation.translate_column(['Open'], translate_texts, memo, 'es', 'model', 'v2')
+    assert calls[-1] == ['Open']
+
+
+def test_prune_memo():
+    memo = {'old': {'translation': 'x', 'used': '2000-01-01'}, 'new': {'translation': 'y', 'used': '9999-01-01'}}
+    assert translation.prune_memo(memo, days=30) == 1
+    assert list(memo) == ['new']
+
+
+def test_translate_all_keeps_order():
+    texts = [f'text {i}' for i in range(50)]
+    assert translation.translate_all(texts, lambda text: spanish([text])[0], max_workers=8) == spanish(texts)
+    assert translation.translate_all([], lambda text: text) == []
+
+
+def test_translate_all_batches_and_falls_back():
+    texts = [f'text {i}' for i in range(10)]
+    batches = []
+    def translate_batch(batch):
+        batches.append(len(batch))
+        if 'text 4' in batch:
+            raise ValueError('2 translations for 3 texts')
+        return spanish(batch)
+    singles = []
+    def translate_one(text):
+        singles.append(text)
+        return spanish([text])[0]
+    result = translation.translate_all(texts, translate_one, translate_batch, batch_size=3, max_workers=2)
+    assert result == spanish(texts)
+    # the batch that did not parse is not retried, its texts are sent one at a time, like the last batch of one
+    assert batches == [3, 3, 3]
+    assert sorted(singles) == ['text 3', 'text 4', 'text 5', 'text 9']
+
+
+def openai_error(error, status=None, headers=None):
+    ''' an openai error without the http response, only what retryable and retry_after read '''
+    ex = error.__new__(error)
+    ex.status_code = status
+    ex.response = SimpleNamespace(headers=headers or {})
+    return ex
+
+
+@pytest.mark.parametrize('error', [
+    lambda: openai_error(openai.RateLimitError, 429, {'retry-after': '0.01'}),
+    lambda: openai_error(openai.InternalServerError, 503),
+    lambda: openai_error(openai.APITimeoutError),
+], ids=['rate_limited', 'server_error', 'timeout'])
+def test_transient_errors_are_retried(error, monkeypatch):
+    # no backoff, the delay of a retry is not tested here
+    monkeypatch.setattr(translation.time, 'sleep', lambda seconds: None)
+    lock = threading.Lock()
+    attempts = {}
+    def translate_one(text):
+        with lock:
+            attempts[text] = attempts.get(text, 0) + 1
+            if attempts[text] < 3:
+                raise error()
+        return spanish([text])[0]
+    assert translation.translate_all(['a', 'b'], translate_one, retries=2) == ['es: a', 'es: b']
+    assert attempts == {'a': 3, 'b': 3}
+
+
+@pytest.mark.parametrize('error', [
+    lambda: openai_error(openai.BadRequestError, 400),
+    lambda: openai_error(openai.AuthenticationError, 401),
+    lambda: KeyError('choices'),
+], ids=['bad_request', 'authentication', 'key_error'])
+def test_other_errors_are_not_retried(error):
+    attempts = []
+    raised = error()
+    def translate_one(text):
+        attempts.append(text)
+        raise raised
+    with pytest.raises(type(raised)):
+        translation.translate_all(['a'], translate_one, retries=3)
+    assert attempts == ['a']
+
+
+def test_usage_counter_counts_every_thread():
+    response = SimpleNamespace(model='llama3', usage=SimpleNamespace(total_tokens=3, prompt_tokens=2, completion_tokens=1))
+    usage = translation.UsageCounter()
+    texts = [f'text {i}' for i in range(400)]
+    translation.translate_all(texts, lambda text: usage.add(response) or text, max_workers=8)
+    assert usage.metadata() == {'openai.llama3.calls': 400, 'openai.llama3.total_tokens': 1200,
+                                'openai.llama3.prompt_tokens': 800, 'openai.llama3.completion_tokens': 400}